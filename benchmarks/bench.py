@@ -0,0 +1,293 @@
+"""
+Benchmarks for each stage of the deciphering pipeline
+
+Run from the root of the repository:
+
+    python -m benchmarks.bench run [--sizes k4,1000,10000,100000] [--output results.json]
+    python -m benchmarks.bench compare baseline.json results.json [--threshold 0.1]
+
+Each stage is timed in isolation with everything it depends on built beforehand,
+then run once more under tracemalloc to record the memory it still holds once
+it returns and its peak. Stages which work per character are timed over a sample of positions.
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import kryptos
+from kryptos import helpers, cipher as cipher_module
+from kryptos import Cipher, Character, Square, Table
+
+K4 = 'OBKRUOXOGHULBSOLIFBBWFLRVQQPRNGKSSOTWTQSJQSSEKZZWATJKLUDIAWINFBNYPVTTMZFPKWGDKZXTJCDIGKUHUAUEKCAR'
+
+SIZES = ['k4', '1000', '10000', '100000']
+
+class Stub(object):
+    """
+    Stands in for the notebook widgets and display so `Cipher._draw` can run headless
+
+    Anything displayed is rendered to HTML so the cost of rendering is still counted.
+    """
+    def __init__(self, *args, **kwargs):
+        self.children = []
+        self.value = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    @staticmethod
+    def display(obj):
+        render = getattr(obj, '_repr_html_', None) or getattr(obj, 'to_html', None)
+        if render:
+            render()
+
+    def on_dom_event(self, handler):
+        pass
+
+def synthetic(length, seed=0):
+    """ A reproducible random ciphertext of the given length """
+    letters = helpers.alphabet
+    generator = random.Random(seed)
+    return ''.join(generator.choice(letters) for _ in range(length))
+
+def texts(sizes):
+    for size in sizes:
+        yield (size, K4) if size == 'k4' else (size, synthetic(int(size)))
+
+def reset():
+    """ Drop every in-memory cache so each stage starts cold """
+    for cached in helpers.cache.values():
+        cached.clear()
+    Table.clear()
+
+def lacuna(text):
+    return helpers.lacuna(text)
+
+def sample(text, size):
+    """ Evenly spaced positions with their polarity flags """
+    flags = helpers.polarities(text)
+    step = max(1, len(text) // size)
+    return [(i, flags[i]) for i in range(0, len(text), step)][:size]
+
+def stages(text, size):
+    """
+    Every stage as (name, setup, run)
+
+    `setup` builds whatever the stage depends on and returns the argument passed
+    to `run`. Only `run` is timed.
+    """
+    def warm():
+        reset()
+        helpers.distance_matrix(text, lacuna(text))
+
+    def characters():
+        warm()
+        return [Character(text[i], i + 1, flag, text) for i, flag in sample(text, size)]
+
+    def squares():
+        warm()
+        return [
+            Square(text[i], key, flag, text)
+            for i, flag in sample(text, size) for key in (True, False)
+        ]
+
+    def rules():
+        built = characters()
+        for character in built:
+            character.invalidate()
+        return built
+
+    def cipher():
+        warm()
+        return Cipher(text)
+
+    def drawable():
+        built = cipher()
+        built.setup_jupyter()
+        return built
+
+    def created():
+        warm()
+        table = Table(text, True)
+        table.create()
+        return table
+
+    def draw(built):
+        for index in range(0, len(built), max(1, len(built) // size))[:size]:
+            built._cindex = index
+            built._currentr = index // 26
+            built._currentc = helpers.i2a((index % 26) + 1)
+            built._draw()
+
+    return [
+        ('distance_calculator', lambda: (reset(), text)[1],
+            lambda t: helpers.distance_calculator(t, lacuna(t))),
+        ('Table.create', lambda: (warm(), text)[1],
+            lambda t: [Table(t, key).create() for key in (True, False)]),
+        ('Table.create_keys', created,
+            lambda table: table.create_keys()),
+        ('Square.plot', squares,
+            lambda built: [square.plot() for square in built]),
+        ('RulesEngine.apply_rules', rules,
+            lambda built: [helpers.rulesengine.apply_rules(character) for character in built]),
+        ('Character', lambda: (warm(), sample(text, size))[1],
+            lambda positions: [Character(text[i], i + 1, flag, text) for i, flag in positions]),
+        ('Cipher.__init__', lambda: (warm(), text)[1],
+            lambda t: Cipher(t)),
+        ('Cipher.as_dataframe', cipher,
+            lambda built: built.as_dataframe().to_html()),
+        ('Cipher._draw', drawable, draw),
+    ]
+
+def measure(setup, run, repeat):
+    """
+    Time a stage then run it again under tracemalloc
+
+    :return: dict of timings in seconds and memory in bytes
+    """
+    timings = []
+    for _ in range(repeat):
+        argument = setup()
+        gc.collect()
+        start = time.perf_counter()
+        run(argument)
+        timings.append(time.perf_counter() - start)
+
+    argument = setup()
+    gc.collect()
+    tracemalloc.start()
+    run(argument)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'seconds':   min(timings),
+        'mean':      sum(timings) / len(timings),
+        'repeat':    repeat,
+        'retained':  retained,
+        'peak':      peak,
+    }
+
+def run(args):
+    sizes = args.sizes.split(',')
+    selected = args.stages.split(',') if args.stages else None
+
+    # Keep the benchmarks away from any on-disk store and the notebook widgets
+    helpers.store = None
+    for name in ('Output', 'HBox', 'VBox', 'Label', 'HTML', 'Event'):
+        setattr(cipher_module, name, Stub)
+    cipher_module.display = Stub
+
+    results = []
+    for name, text in texts(sizes):
+        repeat = args.repeat if len(text) <= 1000 else 1
+        for stage, setup, call in stages(text, args.sample):
+            if selected and stage not in selected:
+                continue
+            result = {'text': name, 'length': len(text), 'stage': stage}
+            try:
+                result.update(measure(setup, call, repeat))
+            except Exception as e:
+                result['error'] = '{}: {}'.format(type(e).__name__, e)
+            results.append(result)
+            print('{text:>8} {stage:<26} {0}'.format(
+                result.get('error') or '{seconds:10.4f}s  peak {peak:>12,} B'.format(**result),
+                **result
+            ), flush=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'kryptos':   kryptos.__version__,
+            'python':    sys.version.split()[0],
+            'numpy':     np.__version__,
+            'pandas':    pd.__version__,
+            'platform':  platform.platform(),
+            'sample':    args.sample,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('results written to {}'.format(args.output))
+    return 0
+
+def compare(args):
+    """
+    Flag every stage slower than the baseline by more than the threshold
+
+    Stages which cannot be compared, because they are missing from either file or
+    failed in either run, are listed after the rest. A stage which now fails is
+    counted as slower.
+    """
+    with open(args.baseline) as f:
+        baseline = {(r['text'], r['stage']): r for r in json.load(f)['results']}
+    with open(args.current) as f:
+        current = json.load(f)['results']
+
+    slower = 0
+    unmatched = []
+    for result in current:
+        before = baseline.pop((result['text'], result['stage']), None)
+        if 'seconds' not in result:
+            unmatched.append((result, 'failed: {}'.format(result.get('error'))))
+            slower += 1
+            continue
+        if before is None:
+            unmatched.append((result, 'not in the baseline'))
+            continue
+        if 'seconds' not in before:
+            unmatched.append((result, 'failed in the baseline: {}'.format(before.get('error'))))
+            continue
+        ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        flag = ''
+        if ratio > 1 + args.threshold:
+            flag = '  SLOWER'
+            slower += 1
+        print('{:>8} {:<26} {:10.4f}s -> {:10.4f}s  x{:.2f}{}'.format(
+            result['text'], result['stage'], before['seconds'], result['seconds'], ratio, flag
+        ))
+
+    unmatched.extend((before, 'not in the current results') for before in baseline.values())
+    for result, reason in unmatched:
+        print('{:>8} {:<26} {}'.format(result['text'], result['stage'], reason))
+    return 1 if slower else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench', description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    runner = commands.add_parser('run', help='run the benchmarks')
+    runner.add_argument('--sizes', default=','.join(SIZES),
+        help='comma separated texts to run, k4 or a synthetic length (default: %(default)s)')
+    runner.add_argument('--stages', help='comma separated stages to run (default: all)')
+    runner.add_argument('--sample', type=int, default=100,
+        help='positions timed by per character stages (default: %(default)s)')
+    runner.add_argument('--repeat', type=int, default=3,
+        help='timed runs of each stage for texts up to 1000 characters (default: %(default)s)')
+    runner.add_argument('--output', default='bench_output.json', help='results file (default: %(default)s)')
+    runner.set_defaults(func=run)
+
+    comparer = commands.add_parser('compare', help='compare results against a baseline')
+    comparer.add_argument('baseline')
+    comparer.add_argument('current')
+    comparer.add_argument('--threshold', type=float, default=0.1,
+        help='fraction slower than the baseline to flag (default: %(default)s)')
+    comparer.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    raise SystemExit(main())
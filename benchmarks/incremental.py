@@ -0,0 +1,120 @@
+"""
+Check that reloading edited rules deciphers the same as building afresh
+
+Run from the root of the repository:
+
+    python -m benchmarks.incremental
+
+Each edit is made to `rulesengine.py` in a copy of the package, so the tree is
+never touched. In a process of its own the copy deciphers K4, the edit is made
+and `Evaluation.reload` deciphers the characters it reaches. The plaintext and
+algorithms must then match a `Cipher` built from scratch with the edited rules.
+The run fails if any edit gives a different result.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+K4 = 'OBKRUOXOGHULBSOLIFBBWFLRVQQPRNGKSSOTWTQSJQSSEKZZWATJKLUDIAWINFBNYPVTTMZFPKWGDKZXTJCDIGKUHUAUEKCAR'
+
+# The comment the edits are made around, and the rule it introduces
+COMMENT = '        # this next rule is very specific to switch table'
+RULE    = '        character.table = not character.table'
+
+def above(lines):
+    """ Insert a rule above a comment """
+    at = lines.index(COMMENT)
+    return lines[:at] + [RULE] + lines[at:]
+
+def below(lines):
+    """ Insert a rule between a comment and the statement it describes """
+    at = lines.index(COMMENT) + 2
+    return lines[:at] + [RULE] + lines[at:]
+
+def blank(lines):
+    """ Insert a rule after a blank line """
+    at = lines.index(COMMENT) - 1
+    return lines[:at + 1] + [RULE] + lines[at + 1:]
+
+def replace(lines):
+    """ Replace a comment with a rule """
+    at = lines.index(COMMENT)
+    return lines[:at] + [RULE] + lines[at + 1:]
+
+EDITS = [above, below, blank, replace]
+
+def check(edit):
+    """
+    Make an edit to the rules of the package imported and compare a reload with
+    a fresh build
+
+    :return: dict of the positions evaluated, whether the result matches a fresh
+             build and the positions the edit changed
+    """
+    import kryptos
+    from kryptos import Cipher, Evaluation
+
+    cipher = Cipher(K4)
+    before = cipher.plaintext
+    evaluation = Evaluation(cipher)
+
+    path = os.path.join(os.path.dirname(kryptos.__file__), 'rulesengine.py')
+    with open(path) as f:
+        lines = f.read().splitlines()
+    with open(path, 'w') as f:
+        f.write('\n'.join(edit(lines)) + '\n')
+
+    result = evaluation.reload()
+    fresh = Cipher(K4)
+    return {
+        'evaluated': len(result['evaluated']),
+        'matches':   (cipher.plaintext, cipher.algorithms) == (fresh.plaintext, fresh.algorithms),
+        'changed':   sum(a != b for a, b in zip(before, fresh.plaintext)),
+    }
+
+def run(edit):
+    """ Run `check` for an edit in a copy of the package, in a process of its own """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as copy:
+        shutil.copytree(
+            os.path.join(root, 'kryptos'), os.path.join(copy, 'kryptos'),
+            ignore=shutil.ignore_patterns('__pycache__')
+        )
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([copy, root]), PYTHONDONTWRITEBYTECODE='1')
+        done = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.incremental', '--edit', edit.__name__],
+            env=env, cwd=copy, capture_output=True, text=True
+        )
+    if done.returncode:
+        return {'error': done.stderr.strip().splitlines()[-1] if done.stderr.strip() else done.returncode}
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.incremental', description=__doc__.split('\n')[1])
+    parser.add_argument('--edit', choices=[edit.__name__ for edit in EDITS],
+        help='make this edit to the package imported, rather than to a copy of this one')
+    args = parser.parse_args(argv)
+
+    if args.edit:
+        print(json.dumps(check(next(edit for edit in EDITS if edit.__name__ == args.edit))))
+        return 0
+
+    failed = 0
+    for edit in EDITS:
+        result = run(edit)
+        failed += 0 if result.get('matches') else 1
+        print('{:<8} {:<60} {}'.format(
+            edit.__name__, edit.__doc__.strip(),
+            'error: {}'.format(result['error']) if 'error' in result else
+            '{evaluated} evaluated, {changed} changed, {0}'.format(
+                'matches a fresh build' if result['matches'] else 'DIFFERS from a fresh build', **result
+            )
+        ), flush=True)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
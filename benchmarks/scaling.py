@@ -0,0 +1,230 @@
+"""
+Scaling benchmark for long ciphertexts
+
+Run from the root of the repository:
+
+    python -m benchmarks.scaling [--sizes 10000,100000,1000000] [--output scaling.json]
+
+Every stage whose cost depends on the length of the ciphertext is timed and its
+peak memory recorded over synthetic texts of each size, as `benchmarks.bench`
+does. The growth of each stage is then fitted as a power of the length, the
+slope of log time against log length, so a linear stage has an exponent near 1
+and a stage which does not depend on the length one near 0. The run fails if any
+stage grows faster than `--max-exponent`.
+
+The characters a lazy cipher builds to render one position, then each of the
+next `--moves` positions, are also counted. These should not depend on the
+length at all, so the run fails if more are built for a longer text.
+"""
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import kryptos
+from kryptos import helpers, decipher
+from kryptos import Cipher, Table
+from benchmarks.bench import synthetic, reset, measure
+
+SIZES = ['10000', '100000', '1000000']
+
+def stages(text, window):
+    """
+    Every stage as (name, setup, run), see `benchmarks.bench.stages`
+
+    `decipher_range` deciphers a window of characters in the middle of the text
+    against tables already built, so only its scans of the text for the lacuna and
+    the polarity state grow with it.
+    """
+    def warm():
+        reset()
+        helpers.distance_matrix(text, helpers.lacuna(text))
+        return text
+
+    def created():
+        warm()
+        table = Table(text, True)
+        table.create()
+        return table
+
+    def tables():
+        warm()
+        for key in (True, False):
+            Table.shared(text, key)
+        return text
+
+    def calculator():
+        warm()
+        helpers.cache['calculator'].clear()
+        return text
+
+    middle = len(text) // 2
+    return [
+        ('lacuna', lambda: text,
+            helpers.lacuna),
+        ('polarities', lambda: text,
+            helpers.polarities),
+        ('distance_matrix', lambda: (reset(), text)[1],
+            lambda t: helpers.distance_matrix(t, helpers.lacuna(t))),
+        ('distance_calculator', calculator,
+            lambda t: helpers.distance_calculator(t, helpers.lacuna(t))),
+        ('Table.create', warm,
+            lambda t: [Table(t, key).create() for key in (True, False)]),
+        ('Table.create_keys', created,
+            lambda table: table.create_keys()),
+        ('Cipher.__init__ (lazy)', warm,
+            lambda t: Cipher(t, lazy=True)),
+        ('decipher_range', tables,
+            lambda t: [character.final for character in decipher.decipher_range(t, middle, middle + window)]),
+    ]
+
+class Counted(Cipher):
+    """ A cipher which counts the characters it builds """
+    built = 0
+
+    def character(self, position):
+        self.built += 1
+        return super().character(position)
+
+def builds(text, moves):
+    """
+    The characters built by a lazy cipher to render the middle position, then to
+    render each of the next `moves` positions
+
+    The middle is taken from the start of its row, so the moves cross the same
+    number of rows whatever the length.
+
+    :return: dict of the `first` render and the `moves` after it
+    """
+    cipher = Counted(text, lazy=True)
+    middle = len(text) // 2
+    middle -= middle % 26
+    cipher.render(middle)
+    first = cipher.built
+    for position in range(middle + 1, min(len(text), middle + 1 + moves)):
+        cipher.render(position)
+    return {'first': first, 'moves': cipher.built - first}
+
+def exponent(lengths, values):
+    """ The slope of log value against log length, None with too few points to fit """
+    points = [(n, v) for n, v in zip(lengths, values) if v and v > 0]
+    if len(points) < 2:
+        return None
+    x, y = np.log([n for n, _ in points]), np.log([v for _, v in points])
+    return float(np.polyfit(x, y, 1)[0])
+
+def fit(results):
+    """ The exponent of time and peak memory of each stage """
+    fits = {}
+    for stage in dict.fromkeys(result['stage'] for result in results):
+        measured = [r for r in results if r['stage'] == stage and 'seconds' in r]
+        lengths = [r['length'] for r in measured]
+        fits[stage] = {
+            'time':   exponent(lengths, [r['seconds'] for r in measured]),
+            'memory': exponent(lengths, [r['peak'] for r in measured]),
+        }
+    return fits
+
+def curve(results, fits):
+    """ The time of each stage at each size with its fitted exponents, as a table """
+    frame = pd.DataFrame(results)
+    if 'seconds' not in frame:
+        return frame
+    table = frame.pivot(index='stage', columns='length', values='seconds').reindex(list(fits))
+    table.columns = ['{:,}'.format(length) for length in table.columns]
+    table['time exponent'] = [fits[stage]['time'] for stage in table.index]
+    table['memory exponent'] = [fits[stage]['memory'] for stage in table.index]
+    return table
+
+def run(args):
+    sizes = [int(size) for size in args.sizes.split(',')]
+    selected = args.stages.split(',') if args.stages else None
+
+    # Keep the benchmark away from any on-disk store
+    helpers.store = None
+
+    results = []
+    built = {}
+    for length in sizes:
+        text = synthetic(length)
+        if not selected or 'render' in selected:
+            reset()
+            built[length] = builds(text, args.moves)
+            print('{0:>9,} {1:<24} {first} built, {moves} more over {2} moves'.format(
+                length, 'render (lazy)', args.moves, **built[length]
+            ), flush=True)
+        for stage, setup, call in stages(text, args.window):
+            if selected and stage not in selected:
+                continue
+            result = {'length': length, 'stage': stage}
+            try:
+                result.update(measure(setup, call, args.repeat))
+            except Exception as e:
+                result['error'] = '{}: {}'.format(type(e).__name__, e)
+            results.append(result)
+            print('{length:>9,} {stage:<24} {0}'.format(
+                result.get('error') or '{seconds:10.4f}s  peak {peak:>14,} B'.format(**result),
+                **result
+            ), flush=True)
+    reset()
+
+    fits = fit(results)
+    if results:
+        with pd.option_context('display.width', None, 'display.float_format', '{:.4f}'.format):
+            print()
+            print(curve(results, fits).to_string())
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'kryptos':   kryptos.__version__,
+            'python':    sys.version.split()[0],
+            'numpy':     np.__version__,
+            'pandas':    pd.__version__,
+            'platform':  platform.platform(),
+            'window':    args.window,
+        },
+        'results': results,
+        'exponents': fits,
+        'builds': built,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('results written to {}'.format(args.output))
+
+    failed = [
+        stage for stage, fitted in fits.items()
+        if fitted['time'] is not None and fitted['time'] > args.max_exponent
+    ]
+    for stage in failed:
+        print('{} grows as length ** {:.2f}'.format(stage, fits[stage]['time']))
+
+    if built:
+        smallest = built[min(built)]
+        for length, counted in built.items():
+            if any(counted[name] > smallest[name] for name in counted):
+                failed.append('render (lazy)')
+                print('rendering builds {first} + {moves} characters at length {0:,}'.format(length, **counted))
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.scaling', description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default=','.join(SIZES),
+        help='comma separated lengths of synthetic text (default: %(default)s)')
+    parser.add_argument('--stages', help='comma separated stages to run, render for the characters built (default: all)')
+    parser.add_argument('--window', type=int, default=100,
+        help='characters deciphered by decipher_range (default: %(default)s)')
+    parser.add_argument('--moves', type=int, default=30,
+        help='positions rendered after the first when counting characters built (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=1, help='timed runs of each stage (default: %(default)s)')
+    parser.add_argument('--max-exponent', type=float, default=1.25,
+        help='fail if any stage grows faster than length to this power (default: %(default)s)')
+    parser.add_argument('--output', default='scaling_output.json', help='results file (default: %(default)s)')
+    return run(parser.parse_args(argv))
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,9 +1,47 @@
+import os
+
+__version__ = '0.1.0'
+
+from .store import DistanceStore
+from .renderer import Renderer, Html
+from . import profiling
+from .memory import Budget, MemoryBudgetExceeded
 from .highlighter import Highlighter
 from .table import Table
+from .reference import Reference
 from .square import Square as Square
 from .character import Character
+from .sequence import CharacterSequence
+from .snapshot import Snapshot
+from .trace import Trace
+from .fitness import Fitness
+from .decipher import decipher_range, stream_decipher
 from .cipher import Cipher
 from .rulesengine import RulesEngine
+from . import jit
+from .search import BeamSearch
+from .variants import ReplacementExplorer
+from .incremental import Evaluation
+from .service import Service, Client
+from . import analysis
+from .results import ResultStore
+from .sweep import Sweep
 from . import helpers
 
-helpers.rulesengine = RulesEngine
+# ------------------------------------------------------------
+# Characters are deciphered with the rules compiled to flat
+# functions, see `jit`. KRYPTOS_JIT may be set to `off` to run
+# the rules as they are written.
+# ------------------------------------------------------------
+helpers.rulesengine = jit.engine(RulesEngine)
+
+# ------------------------------------------------------------
+# Distance matrices may be shared between processes through an
+# on-disk store. Setting KRYPTOS_DISTANCE_STORE to `on` keeps it
+# under the cache directory and any other value except `off` is
+# the directory to keep it in.
+# ------------------------------------------------------------
+if (os.environ.get('KRYPTOS_DISTANCE_STORE') or 'off') != 'off':
+    helpers.store = DistanceStore(
+        None if os.environ['KRYPTOS_DISTANCE_STORE'] == 'on' else os.environ['KRYPTOS_DISTANCE_STORE']
+    )
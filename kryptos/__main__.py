@@ -0,0 +1,25 @@
+import sys
+from . import reference, results, service, store, sweep
+
+commands = {
+    'store':     store.main,
+    'reference': reference.main,
+    'results':   results.main,
+    'serve':     service.main,
+    'sweep':     sweep.main,
+}
+
+def main(argv=None):
+    """
+    Run a kryptos command line tool
+
+        python -m kryptos <command> [arguments]
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in commands:
+        print('usage: python -m kryptos {{{}}} ...'.format(','.join(commands.keys())))
+        return 2
+    return commands[argv[0]](argv[1:])
+
+if __name__ == '__main__':
+    raise SystemExit(main())
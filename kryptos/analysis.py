@@ -0,0 +1,285 @@
+import re
+import numpy as np
+import pandas as pd
+from . import helpers
+
+# ------------------------------------------------------------
+# Texts are packed as rows of letter codes 0-25 in a uint8 array,
+# shorter texts of a batch padded out with PAD.
+# ------------------------------------------------------------
+PAD = 26
+
+# Letter frequencies of English text, A to Z
+ENGLISH = np.array([
+    0.08167, 0.01492, 0.02782, 0.04253, 0.12702, 0.02228, 0.02015,
+    0.06094, 0.06966, 0.00153, 0.00772, 0.04025, 0.02406, 0.06749,
+    0.07507, 0.01929, 0.00095, 0.05987, 0.06327, 0.09056, 0.02758,
+    0.00978, 0.02360, 0.00150, 0.01974, 0.00074,
+])
+
+MODULI = (2, 5, 15)
+SOURCES = ('index', 'cipher', 'lacuna')
+
+# Texts expanded to one column per letter are taken this many at a time
+BLOCK = 4096
+
+# The index of the lacuna of each letter, as `Character` finds it
+LACUNA = np.array([helpers.a2i(helpers.distancefrom(c, 'Z')) for c in helpers.alphabet], dtype=np.int64)
+
+def pack(texts):
+    """
+    Pack texts as letter codes, anything but letters dropped
+
+    :param: str|list|array texts A text, a list of texts, or codes already packed
+
+    :return: two dimensional uint8 array with one row per text
+    """
+    if isinstance(texts, np.ndarray):
+        return (texts if texts.ndim == 2 else texts[None, :]).astype(np.uint8, copy=False)
+    texts = [re.sub('[^A-Z]', '', text.upper()) for text in ([texts] if isinstance(texts, str) else texts)]
+    lengths = {len(text) for text in texts}
+    if len(lengths) == 1:
+        return (np.frombuffer(''.join(texts).encode('ascii'), dtype=np.uint8) - 65).reshape(len(texts), -1)
+
+    codes = np.full((len(texts), max(lengths or [0])), PAD, dtype=np.uint8)
+    for i, text in enumerate(texts):
+        codes[i, :len(text)] = np.frombuffer(text.encode('ascii'), dtype=np.uint8) - 65
+    return codes
+
+def single(texts):
+    """ Whether texts is a single text, so results are returned for it alone """
+    return isinstance(texts, str) or (isinstance(texts, np.ndarray) and texts.ndim == 1)
+
+def result(values, texts):
+    return values[0] if single(texts) else values
+
+def tally(codes):
+    """ The count of each letter in each row of packed codes, shape (texts, 26) """
+    n = codes.shape[0]
+    flat = (np.arange(n, dtype=np.int64)[:, None] * 27 + codes).ravel()
+    return np.bincount(flat, minlength=n * 27).reshape(n, 27)[:, :26]
+
+def coincidence(counts):
+    """ The index of coincidence of letter counts along the last axis """
+    counts = counts.astype(np.float64)
+    total = counts.sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 1, (counts * (counts - 1)).sum(axis=-1) / (total * (total - 1)), np.nan)
+
+def chi(counts, expected=ENGLISH):
+    """ The chi-squared statistic of letter counts along the last axis """
+    counts = counts.astype(np.float64)
+    expect = counts.sum(axis=-1, keepdims=True) * expected
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(expect.sum(axis=-1) > 0, ((counts - expect) ** 2 / expect).sum(axis=-1), np.nan)
+
+def counts(texts):
+    """
+    :return: the count of each letter, shape (texts, 26)
+    """
+    return result(tally(pack(texts)), texts)
+
+def frequencies(texts):
+    """
+    :return: the frequency of each letter, shape (texts, 26)
+    """
+    c = tally(pack(texts)).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return result(c / c.sum(axis=1, keepdims=True), texts)
+
+def ioc(texts, normalised=False):
+    """
+    The index of coincidence
+
+    :param: bool normalised Multiply by 26, so random text scores about 1 and English about 1.73
+
+    :return: float for a single text, otherwise an array
+    """
+    values = coincidence(tally(pack(texts)))
+    return result(values * 26 if normalised else values, texts)
+
+def chi_squared(texts, expected=ENGLISH):
+    """
+    The chi-squared statistic of the letter counts against a distribution
+
+    :param: array expected Letter frequencies, A to Z. Defaults to English
+
+    :return: float for a single text, otherwise an array
+    """
+    return result(chi(tally(pack(texts)), np.asarray(expected) / np.sum(expected)), texts)
+
+def autocorrelation(texts, shifts=range(1, 27)):
+    """
+    The fraction of positions holding the same letter as the position a shift later
+
+    :return: array of shape (texts, shifts)
+    """
+    codes = pack(texts)
+    shifts = list(shifts)
+    values = np.full((codes.shape[0], len(shifts)), np.nan)
+    for i, shift in enumerate(shifts):
+        if shift >= codes.shape[1]:
+            continue
+        later = codes[:, shift:]
+        valid = later != PAD
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values[:, i] = ((codes[:, :-shift] == later) & valid).sum(axis=1) / valid.sum(axis=1)
+    return result(values, texts)
+
+def onehot(codes):
+    """ Packed codes as a (texts, positions, 26) array of 0 and 1, padding all 0 """
+    return (codes[:, :, None] == np.arange(26, dtype=np.uint8)).astype(np.uint8)
+
+def period_ioc(texts, periods=range(1, 27)):
+    """
+    The mean index of coincidence of the columns of each text written out in rows
+    of each period. Text enciphered with a periodic key scores highest at its period.
+
+    Texts are taken `BLOCK` at a time to bound the memory used.
+
+    :return: array of shape (texts, periods)
+    """
+    codes = pack(texts)
+    n, length = codes.shape
+    periods = list(periods)
+    values = np.full((n, len(periods)), np.nan)
+    for start in range(0, n, BLOCK):
+        letters = onehot(codes[start:start + BLOCK])
+        for i, period in enumerate(periods):
+            padding = -length % period
+            padded = np.concatenate([letters, np.zeros((len(letters), padding, 26), dtype=np.uint8)], axis=1)
+            columns = coincidence(padded.reshape(len(letters), -1, period, 26).sum(axis=1, dtype=np.int32))
+            scored = ~np.isnan(columns)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values[start:start + BLOCK, i] = np.where(scored, columns, 0).sum(axis=1) / scored.sum(axis=1)
+    return result(values, texts)
+
+def kasiski(texts, n=3, periods=range(2, 27)):
+    """
+    Count the spacings between repeated n-grams divisible by each period
+
+    Only the spacing from each occurrence of an n-gram to the next is counted.
+    The repeats of every text are found at once by sorting each row of n-grams.
+
+    :param: int      n       The length of the repeats looked for
+    :param: iterable periods
+
+    :return: array of shape (texts, periods)
+    """
+    codes = pack(texts).astype(np.int64)
+    periods = np.array(list(periods), dtype=np.int64)
+    if codes.shape[1] < n:
+        return result(np.zeros((codes.shape[0], len(periods)), dtype=np.int64), texts)
+
+    windows = np.lib.stride_tricks.sliding_window_view(codes, n, axis=1)
+    grams = windows @ (27 ** np.arange(n - 1, -1, -1))
+    # Grams running into padding are made unique so they never repeat
+    grams = np.where((windows != PAD).all(axis=-1), grams, -1 - np.arange(grams.shape[1]))
+
+    order = np.argsort(grams, axis=1, kind='stable')
+    ordered = np.take_along_axis(grams, order, axis=1)
+    rows, columns = np.nonzero(ordered[:, 1:] == ordered[:, :-1])
+    spacings = order[rows, columns + 1] - order[rows, columns]
+
+    found = np.zeros((codes.shape[0], len(periods)), dtype=np.int64)
+    np.add.at(found, rows, (spacings[:, None] % periods == 0).astype(np.int64))
+    return result(found, texts)
+
+def period(texts, periods=range(2, 27)):
+    """
+    The period whose columns have the highest mean index of coincidence
+
+    :return: int for a single text, otherwise an array
+    """
+    periods = np.array(list(periods))
+    values = np.atleast_2d(period_ioc(texts, periods))
+    best = periods[np.argmax(np.nan_to_num(values, nan=-1), axis=1)]
+    return result(best, texts)
+
+def conditions(ciphertext):
+    """
+    The mod 2, 5 and 15 conditions of every position, as `Character.condition_table`
+
+    :param: str ciphertext
+
+    :return: bool array of shape (positions, moduli, sources), moduli in the order
+             of `MODULI` and sources in the order of `SOURCES`
+    """
+    codes = pack(ciphertext)[0].astype(np.int64)
+    values = np.stack([np.arange(1, len(codes) + 1), codes + 1, LACUNA[codes]], axis=1)
+    return values[:, None, :] % np.array(MODULI)[None, :, None] == 0
+
+def breakdown(texts, ciphertext, statistic='ioc'):
+    """
+    A statistic of the letters at the positions where each condition does and
+    does not hold
+
+    Texts are deciphered from ciphertext, so position i of each text has the
+    conditions of position i of the ciphertext.
+
+    :param: str|list|array texts
+    :param: str            ciphertext
+    :param: str            statistic  One of ioc, chi_squared or counts
+
+    :return: array of shape (texts, moduli, sources, 2), the last axis for the
+             condition not holding and holding. With counts, a last axis of the
+             26 letter counts is added
+    """
+    held = conditions(ciphertext).reshape(-1, len(MODULI) * len(SOURCES))
+    codes = pack(texts)[:, :held.shape[0]]
+    held = held[:codes.shape[1]]
+    masks = np.stack([~held, held], axis=2).reshape(held.shape[0], -1).astype(np.float32)
+
+    letters = np.zeros((codes.shape[0], masks.shape[1], 26), dtype=np.int64)
+    for start in range(0, codes.shape[0], BLOCK):
+        letters[start:start + BLOCK] = np.einsum(
+            'nlk,lm->nmk', onehot(codes[start:start + BLOCK]).astype(np.float32), masks
+        ).round()
+    letters = letters.reshape(codes.shape[0], len(MODULI), len(SOURCES), 2, 26)
+
+    if statistic == 'counts':
+        return result(letters, texts)
+    if statistic == 'ioc':
+        return result(coincidence(letters), texts)
+    if statistic == 'chi_squared':
+        return result(chi(letters), texts)
+    raise ValueError('unknown statistic {}'.format(statistic))
+
+def breakdown_frame(text, ciphertext):
+    """
+    The breakdown of a single text by condition, labelled as `Character.condition_frame`
+
+    :return: DataFrame
+    """
+    letters = breakdown(pack(text)[0], ciphertext, 'counts')
+    rows = []
+    for m, modulus in enumerate(MODULI):
+        for s, source in enumerate(SOURCES):
+            for holds in (True, False):
+                counted = letters[m, s, int(holds)]
+                rows.append([
+                    '% {}'.format(modulus), source, holds, int(counted.sum()),
+                    float(coincidence(counted)), float(chi(counted)),
+                ])
+    return pd.DataFrame(rows, columns=['Modulus', 'Source', 'Holds', 'Letters', 'IoC', 'Chi squared'])
+
+def profile(texts, periods=range(2, 27)):
+    """
+    Profile every text in one pass
+
+    :param: list|array texts Such as the plaintexts of a sweep
+
+    :return: DataFrame with a row for each text of its length, IoC, chi-squared
+             against English, the period with the highest column IoC and the
+             period with the most repeat spacings, weighted by the period
+    """
+    codes = pack([texts] if isinstance(texts, str) else texts)
+    periods = np.array(list(periods))
+    repeats = kasiski(codes, periods=periods) * periods
+    return pd.DataFrame({
+        'Length':      (codes != PAD).sum(axis=1),
+        'IoC':         coincidence(tally(codes)),
+        'Chi squared': chi(tally(codes)),
+        'Period':      period(codes, periods),
+        'Kasiski':     np.where(repeats.max(axis=1) > 0, periods[np.argmax(repeats, axis=1)], 0),
+    })
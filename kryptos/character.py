@@ -59,6 +59,7 @@ class Character(object):
     _intermediate = None
     _char_index   = 0
     _lacuna_index = 0
+    _final        = None
     deciphered_lacuna = {}
 
     def __init__(self, character, index, polarity, ciphertext):
@@ -86,6 +87,57 @@ class Character(object):
         _ = [table.plot() for _, table in self.cipher.items()]
         _ = self.decipher
 
+    @property
+    def state(self):
+        """
+        The deciphered state of the character and its squares as plain values
+
+        The final result is calculated first so the state is complete.
+        """
+        algorithm, plaintext = self.final
+        return {
+            'character':         self.character,
+            'index':             self.index,
+            'polarity':          self.polarity,
+            'table':             self._table,
+            'position':          self._position,
+            'intermediate':      self._intermediate,
+            'algorithm':         algorithm,
+            'plaintext':         plaintext,
+            'deciphered_lacuna': dict(self.deciphered_lacuna),
+            'squares': {
+                key: square.state for key, square in self.cipher.items()
+            },
+        }
+
+    @classmethod
+    def restore(cls, state, ciphertext):
+        """
+        Recreate a deciphered character from its state without running the rules
+
+        :param: dict state      As returned by `Character.state`
+        :param: str  ciphertext The text the shared tables were created from
+        """
+        character = cls.__new__(cls)
+        character.index     = state['index']
+        character.character = state['character']
+        character.lacuna    = helpers.distancefrom(character.character, 'Z')
+        character.polarity  = state['polarity']
+        character._char_index   = helpers.a2i(character.character)
+        character._lacuna_index = helpers.a2i(character.lacuna)
+        character.binary        = character._char_index % 2 == 0
+        character.cipher = {
+            key: Square.restore(state['squares'][key], ciphertext)
+            for key in cls.cipher.keys()
+        }
+        character._table        = state['table']
+        character._position     = state['position']
+        character._intermediate = state['intermediate']
+        character._algorithm    = state['algorithm']
+        character._final        = (state['algorithm'], state['plaintext'])
+        character.deciphered_lacuna = dict(state['deciphered_lacuna'])
+        return character
+
     def __str__(self):
         return self.final[1]
 
@@ -118,17 +170,40 @@ class Character(object):
 
     @property
     def final(self):
-        self.algorithm = self.algorithm % 4
-        if self.deciphered_lacuna:
-            self.cipher[
-                self.deciphered_lacuna['table']
-            ].mark_lacuna(
-                self.deciphered_lacuna['position']
+        """
+        The final (algorithm, plaintext) pair for this character
+
+        This is calculated once and cached. If any of the rule state on the
+        character is changed, call `invalidate` to have it recalculated.
+        """
+        if self._final is None:
+            character = self.decipher
+            self.algorithm = self.algorithm % 4
+            if self.deciphered_lacuna:
+                self.cipher[
+                    self.deciphered_lacuna['table']
+                ].mark_lacuna(
+                    self.deciphered_lacuna['position']
+                )
+            self._final = (
+                self.algorithm,
+                self.transcribe(self.algorithm, character)
             )
-        return (
-            self.algorithm,
-            self.transcribe(self.algorithm, self.decipher)
-        )
+        return self._final
+
+    def invalidate(self):
+        """
+        Discard the decipher result so the rules are run again on next access
+        """
+        self._final        = None
+        self._intermediate = None
+        self._algorithm    = 0
+        self._table        = False
+        self._position     = None
+        self.deciphered_lacuna = {}
+        for square in self.cipher.values():
+            square.clear_active()
+            square.mark_lacuna(None)
 
     @property
     def totals(self):
@@ -147,7 +222,7 @@ class Character(object):
         return all([self.cipher[True].mapped, self.cipher[False].mapped])
 
     def can_replace(self, what):
-        return what in self.cipher[True].table.keys['replace'].keys()
+        return what in self.cipher[True].replace.keys()
 
     @property
     def properties_table(self):
@@ -172,21 +247,34 @@ class Character(object):
 
     @property
     def condition_table(self):
+        return Character.conditions(self.index, self._char_index, self._lacuna_index)
+
+    @staticmethod
+    def conditions(index, cindex, lindex):
+        """
+        The condition table of a character without building it
+
+        :param: int index  The position in the cipher, from 1
+        :param: int cindex The index of the character
+        :param: int lindex The index of its lacuna
+
+        :return: list of [index, cipher, lacuna] flags for each of % 2, % 5 and % 15
+        """
         return [
             [
-                (self.index         % 2 == 0),
-                (self._char_index   % 2 == 0),
-                (self._lacuna_index % 2 == 0),
+                (index  % 2 == 0),
+                (cindex % 2 == 0),
+                (lindex % 2 == 0),
             ],
             [
-                (self.index         % 5 == 0),
-                (self._char_index   % 5 == 0),
-                (self._lacuna_index % 5 == 0),
+                (index  % 5 == 0),
+                (cindex % 5 == 0),
+                (lindex % 5 == 0),
             ],
             [
-                (self.index         % 15 == 0),
-                (self._char_index   % 15 == 0),
-                (self._lacuna_index % 15 == 0),
+                (index  % 15 == 0),
+                (cindex % 15 == 0),
+                (lindex % 15 == 0),
             ],
         ]
 
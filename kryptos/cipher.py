@@ -1,8 +1,11 @@
+import os
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from IPython import display
 from ipywidgets import Label, HTML, VBox, HBox, Output
 from ipyevents import Event
-from . import helpers, Character, Highlighter
+from . import fitness, helpers, memory, profiling, Character, CharacterSequence, Highlighter, Html, Renderer, Snapshot, Trace
+from .decipher import decipher_states
 
 globalout = Output()
 class Cipher(object):
@@ -13,6 +16,7 @@ class Cipher(object):
     """
     cipher    = None
     alphabet  = None
+    polarities = None
     _vbox     = None
     _hbox     = None
     _label    = None
@@ -22,23 +26,40 @@ class Cipher(object):
     _cindex   = 0
     _currentr = 0
     _currentc = 0
-
-    def __init__(self, ciphertext, invert=False):
-        self.cipher = []
+    _final    = None
+    _service  = None
+    _remote   = None
+    _plaintext  = None
+    _algorithms = None
+    _properties = None
+
+    # Rows of the deciphered grid drawn around the current position in lazy mode
+    ROWS = 5
+
+    @profiling.stage('Cipher.__init__')
+    def __init__(self, ciphertext, invert=False, lazy=False, cache_size=128, parallel=False, executor=None,
+                 budget=None):
+        """
+        :param: str      ciphertext
+        :param: bool     invert     Swap the ciphertext for its lacuna text
+        :param: bool     lazy       Only build each character when it is first indexed
+        :param: int      cache_size In lazy mode, the most characters to hold at once
+        :param: bool     parallel   Build the characters across a pool of processes
+        :param: Executor executor   The executor to build characters with. Implies parallel
+        :param: Budget   budget     The most memory the cipher may hold. Defaults to `memory.budget`
+        """
         self.ciphertext = ciphertext.upper()
 
         # ------------------------------------------------------------
         # `lacunatext` is the full ciphertext, each character removed
         # from Z.
         # ------------------------------------------------------------
-        self.lacunatext = ''.join(
-            [helpers.distancefrom(c, 'Z') for c in self.ciphertext]
-        )
+        self.lacunatext = helpers.lacuna(self.ciphertext)
         if invert:
             self.ciphertext = self.lacunatext
             self.lacunatext = ciphertext
 
-        helpers.distance_calculator(self.ciphertext, self.lacunatext)
+        helpers.distance_matrix(self.ciphertext, self.lacunatext)
 
         # ------------------------------------------------------------
         # A polarity table is formed. This is used to help determine
@@ -50,23 +71,218 @@ class Cipher(object):
         }
 
         # ------------------------------------------------------------
-        # Create an object for each character setting the value of
-        # 'use_alt' to the current value of the boolean alphabet.
-        # We then  invert the alphabet flag for the next occurance of
-        # that character.
+        # Record the polarity of each character as the current value
+        # of the boolean alphabet. We then invert the alphabet flag
+        # for the next occurance of that character.
         # ------------------------------------------------------------
-        for i, c, l in zip(range(1, self.length + 1), self.ciphertext, self.lacunatext):
-            cipher_flag = self.alphabet[c] if c not in ['M', 'Z'] else True
-            lacuna_flag = self.alphabet[c] if l not in ['M', 'Z'] else True
-            self.cipher.append(
-                Character(c, i, cipher_flag, self.ciphertext)
-            )
+        self.polarities = []
+        for c in self.ciphertext:
+            self.polarities.append(self.alphabet[c] if c not in ['M', 'Z'] else True)
             self.alphabet[c] = not self.alphabet[c]
 
+        # ------------------------------------------------------------
+        # Where building every character would go over the memory
+        # budget, only as many as fit are held at once.
+        # ------------------------------------------------------------
+        budget = budget if budget is not None else memory.budget
+        if budget is not None and not lazy:
+            budget = budget if isinstance(budget, memory.Budget) else memory.Budget(budget)
+            fits = budget.characters(self)
+            if fits is not None:
+                lazy, cache_size = True, fits
+        self._forget()
+
+        # ------------------------------------------------------------
+        # With the polarities known, each character can be created
+        # independently of the others, either now or when indexed.
+        # ------------------------------------------------------------
+        if lazy:
+            self.cipher = CharacterSequence(self.character, self.length, cache_size)
+        elif parallel or executor:
+            self.cipher = self.build_parallel(executor)
+        else:
+            self.cipher = [self.character(i) for i in range(self.length)]
+
         # Used for displaying the current position on the ciphergrid
         self._currentc = 'A'
         self._currentr = 0
 
+    @classmethod
+    def cached(cls, ciphertext, invert=False, lazy=False, cache_size=128):
+        """
+        Load the cipher from its on-disk snapshot
+
+        If there is no snapshot for the ciphertext, or it was taken with a different
+        version of the library or rules, the cipher is built in full and a snapshot
+        written for next time.
+
+        :return: Cipher
+        """
+        path = Snapshot.path(ciphertext, invert)
+        snapshot = Snapshot.load(path)
+        if snapshot is not None:
+            return cls.restore(snapshot, lazy, cache_size)
+
+        cipher = cls(ciphertext, invert, lazy, cache_size)
+        Snapshot.from_cipher(cipher, invert).save(path)
+        return cipher
+
+    @classmethod
+    def restore(cls, snapshot, lazy=False, cache_size=128):
+        """
+        Recreate a cipher from a snapshot without running the rules
+
+        :param: Snapshot snapshot
+        :param: bool     lazy       Restore each character only when it is first indexed
+        :param: int      cache_size In lazy mode, the most characters to hold at once
+
+        :return: Cipher
+        """
+        cipher = cls.__new__(cls)
+        cipher.ciphertext = snapshot.header['ciphertext']
+        cipher.lacunatext = snapshot.header['lacunatext']
+        cipher.polarities = snapshot.polarities()
+        cipher.alphabet = {
+            character: cipher.ciphertext.count(character) % 2 == 1
+            for character in helpers.alphabet
+        }
+
+        cipher._forget()
+        snapshot.tables()
+        if lazy:
+            cipher.cipher = CharacterSequence(snapshot.character, len(snapshot), cache_size)
+        else:
+            cipher.cipher = [snapshot.character(i) for i in range(len(snapshot))]
+
+        cipher._final = (snapshot.header['plaintext'], bytes(snapshot.arrays['algorithm']))
+        cipher._currentc = 'A'
+        cipher._currentr = 0
+        return cipher
+
+    @classmethod
+    def remote(cls, ciphertext, invert=False, client=None, cache_size=128):
+        """
+        A cipher deciphered and rendered by a running service rather than in this kernel
+
+        The plaintext comes from the service and each position drawn is rendered
+        by it, streamed over a WebSocket. Indexing a character still builds it
+        here, on demand.
+
+        :param: str    ciphertext
+        :param: bool   invert
+        :param: Client client     Defaults to the service at KRYPTOS_SERVICE
+        :param: int    cache_size The most characters built here to hold at once
+
+        :return: Cipher
+        """
+        from .service import Client
+        client = client or Client()
+        result = client.decipher(ciphertext, invert)
+
+        cipher = cls.__new__(cls)
+        cipher.ciphertext = result['ciphertext']
+        cipher.lacunatext = result['lacunatext']
+        cipher.alphabet = {character: False for character in helpers.alphabet}
+        cipher.polarities = []
+        for c in cipher.ciphertext:
+            cipher.polarities.append(cipher.alphabet[c] if c not in ['M', 'Z'] else True)
+            cipher.alphabet[c] = not cipher.alphabet[c]
+        cipher.cipher = CharacterSequence(cipher.character, cipher.length, cache_size)
+        cipher._forget()
+
+        cipher._final = (result['plaintext'], bytes(result['algorithms']))
+        cipher._service = (ciphertext.upper(), invert)
+        cipher._remote = client.session()
+        cipher._currentc = 'A'
+        cipher._currentr = 0
+        return cipher
+
+    def character(self, position):
+        """
+        Create the Character object for a given position
+
+        :param: int position The position in the cipher, from 0
+
+        :return: Character
+        """
+        return Character(
+            self.ciphertext[position], position + 1, self.polarities[position], self.ciphertext
+        )
+
+    def build_parallel(self, executor=None):
+        """
+        Build every character in chunks across a pool of processes
+
+        :param: Executor executor If None, a process pool is created for the build
+
+        :return: list of Character
+
+        Each process deciphers a chunk of positions against its own copy of the
+        tables, read from the distance store where one is configured. The states
+        sent back are restored in order against the tables held here.
+        """
+        owned = executor is None
+        executor = executor or ProcessPoolExecutor()
+        try:
+            size = max(1, -(-self.length // ((os.cpu_count() or 1) * 4)))
+            futures = [
+                executor.submit(
+                    decipher_states, self.ciphertext, start, self.polarities[start:start + size]
+                ) for start in range(0, self.length, size)
+            ]
+            return [
+                Character.restore(state, self.ciphertext)
+                for future in futures for state in future.result()
+            ]
+        finally:
+            if owned:
+                executor.shutdown()
+
+    def footprint(self, caches=True):
+        """
+        Measure the memory held by the cipher
+
+        :param: bool caches Also count the distance matrix and calculator cached for the ciphertext
+
+        :return: memory.Footprint
+        """
+        return memory.footprint(self, caches)
+
+    def fitness(self, scorer=None):
+        """
+        Score the plaintext by the log probability of its n-grams
+
+        :param: Fitness scorer Defaults to the scorer loaded from KRYPTOS_NGRAMS
+
+        :return: float
+        """
+        return (scorer or fitness.default()).score(self.plaintext)
+
+    def search(self, top=10, scorer=None, corners=False, cribs=None, width=1000):
+        """
+        Search the algorithm of every character for the best scoring plaintexts
+
+        See `BeamSearch` for the parameters.
+
+        :return: list of dict, best first
+        """
+        from .search import BeamSearch
+        return BeamSearch(self, scorer, corners, cribs, width).run(top)
+
+    def trace(self, path=None, format=None):
+        """
+        Export the decipher state of every character as columns
+
+        :param: str path   Where to write the trace. If None it is only returned
+        :param: str format One of arrow, parquet, npz or csv, see `Trace.write`
+
+        :return: Trace
+        """
+        trace = Trace.from_cipher(self)
+        if path:
+            trace.write(path, format)
+        return trace
+
     def setup_jupyter(self):
         """
         Sets up elements on the page for use with a Jupyter notebook.
@@ -90,8 +306,98 @@ class Cipher(object):
         """ Get the intermediate character from the cipher """
         return self[pos].decipher
 
+    @property
+    def plaintext(self):
+        """
+        The deciphered text, built once and cached until `invalidate` is called
+
+        This deciphers every character. Use `deciphered` for only part of the text.
+        """
+        return self.final[0]
+
+    @property
+    def algorithms(self):
+        """ The algorithm chosen for each character as a bytes object of values 0-3 """
+        return self.final[1]
+
+    @property
+    def final(self):
+        """
+        The final plaintext and algorithms for the whole cipher
+
+        :return: tuple (str, bytes)
+        """
+        if self._final is None:
+            self._final = self.deciphered()
+        return self._final
+
+    def deciphered(self, start=0, stop=None):
+        """
+        The plaintext and algorithms of the characters from start to stop
+
+        :param: int start From 0
+        :param: int stop  The position after the last. Defaults to the end
+
+        :return: tuple (str, bytes)
+
+        The result of each position is kept once it is deciphered, so in lazy mode
+        a character dropped from the cache is not built again to be read.
+        """
+        stop = self.length if stop is None else min(stop, self.length)
+        if self._final is not None:
+            return self._final[0][start:stop], self._final[1][start:stop]
+
+        for i in range(start, stop):
+            if not self._plaintext[i]:
+                self._keep(i, self[i])
+        return self._plaintext[start:stop].decode('ascii'), bytes(self._algorithms[start:stop])
+
+    def properties(self, position):
+        """
+        The values of the properties table of the character at a position
+
+        Kept once read, as for `deciphered`, along with the plaintext of the position.
+
+        :param: int position From 0
+
+        :return: tuple
+        """
+        if position not in self._properties:
+            character = self[position]
+            self._keep(position, character)
+            self._properties[position] = tuple(character.properties_table.values())
+        return self._properties[position]
+
+    def _keep(self, position, character):
+        """ Keep the plaintext and algorithm of a deciphered character """
+        algorithm, plaintext = character.final
+        self._plaintext[position] = ord(plaintext)
+        self._algorithms[position] = algorithm
+
+    def _forget(self, index=None):
+        """ Drop what is kept of every deciphered position, or of the one at index """
+        if index is None:
+            self._plaintext  = bytearray(self.length)
+            self._algorithms = bytearray(self.length)
+            self._properties = {}
+        else:
+            self._plaintext[index] = 0
+            self._properties.pop(index, None)
+
+    def invalidate(self, index=None):
+        """
+        Discard the cached plaintext after rule state has been changed
+
+        :param: int index The position (from 0) of the character that changed.
+                          If None, every character is deciphered again.
+        """
+        for character in (self if index is None else [self[index]]):
+            character.invalidate()
+        self._forget(index)
+        self._final = None
+
     def __str__(self):
-        return ''.join([str(c) for c in self])
+        return self.plaintext
 
     def __iter__(self):
         return getattr(self, self._use).__iter__()
@@ -153,87 +459,114 @@ class Cipher(object):
         self._currentr = self._cindex // 26
         self._currentc = helpers.i2a((self._cindex % 26) + 1)
 
-    def _draw(self):
-        """ Jupyter notebook code to draw widgets """
-        left       = Output()
-        right      = Output()
-        properties = Output()
-        conditions = Output()
-        deciphered = Output()
-        tablekey   = Output()
+    def render(self, position=None):
+        """
+        Render every part of the notebook view of a position straight to HTML
+
+        :param: int position From 0. Defaults to the current position
+
+        :return: dict of the `header`, the `left` (even) and `right` (mixed)
+                 grids, the `properties`, `conditions`, `deciphered` and `key`
+                 tables and the `even` and `mixed` lists of subtables
+        """
+        if position is not None:
+            self.goto(position)
+        if self._remote is not None:
+            rendered = self._remote.render(self._service[0], self._cindex, self._service[1])
+            return {
+                name: [Html(html) for html in value] if isinstance(value, list) else Html(value)
+                for name, value in rendered.items() if name != 'position'
+            }
 
         tables = {
             True:  [],
             False: []
         }
-        for key in self[self._cindex].cipher.keys():
-            characters = self[self._cindex].cipher[key].get()
+        current = self[self._cindex]
+        for key in current.cipher.keys():
+            characters = current.cipher[key].get()
             for i, character in zip(range(len(characters)), characters):
-                partial = Output()
-                df = self[self._cindex].all_positions(helpers.i2a(character))
-                style = df.style.set_caption(
-                    '{} ({})'.format(character, helpers.i2a(character))
-                ).set_table_attributes(
-                    'style="font-size: 10px"'
-                ).hide_index()
-                if self[self._cindex].table == key and df.equals(self[self._cindex].all_positions()):
-                    style.set_properties(**{'background-color': '#FF0000', 'color': '#FFFFFF'})
-
-                with partial:
-                    display.display(style)
-                tables[key].append(partial)
-
-        with properties:
-            display.display(
-                self[self._cindex].properties_frame
-                    .style.set_caption('Properties')
-                    .set_table_attributes(
-                        'style="font-size: 10px"'
-                    ).set_properties(
-                        subset=['Value'],
-                        **{'width': '120px'}
-                    ).hide_index()
-            )
-
-        with conditions:
-            df = self[self._cindex].condition_frame.reset_index()
-            df.columns = ['', 'index', 'cipher', 'lacuna',]
-            display.display(
-                df.style.set_caption('Conditions')
-                    .set_table_attributes(
-                        'style="font-size: 10px"'
-                    ).hide_index()
-            )
-
-        with deciphered:
-            display.display(self.as_dataframe())
+                df = current.all_positions(helpers.i2a(character))
+                classes = {
+                    cell: Renderer.ACTIVE for cell in zip([0, 0, 1, 1], [0, 1, 0, 1])
+                } if current.table == key and df.equals(current.all_positions()) else None
+
+                tables[key].append(Renderer.frame(
+                    df,
+                    classes=classes,
+                    caption='{} ({})'.format(character, helpers.i2a(character)),
+                    index=False
+                ))
+
+        properties = current.properties_frame
+        conditions = current.condition_frame.reset_index()
+        conditions.columns = ['', 'index', 'cipher', 'lacuna',]
+
+        return {
+            'header': '<h3>Current character {} ({}), lacuna {} ({}) index {}, deciphered to {} algorithm {}</h3>'.format(
+                current.character,
+                current.cindex,
+                current.lacuna,
+                current.lindex,
+                self._cindex + 1,
+                str(current),
+                current.algorithm + 1
+            ),
+            'left':  current.cipher[True].apply,
+            'right': current.cipher[False].apply,
+            'properties': Renderer.frame(
+                properties,
+                classes={(i, 'Value'): Renderer.WIDE for i in properties.index},
+                caption='Properties',
+                index=False
+            ),
+            'conditions': Renderer.frame(conditions, caption='Conditions', index=False),
+            'deciphered': self.as_html(),
+            'key':        self.table_key,
+            'even':       tables[True],
+            'mixed':      tables[False],
+        }
 
-        with tablekey:
-            display.display(self.table_key)
+    def goto(self, position):
+        """ Move the current position on the grids, from 0 """
+        self._cindex = position
+        self._currentr = self._cindex // 26
+        self._currentc = helpers.i2a((self._cindex % 26) + 1)
 
-        with left:
-            display.display(self[self._cindex].cipher[True].apply)
-        with right:
-            display.display(self[self._cindex].cipher[False].apply)
+    @profiling.stage('Cipher._draw')
+    def _draw(self):
+        """ Jupyter notebook code to draw widgets """
+        rendered = self.render()
+
+        outputs = {}
+        for name in ('left', 'right', 'properties', 'conditions', 'deciphered', 'key'):
+            outputs[name] = Output()
+            with outputs[name]:
+                display.display(Html(rendered[name]))
+
+        tables = {}
+        for name in ('even', 'mixed'):
+            tables[name] = []
+            for html in rendered[name]:
+                partial = Output()
+                with partial:
+                    display.display(Html(html))
+                tables[name].append(partial)
 
         subtables = VBox()
-        subtables.children = [HBox(tables[True]), HBox(tables[False])]
+        subtables.children = [HBox(tables['even']), HBox(tables['mixed'])]
 
-        self._hbox.children = [left, right]
+        self._hbox.children = [outputs['left'], outputs['right']]
         self._inner.children = [
             self._hbox,
-            HBox([VBox([properties, conditions]), subtables, VBox([deciphered, tablekey])]),
+            HBox([
+                VBox([outputs['properties'], outputs['conditions']]),
+                subtables,
+                VBox([outputs['deciphered'], outputs['key']])
+            ]),
             globalout
         ]
-        self._html.value = '<h3>Current character {} ({}), lacuna {} ({}) index {}, deciphered to {} algorithm {}</h3>'.format(
-            self[self._cindex].character,
-            self[self._cindex].cindex,
-            self[self._cindex].lacuna,
-            self[self._cindex].lindex,
-            self._cindex + 1,
-            str(self[self._cindex]),
-            self[self._cindex].algorithm + 1
-        )
+        self._html.value = rendered['header']
 
     @property
     def table_key(self):
@@ -246,70 +579,143 @@ class Cipher(object):
             ['', 'Properties match',],
             ['', 'Contitions match',],
         ], columns=['Colour', 'Description'])
-        return key.style.applymap(
-                lambda _: 'background-color: #00FF00', pd.IndexSlice[0, 'Colour',]
-            ).applymap(
-                lambda _: 'background-color: #FF0000; color: #FFFFFF', pd.IndexSlice[1, 'Colour',]
-            ).applymap(
-                lambda _: 'background-color: #90EE90', pd.IndexSlice[2, 'Colour',]
-            ).applymap(
-                lambda _: 'background-color: #FBACA8', pd.IndexSlice[3, 'Colour',]
-            ).applymap(
-                lambda _: 'background-color: #EDC9AF', pd.IndexSlice[4, 'Colour',]
-            ).applymap(
-                lambda _: 'background-color: #D291BC', pd.IndexSlice[5, 'Colour',]
-            ).applymap(
-                lambda _: 'background-color: #85E3FF', pd.IndexSlice[6, 'Colour',]
-            ).set_table_attributes(
-                'style="font-size: 10px"'
-            ).hide_index().set_caption('Key')
+        return Renderer.frame(
+            key,
+            classes={
+                (i, 'Colour'): css for i, css in enumerate([
+                    Renderer.CIPHER,
+                    Renderer.ACTIVE,
+                    Renderer.CIPHER_LACUNA,
+                    Renderer.ACTIVE_LACUNA,
+                    Renderer.BOTH,
+                    Renderer.PROPERTIES,
+                    Renderer.CONDITIONS,
+                ])
+            },
+            caption='Key',
+            index=False
+        )
 
+    def window(self):
+        """
+        The positions drawn on the deciphered plaintext grid
+
+        Every position is drawn unless the cipher is lazy, when only `ROWS` rows
+        around the current position are.
+
+        :return: tuple (start, stop)
+        """
+        if not isinstance(self.cipher, CharacterSequence):
+            return 0, self.length
+        first = max(0, min(self._currentr - self.ROWS // 2, -(-self.length // 26) - self.ROWS))
+        return first * 26, min(self.length, (first + self.ROWS) * 26)
+
+    def conditions(self, position):
+        """ The condition table of the character at a position, from 0, without building it """
+        character = self.ciphertext[position]
+        return Character.conditions(
+            position + 1,
+            helpers.a2i(character),
+            helpers.a2i(helpers.distancefrom(character, 'Z'))
+        )
+
+    def highlights(self, start=0, stop=None):
+        """
+        Find the cells of the deciphered plaintext grid to highlight
+
+        :param: int start The first position to compare, from 0
+        :param: int stop  The position after the last. Defaults to the end
+
+        :return: dict mapping (row, column letter) to a Renderer CSS class
+
+        The current position is marked active. Every other character in the range
+        is compared against it and marked if its properties, its conditions or both
+        match. Conditions depend only on the position and the character so no
+        character is built to compare them.
+        """
+        cells = {(self._currentr, self._currentc): Renderer.ACTIVE}
+        properties = self.properties(self._cindex)
+        conditions = self.conditions(self._cindex)
+        stop = self.length if stop is None else min(stop, self.length)
+        for i in range(start, stop):
+            if i == self._cindex:
+                continue
+            row = i // 26
+            col = helpers.i2a((i % 26) + 1)
+            properties_match = self.properties(i) == properties
+            conditions_match = self.conditions(i) == conditions
+            if properties_match and conditions_match:
+                cells[(row, col)] = Renderer.BOTH
+            elif properties_match:
+                cells[(row, col)] = Renderer.PROPERTIES
+            elif conditions_match:
+                cells[(row, col)] = Renderer.CONDITIONS
+        return cells
+
+    def as_html(self, ciphertext=False):
+        """
+        Render the finished cipher as a grid of 26 columns straight to HTML
+
+        This is the fast equivalent of `as_dataframe` used when drawing the notebook.
+        Only the rows of `window` are drawn, so a lazy cipher builds just the
+        characters around the current position.
+        """
+        n = 26
+        start, stop = self.window()
+        highlights = self.highlights(start, stop)
+        ciphertext = list(self.deciphered(start, stop)[0]) if not ciphertext \
+            else [i for i in ciphertext[start:stop]]
+        rows = [ciphertext[i:i + n] for i in range(0, len(ciphertext), n)]
+        if rows:
+            rows[-1] = rows[-1] + [''] * (n - len(rows[-1]))
+
+        caption = 'Deciphered plaintext'
+        if (start, stop) != (0, self.length):
+            caption += ', rows {} to {} of {}'.format(start // n + 1, -(-stop // n), -(-self.length // n))
+        return Renderer.table(
+            rows,
+            columns=helpers.alphabet,
+            classes={
+                (row - start // n, col): css
+                for (row, col), css in highlights.items()
+            },
+            caption=caption
+        )
 
     def as_dataframe(self, ciphertext=False):
         """
         display the finished cipher in a dataframe
         """
         n = 26
-        ciphertext = [str(i) for i in self] if not ciphertext else [i for i in ciphertext]
+        ciphertext = list(self.plaintext) if not ciphertext else [i for i in ciphertext]
         df = pd.DataFrame(
-            [self[i:i + n] for i in range(0, len(ciphertext), n)]
+            [ciphertext[i:i + n] for i in range(0, len(ciphertext), n)]
         )
-        mask = df.applymap(lambda x: x is None)
-        cols = df.columns[(mask).any()]
-        for col in df[cols]:
-            df.loc[mask[col], col] = ''
+        df = df.fillna('')
         df.columns = helpers.alphabet
-        style =  df.style.hide_index().set_caption(
+
+        # ------------------------------------------------------------
+        # Styler renamed `hide_index` and `applymap` in pandas 1.4 and
+        # 2.1 and the old names are gone in later releases.
+        # ------------------------------------------------------------
+        style = df.style
+        style = style.hide(axis='index') if hasattr(style, 'hide') else style.hide_index()
+        style = style.set_caption(
             'Deciphered plaintext'
         ).set_table_attributes(
             'style="font-size: 10px"'
-        ).applymap(
-            Highlighter(None, None).highlightr,
-            subset=pd.IndexSlice[self._currentr, self._currentc]
         )
-
-        for i in range(len(self)):
-            if i == self._cindex:
-                continue
-            row = i // 26
-            col = helpers.i2a((i % 26) + 1)
-            properties_match = self[i].properties_table == self[self._cindex].properties_table
-            conditions_match = self[i].condition_table == self[self._cindex].condition_table
-            if properties_match and conditions_match:
-                style = style.applymap(
-                    Highlighter(None, None).highlights,
-                    subset=pd.IndexSlice[row, col]
-                )
-            elif properties_match:
-                style = style.applymap(
-                    Highlighter(None, None).highlightl,
-                    subset=pd.IndexSlice[row, col]
-                )
-            elif conditions_match:
-                style = style.applymap(
-                    Highlighter(None, None).highlightb,
-                    subset=pd.IndexSlice[row, col]
-                )
+        apply = style.map if hasattr(style, 'map') else style.applymap
+
+        highlighter = Highlighter(None, None)
+        functions = {
+            Renderer.ACTIVE:     highlighter.highlightr,
+            Renderer.BOTH:       highlighter.highlights,
+            Renderer.PROPERTIES: highlighter.highlightl,
+            Renderer.CONDITIONS: highlighter.highlightb,
+        }
+        for (row, col), css in self.highlights().items():
+            apply(functions[css], subset=pd.IndexSlice[row, col])
         return style
 
     def display(self, index=1):
@@ -0,0 +1,84 @@
+from . import helpers, Character
+
+def decipher_range(ciphertext, start, stop, invert=False):
+    """
+    Decipher a segment of the ciphertext without building the full cipher
+
+    :param: str  ciphertext The full ciphertext
+    :param: int  start      The first position to decipher, from 0
+    :param: int  stop       The position to stop at, not included
+    :param: bool invert     Decipher the lacuna text rather than the ciphertext
+
+    :return: list of Character
+
+    Each character depends only on its own index, the polarity of its letter at
+    that point and the distance tables, which are shared by the whole text and
+    cached. Only the polarity state at `start` and the characters in the segment
+    are calculated, so the cost is in proportion to the length of the segment.
+    Positions follow python slicing, so `decipher_range(text, 64, 74)` returns the
+    characters with index 65 to 74.
+    """
+    ciphertext = ciphertext.upper()
+    lacunatext = helpers.lacuna(ciphertext)
+    if invert:
+        ciphertext, lacunatext = lacunatext, ciphertext
+
+    start, stop, _ = slice(start, stop).indices(len(ciphertext))
+    helpers.distance_matrix(ciphertext, lacunatext)
+    return [
+        Character(ciphertext[i], i + 1, polarity, ciphertext)
+        for i, polarity in zip(
+            range(start, stop), helpers.polarities(ciphertext, start, stop)
+        )
+    ]
+
+def stream_decipher(chunks, key):
+    """
+    Decipher ciphertext as it arrives, yielding each character as it is found
+
+    :param: iterable chunks An iterable of characters or strings of characters
+    :param: str      key    The key material the tables are built from
+
+    :yield: tuple (index, plaintext, algorithm)
+
+    Tables are built once from the key and shared by every character, so nothing
+    depends on the length of the input. Only the polarity flag for each letter is
+    carried forward between characters and each Character is discarded once
+    yielded, keeping memory bounded however long the input is.
+
+    Characters outside of the alphabet, such as whitespace between chunks, are
+    skipped. The index is counted from 1 over the characters deciphered.
+    """
+    key = key.upper()
+    helpers.distance_matrix(key, helpers.lacuna(key))
+
+    flags = {character: False for character in helpers.alphabet}
+    index = 0
+    for chunk in chunks:
+        for c in chunk.upper():
+            if c not in flags:
+                continue
+            index += 1
+            character = Character(c, index, flags[c] if c not in ['M', 'Z'] else True, key)
+            flags[c] = not flags[c]
+            algorithm, plaintext = character.final
+            yield (index, plaintext, algorithm)
+
+def decipher_states(ciphertext, start, polarities):
+    """
+    Decipher a run of characters and return their states
+
+    :param: str  ciphertext The full ciphertext
+    :param: int  start      The position of the first character, from 0
+    :param: list polarities The polarity flag of each character in the run
+
+    :return: list of dict as returned by `Character.state`
+
+    This is the unit of work sent to each process when building a cipher in
+    parallel. States are plain values so they are cheap to send back, where they
+    are restored against the tables already held by the parent.
+    """
+    return [
+        Character(ciphertext[i], i + 1, polarity, ciphertext).state
+        for i, polarity in enumerate(polarities, start)
+    ]
@@ -0,0 +1,201 @@
+import gzip
+import hashlib
+import io
+import os
+import re
+import numpy as np
+from . import helpers
+
+class Fitness(object):
+    """
+    Scores plaintexts by the log probability of their n-grams
+
+    The log probabilities are held in a dense array indexed by packed letter codes,
+    where the n-gram `TION` is `((T * 26 + I) * 26 + O) * 26 + N` with A as 0.
+    N-grams never seen in the corpus score a floor below the rarest seen.
+
+    Texts are scored over sliding windows of their codes. Batches of texts of the
+    same length are scored as one array.
+    """
+    n      = 4
+    logp   = None
+    powers = None
+
+    def __init__(self, logp, n):
+        """
+        :param: array logp The log probability of every n-gram, 26 ** n long
+        :param: int   n    The length of each n-gram
+        """
+        self.n      = n
+        self.logp   = np.asarray(logp, dtype=np.float32)
+        self.powers = 26 ** np.arange(n - 1, -1, -1, dtype=np.int64)
+        if self.logp.shape != (26 ** n,):
+            raise ValueError('expected {} log probabilities, got {}'.format(26 ** n, self.logp.shape))
+
+    @classmethod
+    def from_counts(cls, counts, n):
+        """
+        :param: array counts The count of every n-gram, 26 ** n long
+        :param: int   n
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        total = counts.sum()
+        if not total:
+            raise ValueError('no n-grams counted')
+        floor = np.log10(0.01 / total)
+        with np.errstate(divide='ignore'):
+            return cls(np.where(counts > 0, np.log10(counts / total), floor), n)
+
+    @classmethod
+    def from_text(cls, text, n=4):
+        """
+        Count the n-grams of a corpus text, ignoring anything but letters
+
+        :return: Fitness
+        """
+        codes = cls.codes(text)
+        if len(codes) < n:
+            raise ValueError('corpus is shorter than a single {}-gram'.format(n))
+        packed = np.lib.stride_tricks.sliding_window_view(codes, n) @ (26 ** np.arange(n - 1, -1, -1))
+        return cls.from_counts(np.bincount(packed, minlength=26 ** n), n)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load n-gram counts from a file of `NGRAM COUNT` lines, optionally gzipped
+
+        The parsed array is kept in `helpers.cache_dir('ngrams')`, named after the
+        hash of the file, so later loads read it straight back.
+
+        :return: Fitness
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        if path.endswith('.gz'):
+            data = gzip.decompress(data)
+
+        cached = os.path.join(helpers.cache_dir('ngrams'), hashlib.sha256(data).hexdigest()[:32] + '.npy')
+        try:
+            logp = np.load(cached)
+            return cls(logp, int(round(np.log(len(logp)) / np.log(26))))
+        except (OSError, ValueError):
+            pass
+
+        grams, counts = [], []
+        for line in data.decode('utf-8').splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].isalpha():
+                grams.append(parts[0].upper())
+                counts.append(float(parts[1]))
+        if not grams:
+            raise ValueError('no n-grams found in {}'.format(path))
+
+        n = len(grams[0])
+        if any(len(gram) != n for gram in grams):
+            raise ValueError('n-grams in {} are not all the same length'.format(path))
+
+        packed = np.frombuffer(''.join(grams).encode('ascii'), dtype=np.uint8).reshape(-1, n).astype(np.int64) - 65
+        dense = np.zeros(26 ** n, dtype=np.float64)
+        np.add.at(dense, packed @ (26 ** np.arange(n - 1, -1, -1)), counts)
+        fitness = cls.from_counts(dense, n)
+
+        buffer = io.BytesIO()
+        np.save(buffer, fitness.logp)
+        helpers.atomic_write(cached, buffer.getvalue())
+        return fitness
+
+    @staticmethod
+    def codes(text):
+        """ The letters of text as codes from 0 to 25, anything else dropped """
+        text = re.sub('[^A-Z]', '', text.upper())
+        return np.frombuffer(text.encode('ascii'), dtype=np.uint8).astype(np.int64) - 65
+
+    def pack(self, codes):
+        """ The packed index of every n-gram along the last axis of codes """
+        if codes.shape[-1] < self.n:
+            return np.zeros(codes.shape[:-1] + (0,), dtype=np.int64)
+        return np.lib.stride_tricks.sliding_window_view(codes, self.n, axis=-1) @ self.powers
+
+    def score(self, text):
+        """
+        The log probability of a text
+
+        :param: str|array text A string or an array of codes
+
+        :return: float
+        """
+        codes = self.codes(text) if isinstance(text, str) else np.asarray(text, dtype=np.int64)
+        return float(self.logp[self.pack(codes)].sum())
+
+    def batch(self, texts):
+        """
+        Score many texts at once
+
+        :param: list|array texts Strings, or a two dimensional array of codes with
+                                 one row per text
+
+        :return: numpy array of scores in the order given
+        """
+        if isinstance(texts, np.ndarray) and texts.ndim == 2:
+            return self.logp[self.pack(texts.astype(np.int64, copy=False))].sum(axis=1)
+
+        codes = [self.codes(text) for text in texts]
+        scores = np.zeros(len(codes), dtype=np.float64)
+        by_length = {}
+        for i, row in enumerate(codes):
+            by_length.setdefault(len(row), []).append(i)
+        for length, indices in by_length.items():
+            scores[indices] = self.logp[self.pack(np.stack([codes[i] for i in indices]))].sum(axis=1)
+        return scores
+
+    def delta(self, codes, position, code):
+        """
+        The change in score from setting one letter of a text
+
+        Only the n-grams covering the position are scored again.
+
+        :param: array codes    The codes of the text
+        :param: int   position The position to change, from 0
+        :param: int   code     The new code at position
+
+        :return: float
+        """
+        start = max(0, position - self.n + 1)
+        stop = min(len(codes), position + self.n)
+        window = np.array(codes[start:stop], dtype=np.int64)
+        before = self.logp[self.pack(window)].sum()
+        window[position - start] = code
+        return float(self.logp[self.pack(window)].sum() - before)
+
+    def rescore(self, text, score, position, letter):
+        """
+        The score of text after changing the letter at position
+
+        :param: str   text     The text before the change
+        :param: float score    The score of text before the change
+        :param: int   position The position to change, from 0
+        :param: str   letter   The new letter
+
+        :return: float
+        """
+        return score + self.delta(self.codes(text), position, helpers.a2i(letter) - 1)
+
+# ------------------------------------------------------------
+# The scorer used when none is given. Set from KRYPTOS_NGRAMS,
+# the path of an n-gram counts file, when first needed.
+# ------------------------------------------------------------
+scorer = None
+
+def default():
+    """
+    The default scorer, loaded from KRYPTOS_NGRAMS
+
+    :return: Fitness
+    """
+    global scorer
+    if scorer is None:
+        path = os.environ.get('KRYPTOS_NGRAMS')
+        if not path:
+            raise ValueError('no n-gram scorer configured, set KRYPTOS_NGRAMS or fitness.scorer')
+        scorer = Fitness.load(path)
+    return scorer
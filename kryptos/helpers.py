@@ -1,4 +1,10 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 from itertools import combinations
+import numpy as np
 
 alphabet = [
     'A', 'B', 'C', 'D', 'E', 'F', 'G',
@@ -8,11 +14,86 @@ alphabet = [
 ]
 
 rulesengine = None
+store = None
 
+# ------------------------------------------------------------
+# Distance matrices and calculators of the most recently used
+# (start, end) pairs and letter parities of the most recently
+# used texts, most recently used last. Each holds the whole text
+# so only cache_size are kept, the oldest being dropped, and
+# anything dropped is built again when next asked.
+# ------------------------------------------------------------
 cache = {
-    'calculator': None
+    'calculator': OrderedDict(),
+    'matrix': OrderedDict(),
+    'parity': OrderedDict(),
 }
-cache_locked = False
+cache_size = 16
+
+# ------------------------------------------------------------
+# Matrices being built, keyed by (start, end). The first thread
+# to ask for a key builds it and every other thread asking for
+# the same key waits on its future. cache_lock guards both this
+# and the cache itself.
+# ------------------------------------------------------------
+cache_lock = threading.Lock()
+building = {}
+
+def cached(name, key):
+    """
+    Returns the entry for key in `cache[name]`, marking it most recently used
+
+    Returns None if there is no entry. Call while holding cache_lock.
+    """
+    entries = cache[name]
+    if key not in entries:
+        return None
+    entries.move_to_end(key)
+    return entries[key]
+
+def remember(name, key, value):
+    """
+    Holds value for key in `cache[name]`, dropping the least recently used
+    entries past cache_size. Call while holding cache_lock.
+    """
+    entries = cache[name]
+    entries[key] = value
+    entries.move_to_end(key)
+    while len(entries) > cache_size:
+        entries.popitem(last=False)
+    return value
+
+def cache_dir(*parts):
+    """
+    Returns the directory used to hold on-disk caches, creating it if required
+
+    This is `$KRYPTOS_CACHE` if set, otherwise `~/.cache/kryptos`. Any parts given
+    are joined on as sub-directories.
+    """
+    path = os.path.join(
+        os.environ.get('KRYPTOS_CACHE') or os.path.join(os.path.expanduser('~'), '.cache', 'kryptos'),
+        *parts
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def atomic_write(path, data):
+    """
+    Writes data to path so that readers only ever see the old or the complete new file
+
+    The data is written to a temporary file in the same directory which is then
+    renamed over the destination.
+    """
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
 
 def a2i(ch):
     return alphabet.index(ch.upper()) + 1
@@ -59,46 +140,197 @@ def polarity(string):
         else 'M'
     )
 
+def polarities(text, start=0, stop=None):
+    """
+    Returns the polarity flag of each character in text between start and stop
+
+    Each occurance of a character flips the flag for the next occurance of that
+    character, with M and Z always being True. The flag of each position is read
+    from the `parities` of the text, so once they are cached the cost is in
+    proportion to the segment rather than to `start`.
+    """
+    start, stop, _ = slice(start, stop).indices(len(text))
+    segment = codes(text[start:stop])
+    flags = (parities(text)[start:start + len(segment)] >> segment) & 1 == 1
+    flags[(segment == 13) | (segment == 26)] = True
+    return flags.tolist()
+
+def parities(text):
+    """
+    Returns the parity of the count of each letter before every position of text
+
+    Bit i of entry n is set where the letter with index i occurs an odd number of
+    times in `text[:n]`, so there is one more entry than there are characters. The
+    result is held in `cache['parity']` for the most recently used texts.
+    """
+    with cache_lock:
+        found = cached('parity', text)
+    if found is None:
+        found = np.zeros(len(text) + 1, dtype=np.uint32)
+        np.bitwise_xor.accumulate(np.uint32(1) << codes(text).astype(np.uint32), out=found[1:])
+        with cache_lock:
+            remember('parity', text, found)
+    return found
+
+def codes(text):
+    """ The index (1-26) of each character of text as a uint8 array """
+    return np.frombuffer(text.upper().encode('ascii'), dtype=np.uint8) - 64
+
+# Each letter mapped to its distance from Z, as `distancefrom(c, 'Z')`
+LACUNA = str.maketrans({c: distancefrom(c, 'Z') for c in alphabet})
+
+def lacuna(text):
+    """
+    Returns text with each character removed from Z, as `distancefrom(c, 'Z')`
+    """
+    return text.upper().translate(LACUNA)
+
+# The index `distanceto` gives for each difference of two indices, wrapped as uint8
+STEP = np.array([(i if i < 128 else i - 256) % 26 or 26 for i in range(256)], dtype=np.uint8)
+
+def distance_rows(start, end):
+    """
+    Calculates the distances between the start and end positions as rows of
+    character indices (1-26), in the order `calculate_distances` finds them
+
+    Each step of a pair is taken over the whole text at once, and rows are told
+    apart by their bytes rather than by scanning the list of distances. Only a
+    handful of distinct rows can ever be reached, so the step from each pair is
+    remembered and passes over the pairs stop once a pass finds nothing new.
+
+    :return: list of uint8 arrays
+    """
+    rows = [codes(start), codes(end)]
+    # The first row holding each value, so pairs are compared by value
+    first = {}
+    same = [first.setdefault(row.tobytes(), i) for i, row in enumerate(rows)]
+    steps = {}
+    completed = set()
+    for _ in range(26):
+        found = len(rows)
+        for i, j in combinations(range(found), 2):
+            if (same[i], same[j]) in completed:
+                continue
+            c, s = same[i], same[j]
+            for _ in range(6):
+                if (c, s) not in steps:
+                    z = STEP.take(rows[s] - rows[c])
+                    key = z.tobytes()
+                    if key not in first:
+                        first[key] = len(rows)
+                        rows.append(z)
+                        same.append(len(rows) - 1)
+                    steps[(c, s)] = first[key]
+                c, s = s, steps[(c, s)]
+            completed.add((same[i], same[j]))
+        if len(rows) == found:
+            break
+    return rows
+
+def calculate_distances(start, end):
+    """
+    Calculates the distances between the start and end positions
+
+    Each distance is returned as a tuple of (distance, polarity). This always
+    calculates the full set, see `distance_matrix` for the cached version.
+    """
+    rows = distance_rows(start, end)
+    return [
+        ((row + 64).tobytes().decode('ascii'), pole)
+        for row, pole in zip(rows, distance_poles(np.array(rows).reshape(len(rows), -1)))
+    ]
+
+def distance_matrix(start, end):
+    """
+    Returns the distances between start and end as a matrix of character indices
+
+    There is one row per distance and one column per character, each cell holding
+    the index (1-26) of the character at that position.
+
+    Because it takes so long to build, the matrix is stored in memory for each
+    start and end pair. Where a distance store is configured, it is also read from
+    and written to the store so other processes can share it without recalculating.
+
+    This is safe to call from multiple threads. Concurrent requests for the same
+    pair wait for a single build while different pairs build independently.
+    """
+    key = (start, end)
+    with cache_lock:
+        matrix = cached('matrix', key)
+        if matrix is not None:
+            return matrix
+        future = building.get(key)
+        owner = future is None
+        if owner:
+            future = building[key] = Future()
+
+    if not owner:
+        return future.result()
+
+    try:
+        matrix = stored(start, end)
+        if matrix is None:
+            rows = distance_rows(start, end)
+            matrix = np.array(rows, dtype=np.uint8).reshape(len(rows), len(start))
+            if store:
+                # A store which cannot be written to is left out
+                try:
+                    store.put(start, end, matrix)
+                except OSError:
+                    pass
+    except BaseException as e:
+        with cache_lock:
+            del building[key]
+        future.set_exception(e)
+        raise
+
+    with cache_lock:
+        remember('matrix', key, matrix)
+        del building[key]
+    future.set_result(matrix)
+    return matrix
+
+def stored(start, end):
+    """
+    Returns the matrix for start and end from the distance store, or None
+
+    The store is only a cache, so one which cannot be read is treated as empty.
+    """
+    if not store:
+        return None
+    try:
+        return store.get(start, end)
+    except OSError:
+        return None
+
+def distance_poles(matrix):
+    """
+    Returns the polarity of every row of a distance matrix as a list of E, O or M
+    """
+    poles = []
+    for row in np.asarray(matrix):
+        odd = row & 1
+        poles.append('E' if not odd.any() else 'O' if odd.all() else 'M')
+    return poles
+
 def distance_calculator(start, end):
     """
     Calculates a table of distances between the start and end positions
 
-    This will return a 97x26 grid of all possible positions.
-    Because it takes so long to build, the result of this is
-    stored in memory for re-use throughout the cipher.
+    This will return a 97x26 grid of all possible positions as a
+    list of (distance, polarity) tuples. The result of this is
+    stored in memory for each start and end pair for re-use
+    throughout the cipher.
     """
-    global cache_locked, cache
-    while cache_locked:
-        sleep(0.1)
-
-    if not cache['calculator']:
-        cache_locked = True
-        distances = [
-            (start, polarity(start)),
-            (end, polarity(end)),
+    key = (start, end)
+    with cache_lock:
+        calculator = cached('calculator', key)
+    if calculator is None:
+        matrix = distance_matrix(start, end)
+        calculator = [
+            ((row + 64).tobytes().decode('ascii'), pole)
+            for row, pole in zip(np.asarray(matrix, dtype=np.uint8), distance_poles(matrix))
         ]
-        completed = []
-        for pos in range(26):
-            for item in combinations([d[0] for d in distances], 2):
-                if item in completed:
-                    continue
-                c = item[0]
-                s = item[1]
-                for i in range(6):
-                    z = ''
-                    for j in range(len(c)):
-                        z += distanceto(c[j], s[j])
-
-                    e = polarity(z)
-                    if (z, e) not in distances:
-                        distances.append((z, e))
-                        p = ' '.join([str(a2i(t)).zfill(2) for t in z])
-                    c = s
-                    s = z
-
-                completed.append(item)
-            pos += 1
-
-        cache['calculator'] = distances
-        cache_locked = False
-    return cache['calculator']
+        with cache_lock:
+            remember('calculator', key, calculator)
+    return calculator
@@ -1,4 +1,4 @@
-import pandas as pd
+from .renderer import Renderer
 
 class Highlighter(object):
     """
@@ -7,7 +7,6 @@ class Highlighter(object):
     This is a helper class which draws up the grid.
     """
     _df         = None
-    _applied    = None
     _grid       = None
     _active_pos = None
     _cipher_pos = None
@@ -52,20 +51,6 @@ class Highlighter(object):
         """ helper method for colouring grid cells in green """
         return 'background-color: {}'.format(color)
 
-    def apply_grid(self):
-        """ Draws a grid on the dataframe and returns the style object """
-        return self._df.style.applymap(
-            self.highlighty, subset=pd.IndexSlice[:, self._grid[0]]
-        ).applymap(
-            self.highlighty, subset=pd.IndexSlice[self._grid[1], :]
-        ).applymap(
-            self.highlighty, subset=pd.IndexSlice[:, self._grid[2]]
-        ).applymap(
-            self.highlighty, subset=pd.IndexSlice[self._grid[3], :]
-        ).set_table_attributes(
-            'style="font-size: 10px"'
-        )
-
     def active(self, pos):
         """
         Set a given position active
@@ -91,35 +76,17 @@ class Highlighter(object):
         """
         self._cipher_pos = pos
 
-    def _active(self, pos, function=None):
-        if not function:
-            function=self.highlightr
-        {
-            'tl': lambda m: m.applymap(function, subset=pd.IndexSlice[self._grid[1], self._grid[0]]),
-            'tr': lambda m: m.applymap(function, subset=pd.IndexSlice[self._grid[1], self._grid[2]]),
-            'bl': lambda m: m.applymap(function, subset=pd.IndexSlice[self._grid[3], self._grid[0]]),
-            'br': lambda m: m.applymap(function, subset=pd.IndexSlice[self._grid[3], self._grid[2]]),
-        }[pos](self._applied)
-
-    def apply(self):
+    def render(self):
         """
-        Applies the current grid to the dataframe and returns the style object for rendering.
-        """
-        self._applied = self.apply_grid()
-        # cipher goes green if available
-        if self._cipher_pos:
-            self._active(self._cipher_pos, function=self.highlightg)
-
-        # light green for cipher_lacuna
-        if self._cipher_lacuna:
-            self._active(self._cipher_lacuna, function=self.highlightlg)
+        Renders the current grid straight to HTML, bypassing the pandas Styler.
 
-        # Set the active corner in red
-        if self._active_pos:
-            self._active(self._active_pos, function=self.highlightr)
-
-        # light red for active_lacuna if set
-        if self._active_lacuna:
-            self._active(self._active_lacuna, function=self.highlightlr)
-
-        return self._applied
+        This is the fast path used when drawing the notebook widgets.
+        """
+        return Renderer.grid(
+            self._df,
+            self._grid,
+            cipher=self._cipher_pos,
+            cipher_lacuna=self._cipher_lacuna,
+            active=self._active_pos,
+            active_lacuna=self._active_lacuna,
+        )
@@ -0,0 +1,226 @@
+import ast
+import difflib
+import importlib
+import sys
+from . import helpers, jit, CharacterSequence
+
+class Reader(object):
+    """
+    Stands in for a character while the rules run, recording the features read
+
+    Reads and writes are passed through to the character. A feature is only
+    recorded when it is read before the rules have written to it, so the rule
+    state the engine sets on the character (table, position, algorithm) is not
+    counted as an input. Overridden features are answered from the override.
+    """
+    def __init__(self, character, reads, overrides):
+        object.__setattr__(self, '_character', character)
+        object.__setattr__(self, '_reads', reads)
+        object.__setattr__(self, '_written', set())
+        object.__setattr__(self, '_overrides', overrides)
+
+    def __getattr__(self, name):
+        if name not in self._written:
+            self._reads.add(name)
+        if name in self._overrides:
+            return self._overrides[name](self._character)
+        return getattr(self._character, name)
+
+    def __setattr__(self, name, value):
+        self._written.add(name)
+        setattr(self._character, name, value)
+
+class Recorder(object):
+    """
+    Installed as `helpers.rulesengine` while characters are evaluated
+
+    Runs the rules engine against a Reader and traces which lines of the rules
+    module are executed, the decision path of the character. Compiled rules are
+    traced through the rules they were generated from.
+    """
+    def __init__(self, engine, filename, overrides):
+        self.engine    = getattr(engine, 'source', engine)
+        self.filename  = filename
+        self.overrides = overrides
+        self.reads     = set()
+        self.lines     = set()
+
+    def trace(self, frame, event, arg):
+        if frame.f_code.co_filename != self.filename:
+            return None
+        if event == 'line':
+            self.lines.add(frame.f_lineno)
+        return self.trace
+
+    def apply_rules(self, character):
+        previous = sys.gettrace()
+        sys.settrace(self.trace)
+        try:
+            return self.engine.apply_rules(Reader(character, self.reads, self.overrides))
+        finally:
+            sys.settrace(previous)
+
+class Evaluation(object):
+    """
+    Tracks what each character's decision depended on so only the characters a
+    change can reach are deciphered again
+
+    For every character the features read by the rules and the lines of the rules
+    module executed are recorded. After `rulesengine.py` is edited, `reload`
+    re-imports it and deciphers only the characters whose path ran through an
+    edited line. `override` replaces a feature and deciphers only the characters
+    which read it.
+
+        evaluation = Evaluation(cipher)
+        # ... edit rulesengine.py ...
+        evaluation.reload()
+    """
+    cipher    = None
+    reads     = None
+    lines     = None
+    source    = None
+    overrides = None
+
+    def __init__(self, cipher):
+        """
+        :param: Cipher cipher A cipher holding every character, not built lazily
+        """
+        if isinstance(cipher.cipher, CharacterSequence):
+            raise ValueError('incremental evaluation needs every character held, build the cipher without lazy')
+        self.cipher    = cipher
+        self.reads     = [set() for _ in range(cipher.length)]
+        self.lines     = [set() for _ in range(cipher.length)]
+        self.overrides = {}
+        self.source    = self.read()
+        self.evaluate(range(cipher.length))
+
+    @property
+    def module(self):
+        return sys.modules[helpers.rulesengine.__module__]
+
+    def read(self):
+        with open(self.module.__file__) as f:
+            return f.read().splitlines()
+
+    def evaluate(self, positions):
+        """
+        Decipher characters again, recording what each depended on
+
+        :param: iterable positions From 0
+
+        :return: dict with the positions evaluated and a list of changes, each a
+                 dict of the position and the plaintext and algorithm before and after
+        """
+        positions = sorted(set(positions))
+        engine = helpers.rulesengine
+        filename = self.module.__file__
+        changes = []
+        try:
+            for position in positions:
+                before = self.cipher[position].final
+                recorder = Recorder(engine, filename, self.overrides)
+                helpers.rulesengine = recorder
+                self.cipher.invalidate(position)
+                after = self.cipher[position].final
+                helpers.rulesengine = engine
+
+                self.reads[position] = recorder.reads
+                self.lines[position] = recorder.lines
+                if before != after:
+                    changes.append({
+                        'position':  position,
+                        'before':    before[1],
+                        'after':     after[1],
+                        'algorithm': (before[0], after[0]),
+                    })
+        finally:
+            helpers.rulesengine = engine
+        return {'evaluated': positions, 'changes': changes}
+
+    def depends(self, feature):
+        """ The positions whose decision read a feature """
+        return [i for i, reads in enumerate(self.reads) if feature in reads]
+
+    def override(self, feature, function=None):
+        """
+        Replace a feature of every character, or remove a replacement
+
+        :param: str      feature  The name the rules read, such as `alphabet_even`
+        :param: callable function Given the character, returns the value to use.
+                                  If None, the override is removed
+
+        :return: dict as returned by `evaluate`
+        """
+        if function is None:
+            self.overrides.pop(feature, None)
+        else:
+            self.overrides[feature] = function
+        return self.evaluate(self.depends(feature))
+
+    def touched(self, new):
+        """
+        Compare the recorded source of the rules with new source
+
+        Edits to comments and blank lines touch nothing. Any other edit touches the
+        old lines it changes along with the nearest statement before and after it,
+        as blank lines, comments and inserted lines are never executed so no
+        character records them.
+
+        :return: tuple of the old line numbers touched by the edit and a map of
+                 every unchanged old line number to its new line number
+        """
+        def code(lines):
+            return [line for line in lines if line.strip() and not line.strip().startswith('#')]
+
+        statements = sorted({
+            node.lineno for node in ast.walk(ast.parse('\n'.join(self.source)))
+            if isinstance(node, ast.stmt)
+        })
+
+        touched = set()
+        moved = {}
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, self.source, new, autojunk=False).get_opcodes():
+            if tag == 'equal':
+                moved.update({i1 + k + 1: j1 + k + 1 for k in range(i2 - i1)})
+            elif not code(self.source[i1:i2]) and not code(new[j1:j2]):
+                # Only comments or blank lines changed
+                continue
+            else:
+                touched.update(range(i1 + 1, i2 + 1))
+                touched.update([line for line in statements if line <= i1][-1:])
+                touched.update([line for line in statements if line > i2][:1])
+        return touched, moved
+
+    def reload(self):
+        """
+        Re-import the rules after an edit and decipher the characters it reaches
+
+        :return: dict as returned by `evaluate`
+        """
+        new = self.read()
+        if new == self.source:
+            return {'evaluated': [], 'changes': []}
+
+        touched, moved = self.touched(new)
+        affected = [i for i, lines in enumerate(self.lines) if lines & touched]
+        for i, lines in enumerate(self.lines):
+            if i not in affected:
+                self.lines[i] = {moved[line] for line in lines if line in moved}
+
+        module = importlib.reload(self.module)
+        helpers.rulesengine = jit.engine(module.RulesEngine)
+        sys.modules[__package__].RulesEngine = module.RulesEngine
+        self.source = new
+        return self.evaluate(affected)
+
+    def diff(self, result):
+        """ Show the changes of an evaluation as plaintext before and after """
+        before = list(self.cipher.plaintext)
+        after = list(before)
+        for change in result['changes']:
+            before[change['position']] = change['before']
+        return '{}\n{}\n{}'.format(
+            ''.join(before),
+            ''.join(['^' if a != b else ' ' for a, b in zip(before, after)]).rstrip(),
+            ''.join(after),
+        )
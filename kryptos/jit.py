@@ -0,0 +1,435 @@
+import ast
+import copy
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+from . import helpers
+
+VERSION = 1
+
+# ------------------------------------------------------------
+# Features of a character which cannot change while the rules
+# run and are cheap to read. Each one a rule set reads is bound
+# to a local once, at the start of its function. The features
+# derived from these, such as `all_off`, are still read where a
+# rule reaches them as finding them all up front costs more.
+# ------------------------------------------------------------
+FEATURES = (
+    'index', 'cindex', 'lindex', 'binary', 'polarity', 'mapped', 'cipher',
+    'cipher_active', 'lacuna_active', 'alphabet_even', 'upper_alphabet',
+)
+
+# ------------------------------------------------------------
+# The state the rules decide. It is held in locals and written
+# back to the character before anything else can read it. The
+# position is always written through, its setter marks the
+# squares.
+# ------------------------------------------------------------
+STATE = ('table', 'algorithm', 'position')
+
+# Compiled engines, keyed by the hash of what they were generated from
+engines = {}
+
+def local(name):
+    return '_' + name
+
+class Flattener(object):
+    """
+    Rewrites one method of the rules as a flat function
+
+    - every feature in `FEATURES` read is bound to a local at the start
+    - `all` and `any` of a list literal become `and` and `or` chains, and `sum` of
+      one a chain of additions
+    - a dict literal indexed by a key becomes an `if`/`elif` chain on the key
+    - conditional expressions assigned to a target become `if`/`else` statements
+    - the table, algorithm and position are held in locals
+
+    Anything else is kept as it is written. Every feature is free of side effects,
+    so only evaluating the operands a decision reaches gives the same decisions.
+    """
+    def __init__(self, function):
+        """
+        :param: ast.FunctionDef function
+        """
+        self.function  = function
+        self.character = function.args.args[0].arg
+        self.features  = {}
+        self.hoisted   = {}
+        self.count     = 0
+
+        # The state written anywhere in the function is held from its start
+        self.state = {
+            self.attribute(node) for node in ast.walk(function) if self.attribute(node) in STATE
+        }
+
+        names = {node.id for node in ast.walk(function) if isinstance(node, ast.Name)}
+        names.update(arg.arg for arg in ast.walk(function) if isinstance(arg, ast.arg))
+        clashes = sorted(name for name in names if name.startswith('_'))
+        if clashes:
+            raise ValueError('rules may not use names starting with _, found {}'.format(', '.join(clashes)))
+
+    # ------------------------------------------------------------
+    # Expressions
+    # ------------------------------------------------------------
+    def attribute(self, node):
+        """ The name of a character attribute read by node, or None """
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) \
+                and node.value.id == self.character:
+            return node.attr
+        return None
+
+    def temporary(self, prefix):
+        self.count += 1
+        return '_{}{}'.format(prefix, self.count)
+
+    def expression(self, node, truth=False):
+        """
+        Rewrite an expression
+
+        :param: ast.expr node
+        :param: bool     truth Only the truth of the value is used
+        """
+        name = self.attribute(node)
+        if name in STATE:
+            return ast.Name(local(name), ast.Load())
+        if name in FEATURES:
+            self.features.setdefault(name, None)
+            return ast.Name(local(name), ast.Load())
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id in ('all', 'any') and len(node.args) == 1 and not node.keywords:
+            argument = node.args[0]
+            if isinstance(argument, (ast.List, ast.Tuple)) \
+                    and not any(isinstance(e, ast.Starred) for e in argument.elts):
+                if not argument.elts:
+                    return ast.Constant(node.func.id == 'all')
+                chain = ast.BoolOp(
+                    ast.And() if node.func.id == 'all' else ast.Or(),
+                    [self.expression(e, True) for e in argument.elts]
+                ) if len(argument.elts) > 1 else self.expression(argument.elts[0], True)
+                if truth:
+                    return chain
+                return ast.UnaryOp(ast.Not(), ast.UnaryOp(ast.Not(), chain))
+            if self.attribute(argument) in FEATURES:
+                hoisted = local('{}_{}'.format(node.func.id, argument.attr))
+                self.hoisted[hoisted] = ast.Call(node.func, [self.expression(argument)], [])
+                return ast.Name(hoisted, ast.Load())
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'sum' \
+                and len(node.args) == 1 and not node.keywords and isinstance(node.args[0], (ast.List, ast.Tuple)) \
+                and not any(isinstance(e, ast.Starred) for e in node.args[0].elts):
+            # Added on to 0 in turn, as sum does
+            total = ast.Constant(0)
+            for element in node.args[0].elts:
+                total = ast.BinOp(total, ast.Add(), self.expression(element))
+            return total
+
+        if isinstance(node, ast.BoolOp):
+            return ast.BoolOp(node.op, [self.expression(value, truth) for value in node.values])
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return ast.UnaryOp(node.op, self.expression(node.operand, True))
+        if isinstance(node, ast.IfExp):
+            return ast.IfExp(
+                self.expression(node.test, True),
+                self.expression(node.body, truth),
+                self.expression(node.orelse, truth),
+            )
+        return self.generic(node)
+
+    def generic(self, node):
+        """ Rewrite the expressions and statements held by any other node """
+        node = copy.copy(node)
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list):
+                if value and isinstance(value[0], ast.stmt):
+                    setattr(node, field, self.statements(value))
+                else:
+                    setattr(node, field, [
+                        self.expression(item) if isinstance(item, ast.expr) else
+                        self.generic(item) if isinstance(item, ast.AST) else item
+                        for item in value
+                    ])
+            elif isinstance(value, ast.expr):
+                setattr(node, field, self.expression(value))
+            elif isinstance(value, ast.AST):
+                setattr(node, field, self.generic(value))
+        return node
+
+    # ------------------------------------------------------------
+    # Statements
+    # ------------------------------------------------------------
+    def escapes(self, node):
+        """ Whether node passes the character to a call, which may read its state """
+        return any(
+            isinstance(call, ast.Call) and any(
+                isinstance(argument, ast.Name) and argument.id == self.character
+                for argument in call.args
+            )
+            for call in ast.walk(node)
+        )
+
+    def assign(self, target, value):
+        return ast.Assign([target], value)
+
+    def write(self, name, value):
+        """ Write an attribute of the character """
+        return self.assign(
+            ast.Attribute(ast.Name(self.character, ast.Load()), name, ast.Store()), value
+        )
+
+    def flush(self):
+        """ Write the state held in locals back to the character """
+        return [
+            self.write(name, ast.Name(local(name), ast.Load()))
+            for name in STATE if name in self.state and name != 'position'
+        ]
+
+    def place(self):
+        """ Write the position through, its setter marks the squares of the table it is in """
+        return [
+            self.write(name, ast.Name(local(name), ast.Load()))
+            for name in ('table', 'position') if name in self.state
+        ]
+
+    def reload(self):
+        """ Read the state back after the character was passed elsewhere """
+        return [
+            self.assign(ast.Name(local(name), ast.Store()), ast.Attribute(
+                ast.Name(self.character, ast.Load()), name, ast.Load()
+            ))
+            for name in STATE if name in self.state
+        ]
+
+    def expand(self, value, leaf):
+        """
+        Expand conditional expressions and dict dispatches at the top of a value
+        into statements
+
+        :param: ast.expr value
+        :param: callable leaf  Given each value left once expanded, returns its statements
+        """
+        if isinstance(value, ast.IfExp):
+            return [ast.If(
+                self.expression(value.test, True),
+                self.expand(value.body, leaf) or [ast.Pass()],
+                self.expand(value.orelse, leaf),
+            )]
+
+        if isinstance(value, ast.Subscript) and isinstance(value.value, ast.Dict) \
+                and all(isinstance(key, ast.Constant) for key in value.value.keys):
+            # The last value given for a key is the one a dict keeps
+            cases = {}
+            for key, item in zip(value.value.keys, value.value.values):
+                cases.setdefault(repr(key.value), [key, None])[1] = item
+
+            statements = []
+            key = self.expression(value.slice)
+            if not isinstance(key, (ast.Name, ast.Constant)):
+                name = self.temporary('k')
+                statements.append(self.assign(ast.Name(name, ast.Store()), key))
+                key = ast.Name(name, ast.Load())
+
+            chain = [ast.Raise(ast.Call(ast.Name('KeyError', ast.Load()), [key], []), None)]
+            for constant, item in reversed(list(cases.values())):
+                chain = [ast.If(
+                    ast.Compare(key, [ast.Eq()], [ast.Constant(constant.value)]),
+                    self.expand(item, leaf) or [ast.Pass()],
+                    chain,
+                )]
+            return statements + chain
+
+        return leaf(value)
+
+    def store(self, target, value):
+        """ Statements assigning an expanded value to a target """
+        name = self.attribute(target)
+        if name in STATE:
+            value = self.expression(value)
+            held = isinstance(value, ast.Name) and value.id == local(name)
+            if name != 'position':
+                return [] if held else [self.assign(ast.Name(local(name), ast.Store()), value)]
+            return ([] if held else [self.assign(ast.Name(local(name), ast.Store()), value)]) + self.place()
+
+        if isinstance(target, ast.Tuple) and isinstance(value, ast.Tuple) \
+                and len(target.elts) == len(value.elts) \
+                and not any(isinstance(e, ast.Starred) for e in target.elts + value.elts):
+            # Every value is found before any target is assigned
+            found, stored = [], []
+            for element, item in zip(target.elts, value.elts):
+                held = self.attribute(element)
+                if held in STATE and self.attribute(item) == held:
+                    # Only an earlier target could change it and targets differ
+                    stored += self.store(element, item) if held == 'position' else []
+                    continue
+                temporary = self.temporary('v')
+                found.append(self.assign(ast.Name(temporary, ast.Store()), self.expression(item)))
+                stored += self.store(element, ast.Name(temporary, ast.Load()))
+            return found + stored
+
+        if isinstance(target, ast.Name) and isinstance(value, ast.Name) and target.id == value.id:
+            return []
+        return [self.assign(self.generic(target), self.expression(value))]
+
+    def statement(self, node):
+        """ Rewrite one statement as a list of statements """
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) \
+                and isinstance(node.value.value, str):
+            # Strings used as comments
+            return []
+
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            if self.escapes(node.value):
+                temporary = self.temporary('v')
+                value = self.expression(node.value)
+                return self.flush() + [
+                    self.assign(ast.Name(temporary, ast.Store()), value)
+                ] + self.reload() + self.store(node.targets[0], ast.Name(temporary, ast.Load()))
+            return self.expand(node.value, lambda value: self.store(node.targets[0], value))
+
+        if isinstance(node, ast.AugAssign) and self.attribute(node.target) in STATE \
+                and not self.escapes(node.value):
+            name = self.attribute(node.target)
+
+            def add(value):
+                if isinstance(node.op, ast.Add) and isinstance(value, ast.Constant) and value.value == 0:
+                    return []
+                statements = [ast.AugAssign(ast.Name(local(name), ast.Store()), node.op, self.expression(value))]
+                if name == 'position':
+                    statements += self.place()
+                return statements
+            return self.expand(node.value, add)
+
+        if isinstance(node, ast.If):
+            return [ast.If(
+                self.expression(node.test, True),
+                self.statements(node.body) or [ast.Pass()],
+                self.statements(node.orelse),
+            )]
+
+        if isinstance(node, ast.Return):
+            return self.flush() + [self.generic(node)]
+
+        if self.escapes(node):
+            return self.flush() + [self.generic(node)] + self.reload()
+        return [self.generic(node)]
+
+    def statements(self, nodes):
+        return [statement for node in nodes for statement in self.statement(node)]
+
+    def flatten(self):
+        """
+        :return: ast.FunctionDef
+        """
+        body = self.statements(self.function.body)
+        if not body or not isinstance(body[-1], ast.Return):
+            body += self.flush()
+
+        prologue = [
+            self.assign(ast.Name(local(name), ast.Store()), ast.Attribute(
+                ast.Name(self.character, ast.Load()), name, ast.Load()
+            ))
+            for name in list(self.features) + [name for name in STATE if name in self.state]
+        ] + [
+            self.assign(ast.Name(name, ast.Store()), value) for name, value in self.hoisted.items()
+        ]
+
+        function = copy.copy(self.function)
+        function.body = prologue + body
+        return function
+
+def generate(source, name='RulesEngine'):
+    """
+    Generate the flat source of a rules engine
+
+    :param: str source The source of the module holding the rules
+    :param: str name   The class holding the rules
+
+    :return: str The source of the module with the rules class rewritten
+    """
+    module = ast.parse(source)
+    for node in module.body:
+        if isinstance(node, ast.ClassDef) and node.name == name:
+            node.body = [
+                Flattener(item).flatten() if isinstance(item, ast.FunctionDef) else item
+                for item in node.body
+            ]
+            break
+    else:
+        raise ValueError('no class {} in the rules'.format(name))
+    return '# Generated by kryptos.jit, do not edit\n\n' + ast.unparse(ast.fix_missing_locations(module)) + '\n'
+
+def key(source):
+    """ The hash of the rules and of everything their generated code depends on """
+    with open(__file__, 'rb') as f:
+        generator = f.read()
+    digest = hashlib.sha256(source.encode())
+    digest.update(generator)
+    digest.update('{}:{}'.format(VERSION, sys.version).encode())
+    digest.update(importlib.util.MAGIC_NUMBER)
+    return digest.hexdigest()[:32]
+
+def code(source, name='RulesEngine'):
+    """
+    The compiled code of the generated rules, from the on-disk cache if found
+
+    The generated source is kept next to the marshalled code object so errors
+    raised in the rules point at readable lines.
+    """
+    digest = key(source)
+    try:
+        path = os.path.join(helpers.cache_dir('rules'), digest)
+    except OSError:
+        path = None
+
+    if path and os.path.exists(path + '.code'):
+        try:
+            with open(path + '.code', 'rb') as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+    generated = generate(source, name)
+    compiled = compile(generated, (path or digest) + '.py', 'exec')
+    if path:
+        try:
+            helpers.atomic_write(path + '.py', generated.encode())
+            helpers.atomic_write(path + '.code', marshal.dumps(compiled))
+        except OSError:
+            pass
+    return compiled
+
+def compiled(engine):
+    """
+    The compiled form of a rules engine class
+
+    The flat functions run against the globals of the module holding the rules,
+    so they see the same helpers. Calls between the rules, such as to `unpack`,
+    go to the compiled class. The class the rules were read from is kept as
+    `source`.
+
+    :param: type engine The rules engine class, such as `RulesEngine`
+
+    :return: type
+    """
+    module = sys.modules[engine.__module__]
+    with open(module.__file__) as f:
+        source = f.read()
+
+    digest = key(source)
+    if digest not in engines:
+        namespace = dict(vars(module))
+        exec(code(source, engine.__name__), namespace)
+        flat = namespace[engine.__name__]
+        flat.source = engine
+        engines[digest] = flat
+    return engines[digest]
+
+def engine(rules):
+    """
+    The engine to decipher with, the compiled rules unless `KRYPTOS_JIT` is `off`
+    """
+    if os.environ.get('KRYPTOS_JIT') == 'off':
+        return rules
+    return compiled(rules)
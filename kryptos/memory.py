@@ -0,0 +1,268 @@
+import os
+import re
+import sys
+import tracemalloc
+import types
+import numpy as np
+import pandas as pd
+from . import helpers, Renderer
+
+# ------------------------------------------------------------
+# Objects which are counted but never walked into. Walking a
+# class, module or function would reach most of the interpreter.
+# ------------------------------------------------------------
+OPAQUE = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+    types.MethodType, types.CodeType,
+)
+
+class MemoryBudgetExceeded(MemoryError):
+    """
+    Raised when building a cipher would take more memory than its budget allows
+    """
+    required = 0
+    limit    = 0
+
+    def __init__(self, required, limit):
+        self.required = required
+        self.limit    = limit
+        super().__init__(
+            'cipher needs an estimated {:,} bytes, over the budget of {:,} bytes'.format(required, limit)
+        )
+
+class Footprint(object):
+    """
+    The memory held by an object graph, broken down by component and by type
+
+    Every object is counted once however many times it is reached. An object
+    belongs to the nearest kryptos object it was reached through, so the strings
+    and dictionaries held by a square are counted against `Square`. References
+    higher than objects show how much of a component is shared.
+    """
+    components = None
+    types      = None
+
+    def __init__(self):
+        self.components = {}
+        self.types      = {}
+
+    def add(self, component, kind, size):
+        for stats, name in ((self.components, component), (self.types, kind)):
+            row = stats.setdefault(name, [0, 0, 0])
+            row[0] += 1
+            row[1] += size
+
+    def reference(self, component):
+        self.components.setdefault(component, [0, 0, 0])[2] += 1
+
+    @property
+    def total(self):
+        return sum(size for _, size, _ in self.components.values())
+
+    def __getitem__(self, component):
+        """ The bytes held by a component """
+        return self.components.get(component, [0, 0, 0])[1]
+
+    @property
+    def rows(self):
+        """ Each component as [component, objects, references, bytes], largest first """
+        return [
+            [name, objects, references, size]
+            for name, (objects, size, references) in sorted(
+                self.components.items(), key=lambda item: -item[1][1]
+            )
+        ]
+
+    def as_dataframe(self, by='component'):
+        """
+        :param: str by Break the footprint down by `component` or by `type`
+        """
+        if by == 'type':
+            return pd.DataFrame(
+                [[name, objects, size] for name, (objects, size, _) in sorted(
+                    self.types.items(), key=lambda item: -item[1][1]
+                )],
+                columns=['Type', 'Objects', 'Bytes']
+            )
+        return pd.DataFrame(self.rows, columns=['Component', 'Objects', 'References', 'Bytes'])
+
+    def _repr_html_(self):
+        return Renderer.table(
+            [[name, objects, references, '{:,}'.format(size)] for name, objects, references, size in self.rows]
+            + [['Total', '', '', '{:,}'.format(self.total)]],
+            columns=['Component', 'Objects', 'References', 'Bytes'],
+            caption='Memory footprint'
+        )
+
+def sizeof(obj):
+    """
+    The bytes held directly by an object
+
+    Data frames report the memory of their values and index. Arrays only count
+    their data when they own it, a view leads on to the array it views.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    return sys.getsizeof(obj)
+
+def children(obj):
+    """ The objects held by obj which the walk follows """
+    if isinstance(obj, np.ndarray):
+        return [obj.base] if isinstance(obj.base, np.ndarray) else []
+    if isinstance(obj, OPAQUE) or isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        return []
+    if isinstance(obj, dict):
+        return [item for pair in obj.items() for item in pair]
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return list(obj)
+    if type(obj).__module__.startswith(__package__):
+        attributes = getattr(obj, '__dict__', None)
+        return [attributes] if attributes is not None else []
+    return []
+
+def walk(pending, seen, result):
+    """ Count every object reachable from pending which is not yet seen """
+    while pending:
+        obj, component = pending.pop()
+        kind = type(obj).__name__
+        if type(obj).__module__.startswith(__package__) and not isinstance(obj, OPAQUE):
+            component = kind
+        component = component or kind
+
+        result.reference(component)
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+
+        result.add(component, kind, sizeof(obj))
+        pending.extend((child, component) for child in children(obj))
+    return result
+
+def footprint(root, caches=True, exclude=()):
+    """
+    Measure the memory held by an object, usually a Cipher
+
+    :param: object root    The object to measure
+    :param: bool   caches  Also count the distance matrix and calculator cached
+                           in helpers for the ciphertext of root
+    :param: list   exclude Objects which, with everything they hold, are not counted
+
+    :return: Footprint
+    """
+    seen = set()
+    walk([(obj, None) for obj in exclude], seen, Footprint())
+
+    pending = [(root, None)]
+
+    ciphertext = getattr(root, 'ciphertext', None)
+    lacunatext = getattr(root, 'lacunatext', None)
+    if caches and ciphertext is not None and lacunatext is not None:
+        for name in ('matrix', 'calculator'):
+            cached = helpers.cache[name].get((ciphertext, lacunatext))
+            if cached is not None:
+                pending.append((cached, 'distance {}'.format(name)))
+    return walk(pending, seen, Footprint())
+
+def measure(function, *args, **kwargs):
+    """
+    Call a function under tracemalloc
+
+    :return: tuple of the result, the bytes still allocated once it returns and
+             the peak bytes allocated while it ran
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    try:
+        result = function(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+    return result, current - before, peak - before
+
+class Budget(object):
+    """
+    A limit on the memory a cipher may take
+
+    Before a cipher builds its characters a few are built as a sample to estimate
+    the full footprint. When the estimate is over the limit the cipher either
+    switches to lazy mode, holding only as many characters as fit the limit, or
+    raises MemoryBudgetExceeded when compact is False or not even one fits.
+    """
+    UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+    limit   = 0
+    compact = True
+
+    def __init__(self, limit, compact=True):
+        """
+        :param: int  limit   The most bytes the cipher may hold
+        :param: bool compact Switch to lazy mode rather than raise
+        """
+        self.limit   = int(limit)
+        self.compact = compact
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Read a budget such as `512M`, `2G` or `1000000`, with `:raise` appended
+        to raise rather than switch to lazy mode
+
+        :return: Budget or None for an empty value
+        """
+        if not value:
+            return None
+        limit, _, action = value.partition(':')
+        match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*', limit.upper())
+        if not match or action not in ('', 'raise', 'compact'):
+            raise ValueError('invalid memory budget {!r}'.format(value))
+        return cls(float(match.group(1)) * cls.UNITS[match.group(2)], action != 'raise')
+
+    def estimate(self, cipher, sample=4):
+        """
+        Estimate the memory a cipher will hold once every character is built
+
+        :param: Cipher cipher A cipher with its polarities set
+        :param: int    sample The number of characters to build for the estimate
+
+        :return: tuple of the bytes held whatever the mode and the bytes per character
+        """
+        positions = sorted(set(
+            (cipher.length - 1) * i // max(1, sample - 1) for i in range(sample)
+        ))
+        characters = [cipher.character(position) for position in positions]
+        tables = [square.table for character in characters for square in character.cipher.values()]
+
+        # Values shared between characters are counted against the first
+        # so the rest measure what each extra character costs
+        first, rest = characters[:1], characters[1:] or characters
+        per_character = -(-footprint(rest, caches=False, exclude=tables + first).total // len(rest))
+        fixed = footprint(cipher).total + footprint(list({id(t): t for t in tables}.values())).total
+        return fixed, per_character
+
+    def characters(self, cipher):
+        """
+        The number of characters the cipher may hold
+
+        :return: int or None if every character fits within the limit
+        """
+        fixed, per_character = self.estimate(cipher)
+        required = fixed + per_character * cipher.length
+        if required <= self.limit:
+            return None
+
+        fits = (self.limit - fixed) // per_character if per_character else 0
+        if not self.compact or fits < 1:
+            raise MemoryBudgetExceeded(required, self.limit)
+        return int(fits)
+
+# ------------------------------------------------------------
+# The budget applied to every cipher not given one. Set from
+# KRYPTOS_MEMORY_BUDGET, e.g. `512M` or `2G:raise`
+# ------------------------------------------------------------
+budget = Budget.parse(os.environ.get('KRYPTOS_MEMORY_BUDGET', ''))
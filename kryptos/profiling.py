@@ -0,0 +1,207 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from . import Renderer
+
+# ------------------------------------------------------------
+# The sink receiving stage timings. When None, instrumented
+# stages call straight through to the function they wrap.
+# ------------------------------------------------------------
+sink = None
+
+class Sink(object):
+    """
+    Receives the timings of instrumented stages
+
+    Sinks may be called from any thread and stages may nest, for example
+    `Table.create` runs inside `Cipher.__init__`.
+    """
+    def enter(self, name):
+        """ Called as a stage starts """
+        pass
+
+    def exit(self, name, start, seconds):
+        """
+        Called as a stage finishes
+
+        :param: str   name    The stage
+        :param: float start   The time the stage started, as time.time()
+        :param: float seconds How long the stage took
+        """
+        pass
+
+class Aggregator(Sink):
+    """
+    Collects the count and total, fastest and slowest times of each stage in memory
+
+    Displaying an aggregator in a notebook shows a table of the collected stats.
+    """
+    stats = None
+    _lock = None
+
+    def __init__(self):
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def exit(self, name, start, seconds):
+        with self._lock:
+            stats = self.stats.setdefault(name, [0, 0.0, seconds, seconds])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = min(stats[2], seconds)
+            stats[3] = max(stats[3], seconds)
+
+    def clear(self):
+        with self._lock:
+            self.stats = {}
+
+    @property
+    def rows(self):
+        """ Each stage as [stage, calls, total, mean, min, max], slowest first """
+        return [
+            [name, count, total, total / count, fastest, slowest]
+            for name, (count, total, fastest, slowest) in sorted(
+                self.stats.items(), key=lambda item: -item[1][1]
+            )
+        ]
+
+    def as_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame(self.rows, columns=['Stage', 'Calls', 'Total', 'Mean', 'Min', 'Max'])
+
+    def _repr_html_(self):
+        return Renderer.table(
+            [
+                [name, count] + ['{:.6f}'.format(t) for t in times]
+                for name, count, *times in self.rows
+            ],
+            columns=['Stage', 'Calls', 'Total (s)', 'Mean (s)', 'Min (s)', 'Max (s)'],
+            caption='Stage timings'
+        )
+
+class JsonlSink(Sink):
+    """
+    Appends one JSON event per finished stage to a file
+    """
+    path  = None
+    _lock = None
+
+    def __init__(self, path):
+        self.path  = path
+        self._lock = threading.Lock()
+
+    def exit(self, name, start, seconds):
+        event = json.dumps({
+            'stage':   name,
+            'start':   start,
+            'seconds': seconds,
+            'pid':     os.getpid(),
+            'thread':  threading.get_ident(),
+        })
+        with self._lock, open(self.path, 'a') as f:
+            f.write(event + '\n')
+
+class ProfileSink(Aggregator):
+    """
+    Aggregates stage timings and captures a cProfile of everything run inside them
+
+    Profiling is switched on as the outermost stage starts and off as it ends. Only
+    one thread can be profiled at a time, stages started by other threads while a
+    profile is running are timed but not profiled.
+    """
+    profile = None
+    _owner  = None
+    _depth  = 0
+
+    def __init__(self):
+        super().__init__()
+        self.profile = cProfile.Profile()
+
+    def enter(self, name):
+        with self._lock:
+            if self._owner is None:
+                self._owner = threading.get_ident()
+                self.profile.enable()
+            if self._owner == threading.get_ident():
+                self._depth += 1
+
+    def exit(self, name, start, seconds):
+        super().exit(name, start, seconds)
+        with self._lock:
+            if self._owner == threading.get_ident():
+                self._depth -= 1
+                if not self._depth:
+                    self.profile.disable()
+                    self._owner = None
+
+    def pstats(self, sort='cumulative'):
+        """ The captured profile as a pstats.Stats object """
+        return pstats.Stats(self.profile).sort_stats(sort)
+
+def stage(name):
+    """
+    Decorator marking a function as an instrumented stage
+
+    :param: str name The name the stage is reported under
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            current = sink
+            if current is None:
+                return function(*args, **kwargs)
+            current.enter(name)
+            start = time.time()
+            began = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                current.exit(name, start, time.perf_counter() - began)
+        return wrapper
+    return decorator
+
+@contextmanager
+def capture(to=None):
+    """
+    Collect stage timings for the duration of a with block
+
+    :param: Sink to The sink to send timings to. Defaults to a new Aggregator
+
+        with profiling.capture() as stats:
+            cipher = Cipher(ciphertext)
+        display(stats)
+    """
+    global sink
+    previous = sink
+    sink = to if to is not None else Aggregator()
+    try:
+        yield sink
+    finally:
+        sink = previous
+
+def from_environment(value=None):
+    """
+    Create a sink from the KRYPTOS_PROFILE environment variable
+
+    - `aggregate`     collects stats in memory
+    - `jsonl:<path>`  appends events to path
+    - `cprofile`      collects stats and a cProfile capture
+
+    :return: Sink or None if profiling is not switched on
+    """
+    value = os.environ.get('KRYPTOS_PROFILE', '') if value is None else value
+    if value == 'aggregate':
+        return Aggregator()
+    if value.startswith('jsonl:'):
+        return JsonlSink(value[len('jsonl:'):])
+    if value == 'cprofile':
+        return ProfileSink()
+    return None
+
+# Profiling may be switched on before the notebook starts
+sink = from_environment()
@@ -0,0 +1,250 @@
+import argparse
+import csv
+import hashlib
+import io
+import os
+import numpy as np
+from . import helpers, Table
+
+class Reference(object):
+    """
+    The hand derived alphabet tables held in `resources/alpha_tables.csv`
+
+    The sheet holds the even (13x13) and mixed (13x26) tables, each framed by
+    its keys. Key rows sit above and below each table, either as two rows of 13
+    letters read as pairs or as a single row of 26 letters, and each table row
+    starts and ends with a pair of letters.
+
+    Parsing the sheet is done once. The tables are then kept in a binary sidecar
+    under `helpers.cache_dir('reference')`, named after the hash of the sheet so
+    any edit to the sheet is picked up.
+
+    The sheet is drawn mirrored left to right against the engine, so its left
+    keys are compared with the engine's right keys and the other way round.
+    """
+    PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources', 'alpha_tables.csv')
+
+    # The sheet side each engine key is read from
+    SIDES = {
+        'top':    'top',
+        'bottom': 'bottom',
+        'left':   'right',
+        'right':  'left',
+    }
+
+    tables  = None
+    _loaded = {}
+
+    def __init__(self, tables):
+        """
+        :param: dict tables Polarity to dict of `values` as an int8 array and the
+                            `top`, `bottom`, `left` and `right` keys as lists of
+                            letters or pairs of letters
+        """
+        self.tables = tables
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Load the reference tables, from the sidecar where one is up to date
+
+        :param: str path The sheet to load. Defaults to `resources/alpha_tables.csv`
+
+        :return: Reference
+        """
+        path = path or cls.PATH
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        if digest in cls._loaded:
+            return cls._loaded[digest]
+
+        sidecar = os.path.join(helpers.cache_dir('reference'), digest + '.npz')
+        reference = cls.read(sidecar)
+        if reference is None:
+            reference = cls.parse(data.decode('utf-8'))
+            reference.write(sidecar)
+        return cls._loaded.setdefault(digest, reference)
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse the sheet
+
+        :return: Reference
+        """
+        rows = [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(text))]
+        rows = [row[:max([i + 1 for i, cell in enumerate(row) if cell] or [0])] for row in rows]
+
+        tables = []
+        keys = []
+        for row in rows + [[]]:
+            if len(row) > 4 and all(cell.isdigit() for cell in row[2:-2]):
+                if keys or not tables or tables[-1]['bottom'] is not None:
+                    tables.append({'top': keys, 'bottom': None, 'rows': []})
+                    keys = []
+                tables[-1]['rows'].append(row)
+            elif row and all(cell.isalpha() for cell in row):
+                keys.append([cell.upper() for cell in row])
+            elif keys and tables and tables[-1]['bottom'] is None and not row:
+                tables[-1]['bottom'] = keys
+                keys = []
+
+        parsed = {}
+        for table in tables:
+            values = np.array([[int(cell) for cell in row[2:-2]] for row in table['rows']], dtype=np.int8)
+            polarity = bool((values % 2 == 0).all())
+            if polarity in parsed:
+                raise ValueError('reference sheet holds more than one {} table'.format(
+                    'even' if polarity else 'mixed'
+                ))
+            parsed[polarity] = {
+                'values': values,
+                'top':    cls.keyrow(table['top']),
+                'bottom': cls.keyrow(table['bottom'] or []),
+                'left':   [tuple(row[:2]) for row in table['rows']],
+                'right':  [tuple(row[-2:]) for row in table['rows']],
+            }
+        if set(parsed.keys()) != {True, False}:
+            raise ValueError('reference sheet must hold an even and a mixed table')
+        return cls(parsed)
+
+    @staticmethod
+    def keyrow(rows):
+        """ Key rows as letters, or as pairs when given as two rows """
+        if len(rows) == 1:
+            return list(rows[0])
+        return list(zip(*rows))
+
+    @staticmethod
+    def encode(keys):
+        return np.array([[helpers.a2i(c) for c in key] for key in keys], dtype=np.uint8)
+
+    @staticmethod
+    def decode(array):
+        return [
+            tuple(helpers.i2a(int(i)) for i in key) if len(key) > 1 else helpers.i2a(int(key[0]))
+            for key in array
+        ]
+
+    def write(self, path):
+        """ Write the tables to a sidecar """
+        arrays = {}
+        for polarity, table in self.tables.items():
+            name = 'even' if polarity else 'mixed'
+            arrays[name + '_values'] = table['values']
+            for side in self.SIDES.keys():
+                arrays['{}_{}'.format(name, side)] = self.encode(table[side])
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        helpers.atomic_write(path, buffer.getvalue())
+
+    @classmethod
+    def read(cls, path):
+        """
+        Read the tables from a sidecar
+
+        :return: Reference or None if the sidecar is missing or unreadable
+        """
+        try:
+            with np.load(path) as arrays:
+                return cls({
+                    polarity: dict(
+                        {'values': arrays[name + '_values']},
+                        **{side: cls.decode(arrays['{}_{}'.format(name, side)]) for side in cls.SIDES.keys()}
+                    ) for polarity, name in ((True, 'even'), (False, 'mixed'))
+                })
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def restore(self, ciphertext):
+        """
+        Share the reference tables as the tables of a ciphertext without creating them
+
+        Only use this for a ciphertext whose tables have been validated against
+        the reference, see `validate`.
+
+        :return: dict of polarity to Table
+        """
+        return {
+            polarity: Table.restore(ciphertext, polarity, table['values'])
+            for polarity, table in self.tables.items()
+        }
+
+    @staticmethod
+    def same(expected, actual):
+        """ Compare keys position by position, pairs in either order """
+        normalise = lambda key: frozenset(key) if isinstance(key, tuple) else key
+        return [normalise(key) for key in expected] == [normalise(key) for key in actual]
+
+    def validate(self, ciphertext):
+        """
+        Compare the tables created for a ciphertext with the reference
+
+        Left and right keys are compared over the rows of the table only.
+
+        :param: str ciphertext
+
+        :return: list of str describing each difference, empty when both match
+        """
+        problems = []
+        for polarity, reference in self.tables.items():
+            name = 'even' if polarity else 'mixed'
+            table = Table.shared(ciphertext, polarity)
+            values = np.asarray(table.table.values)
+            if values.shape != reference['values'].shape:
+                problems.append('{} values: shape {} differs from the reference {}'.format(
+                    name, values.shape, reference['values'].shape
+                ))
+            elif (values != reference['values']).any():
+                rows, columns = np.nonzero(values != reference['values'])
+                problems.append('{} values: {} cells differ, first at row {} column {}'.format(
+                    name, len(rows), rows[0] + 1, columns[0] + 1
+                ))
+
+            for key, side in self.SIDES.items():
+                expected = reference[side]
+                actual = list(table.keys[key])
+                if key in ('left', 'right'):
+                    actual = actual[:values.shape[0]]
+                if not self.same(expected, actual):
+                    problems.append('{} {} keys: {} differ from the reference {} keys {}'.format(
+                        name, key, self.show(actual), side, self.show(expected)
+                    ))
+        return problems
+
+    @staticmethod
+    def show(keys):
+        return ' '.join([''.join(key) for key in keys])
+
+def main(argv=None):
+    """
+    Command line interface to the reference tables
+
+        python -m kryptos reference validate CIPHERTEXT [--sheet PATH]
+        python -m kryptos reference show [--sheet PATH]
+    """
+    parser = argparse.ArgumentParser(prog='python -m kryptos reference', description='Check the reference tables')
+    parser.add_argument('--sheet', help='reference sheet (default: resources/alpha_tables.csv)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    validate = commands.add_parser('validate', help='compare the tables created for a ciphertext with the reference')
+    validate.add_argument('ciphertext')
+    commands.add_parser('show', help='print the reference tables')
+    args = parser.parse_args(argv)
+
+    reference = Reference.load(args.sheet)
+    if args.command == 'show':
+        for polarity, table in reference.tables.items():
+            print('even' if polarity else 'mixed')
+            for side in Reference.SIDES.keys():
+                print('  {:<6} {}'.format(side, Reference.show(table[side])))
+            for row in table['values']:
+                print('  ' + ' '.join('{:>2}'.format(v) for v in row))
+        return 0
+
+    problems = reference.validate(args.ciphertext.upper())
+    for problem in problems:
+        print(problem)
+    if not problems:
+        print('tables match the reference')
+    return 1 if problems else 0
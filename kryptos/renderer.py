@@ -0,0 +1,166 @@
+from html import escape
+
+class Html(str):
+    """
+    A rendered HTML fragment
+
+    Behaves as a plain string but is picked up by Jupyter's rich display so the
+    fragment can be passed straight to `display.display`.
+    """
+    def _repr_html_(self):
+        return str(self)
+
+class Renderer(object):
+    """
+    Renders tables straight to HTML without going through the pandas Styler
+
+    Styling through pandas chains one `Styler.map` call per highlighted region and
+    leaves pandas to build the CSS for every cell on each redraw. The renderer
+    instead takes the cell values and a map of cell classes, then writes the table
+    out in a single pass. All colours are declared once as CSS classes so each cell
+    carries at most a short class name.
+    """
+    GRID          = 'kg'
+    CIPHER        = 'kc'
+    CIPHER_LACUNA = 'kcl'
+    ACTIVE        = 'ka'
+    ACTIVE_LACUNA = 'kal'
+    BOTH          = 'kb'
+    PROPERTIES    = 'kp'
+    CONDITIONS    = 'kn'
+    WIDE          = 'kw'
+
+    COLOURS = {
+        GRID:          'background-color: yellow',
+        CIPHER:        'background-color: #00FF00',
+        CIPHER_LACUNA: 'background-color: #90EE90',
+        ACTIVE:        'background-color: #FF0000; color: #FFFFFF',
+        ACTIVE_LACUNA: 'background-color: #FBACA8; color: #FFFFFF',
+        BOTH:          'background-color: #EDC9AF',
+        PROPERTIES:    'background-color: #D291BC',
+        CONDITIONS:    'background-color: #85E3FF',
+        WIDE:          'width: 120px',
+    }
+
+    STYLE = '<style>{}</style>'.format(''.join(
+        'table.kt td.{0},table.kt th.{0}{{{1}}}'.format(name, style)
+        for name, style in COLOURS.items()
+    ))
+
+    # Corners of a grid reference, as (row, column) offsets into the gridref list
+    CORNERS = {
+        'tl': (1, 0),
+        'tr': (1, 2),
+        'bl': (3, 0),
+        'br': (3, 2),
+    }
+
+    @staticmethod
+    def table(rows, columns=None, index=None, classes=None, caption=None, header=True):
+        """
+        Render a list of rows to an HTML table
+
+        :param: list rows     A list of lists holding the cell values
+        :param: list columns  Column labels. If None, positional labels are used and the header is hidden
+        :param: list index    Row labels. If None, positional labels are used and the index is hidden
+        :param: dict classes  Maps (row label, column label) to a CSS class name
+        :param: str  caption  Optional caption for the table
+        :param: bool header   Show the column header row
+
+        :return: Html
+        """
+        classes = classes or {}
+        show_index = index is not None
+        if columns is None:
+            header = False
+            columns = range(len(rows[0]) if rows else 0)
+        if index is None:
+            index = range(len(rows))
+
+        html = [Renderer.STYLE, '<table class="kt" style="font-size: 10px">']
+        if caption is not None:
+            html.append('<caption>{}</caption>'.format(escape(str(caption))))
+
+        if header:
+            html.append('<thead><tr>')
+            if show_index:
+                html.append('<th></th>')
+            html.extend('<th>{}</th>'.format(escape(str(c))) for c in columns)
+            html.append('</tr></thead>')
+
+        html.append('<tbody>')
+        for label, row in zip(index, rows):
+            html.append('<tr>')
+            if show_index:
+                html.append('<th>{}</th>'.format(escape(str(label))))
+            for column, value in zip(columns, row):
+                css = classes.get((label, column))
+                html.append(
+                    '<td class="{}">{}</td>'.format(css, escape(str(value))) if css
+                    else '<td>{}</td>'.format(escape(str(value)))
+                )
+            html.append('</tr>')
+        html.append('</tbody></table>')
+        return Html(''.join(html))
+
+    @staticmethod
+    def frame(df, classes=None, caption=None, index=True):
+        """
+        Render a pandas DataFrame using its own index and column labels
+
+        :param: DataFrame df
+        :param: dict      classes Maps (row label, column label) to a CSS class name
+        :param: str       caption
+        :param: bool      index   Show the index down the left hand side
+
+        :return: Html
+        """
+        index_labels = list(df.index)
+        return Renderer.table(
+            df.values.tolist(),
+            columns=list(df.columns),
+            index=index_labels if index else None,
+            classes=classes if index else {
+                (index_labels.index(r), c): css for (r, c), css in (classes or {}).items()
+            },
+            caption=caption,
+        )
+
+    @staticmethod
+    def grid(df, gridref, cipher=None, cipher_lacuna=None, active=None, active_lacuna=None):
+        """
+        Render a polarity table with its grid lines and highlighted corners
+
+        :param: DataFrame df            The table to render
+        :param: list      gridref       [top, left, bottom, right] as plotted by the Square
+        :param: str       cipher        Corner holding the cipher character
+        :param: str       cipher_lacuna Corner holding the cipher lacuna
+        :param: str       active        The active corner
+        :param: str       active_lacuna The corner holding the deciphered lacuna
+
+        Corners are applied cipher, cipher lacuna, active then active lacuna so where
+        two highlights land on the same cell the later one wins.
+
+        :return: Html
+        """
+        index = list(df.index)
+        columns = list(df.columns)
+        classes = {}
+        for row in (gridref[1], gridref[3]):
+            for column in columns:
+                classes[(row, column)] = Renderer.GRID
+        for column in (gridref[0], gridref[2]):
+            for row in index:
+                classes[(row, column)] = Renderer.GRID
+
+        for corner, css in (
+            (cipher,        Renderer.CIPHER),
+            (cipher_lacuna, Renderer.CIPHER_LACUNA),
+            (active,        Renderer.ACTIVE),
+            (active_lacuna, Renderer.ACTIVE_LACUNA),
+        ):
+            if corner:
+                row, column = Renderer.CORNERS[corner]
+                classes[(gridref[row], gridref[column])] = css
+
+        return Renderer.table(df.values.tolist(), columns=columns, index=index, classes=classes)
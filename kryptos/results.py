@@ -0,0 +1,302 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+from . import analysis, Snapshot
+from .fitness import Fitness
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS plaintexts (
+    digest    BLOB PRIMARY KEY,
+    plaintext TEXT NOT NULL,
+    score     REAL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    name    TEXT PRIMARY KEY,
+    rules   TEXT,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS configurations (
+    run           TEXT NOT NULL,
+    configuration TEXT NOT NULL,
+    digest        BLOB NOT NULL,
+    PRIMARY KEY (run, configuration)
+);
+CREATE INDEX IF NOT EXISTS configurations_digest ON configurations(digest);
+'''
+
+class Transaction(object):
+    """ Holds the write lock of a SQLite file for a block, committing on success """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, kind, value, traceback):
+        self.connection.execute('COMMIT' if kind is None else 'ROLLBACK')
+
+class ResultStore(object):
+    """
+    Plaintexts held once each, addressed by a hash of their letters
+
+    Many configurations decipher to the same plaintext, for instance replacement
+    maps which only touch letters never plotted. Each plaintext is stored and
+    scored once under the blake2b hash of its packed letter codes, and every
+    configuration of a run points at the plaintext it produced.
+
+    Runs are named and record the hash of the rules they were deciphered with,
+    so the plaintexts of two runs can be compared as sets:
+
+        store = ResultStore('k4-results.db')
+        store.new('rules-v2')            # new since the last rule change
+        store.common('rules-v1', 'rules-v2')
+    """
+    SIZE = 16
+    BATCH = 900
+
+    path = None
+    _connection = None
+
+    def __init__(self, path):
+        """
+        :param: str path The SQLite file holding the store
+        """
+        self.path = path
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @classmethod
+    def digest(cls, plaintext):
+        """ The address of a plaintext, the blake2b hash of its letter codes as bytes """
+        return hashlib.blake2b(Fitness.codes(plaintext).astype(np.uint8).tobytes(), digest_size=cls.SIZE).digest()
+
+    def register(self, run, rules=None):
+        """
+        Record a run, once
+
+        :param: str run   The name of the run
+        :param: str rules The hash of the rules. Defaults to the rules loaded now
+        """
+        self.connection.execute(
+            'INSERT OR IGNORE INTO runs (name, rules, created) VALUES (?, ?, ?)',
+            (run, rules or Snapshot.rules_hash(), time.time())
+        )
+
+    def select(self, query, digests):
+        """ Run a query taking `IN ({})` over digests, in batches """
+        digests = list(digests)
+        for i in range(0, len(digests), self.BATCH):
+            batch = digests[i:i + self.BATCH]
+            yield from self.connection.execute(query.format(','.join('?' * len(batch))), batch)
+
+    def scores(self, digests):
+        """ The score held for each digest stored, None where it was stored without a scorer """
+        return dict(self.select('SELECT digest, score FROM plaintexts WHERE digest IN ({})', digests))
+
+    def plaintexts(self, digests):
+        """ The plaintext of each digest stored """
+        return dict(self.select('SELECT digest, plaintext FROM plaintexts WHERE digest IN ({})', digests))
+
+    def score(self, plaintexts, scorer=None):
+        """
+        Score plaintexts, each unique plaintext not already scored in the store once
+
+        :param: list    plaintexts
+        :param: Fitness scorer     If None, only scores already stored are found
+
+        :return: list of (digest, score) in the order given
+        """
+        digests = [self.digest(plaintext) for plaintext in plaintexts]
+        scores = {digest: score for digest, score in self.scores(set(digests)).items() if score is not None}
+        if scorer is not None:
+            unscored = {}
+            for digest, plaintext in zip(digests, plaintexts):
+                if digest not in scores:
+                    unscored.setdefault(digest, plaintext)
+            if unscored:
+                scores.update(zip(unscored.keys(), scorer.batch(list(unscored.values())).tolist()))
+        return [(digest, scores.get(digest)) for digest in digests]
+
+    def put(self, run, items, scorer=None):
+        """
+        Store the plaintexts of a run's configurations
+
+        Storing a configuration again replaces what it pointed at, so a chunk of
+        a sweep stored twice is stored once.
+
+        :param: str      run
+        :param: iterable items  (configuration, plaintext) pairs, configurations as
+                                JSON serialisable dicts
+        :param: Fitness  scorer Scores plaintexts not scored before
+
+        :return: list of (digest, score) in the order given
+        """
+        items = list(items)
+        scored = self.score([plaintext for _, plaintext in items], scorer)
+        with Transaction(self.connection) as connection:
+            connection.executemany(
+                'INSERT INTO plaintexts (digest, plaintext, score) VALUES (?, ?, ?) '
+                'ON CONFLICT (digest) DO UPDATE SET score = excluded.score '
+                'WHERE plaintexts.score IS NULL AND excluded.score IS NOT NULL',
+                [(digest, plaintext, score) for (_, plaintext), (digest, score) in zip(items, scored)]
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO configurations (run, configuration, digest) VALUES (?, ?, ?)',
+                [
+                    (run, json.dumps(configuration, sort_keys=True), digest)
+                    for (configuration, _), (digest, _) in zip(items, scored)
+                ]
+            )
+        return scored
+
+    def get(self, plaintext):
+        """
+        :return: the score of a plaintext, or None if it is not stored or not scored
+        """
+        return self.scores([self.digest(plaintext)]).get(self.digest(plaintext))
+
+    def configurations(self, plaintext, run=None):
+        """ Every configuration which deciphered to a plaintext, optionally of one run only """
+        query = 'SELECT configuration FROM configurations WHERE digest = ?' + (' AND run = ?' if run else '')
+        return [
+            json.loads(configuration) for configuration, in self.connection.execute(
+                query, (self.digest(plaintext), run) if run else (self.digest(plaintext),)
+            )
+        ]
+
+    def digests(self, run):
+        """ The set of plaintext digests of a run """
+        return {digest for digest, in self.connection.execute(
+            'SELECT DISTINCT digest FROM configurations WHERE run = ?', (run,)
+        )}
+
+    def runs(self):
+        """ Every run with the configurations and unique plaintexts it holds, oldest first """
+        return pd.DataFrame(self.connection.execute(
+            'SELECT runs.name, runs.rules, runs.created, COUNT(configurations.digest), '
+            'COUNT(DISTINCT configurations.digest) FROM runs '
+            'LEFT JOIN configurations ON configurations.run = runs.name '
+            'GROUP BY runs.name ORDER BY runs.created'
+        ).fetchall(), columns=['Run', 'Rules', 'Created', 'Configurations', 'Unique'])
+
+    def previous(self, run):
+        """
+        The latest run before `run` deciphered with different rules
+
+        :return: str or None
+        """
+        row = self.connection.execute(
+            'SELECT other.name FROM runs AS this JOIN runs AS other '
+            'ON other.created < this.created AND other.rules != this.rules '
+            'WHERE this.name = ? ORDER BY other.created DESC LIMIT 1', (run,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def compare(self, run, other, operation):
+        """
+        Combine the plaintexts of two runs as sets
+
+        :param: str run
+        :param: str other
+        :param: str operation One of EXCEPT, INTERSECT or UNION
+
+        :return: DataFrame of each plaintext, its score and the configurations
+                 reaching it in either run, best first
+        """
+        if operation not in ('EXCEPT', 'INTERSECT', 'UNION'):
+            raise ValueError('unknown set operation {}'.format(operation))
+        return pd.DataFrame(self.connection.execute(
+            'SELECT plaintexts.plaintext, plaintexts.score, COUNT(configurations.digest) '
+            'FROM plaintexts JOIN configurations ON configurations.digest = plaintexts.digest '
+            'WHERE configurations.run IN (?, ?) AND plaintexts.digest IN ('
+            '    SELECT digest FROM configurations WHERE run = ? {} '
+            '    SELECT digest FROM configurations WHERE run = ?'
+            ') GROUP BY plaintexts.digest '
+            'ORDER BY plaintexts.score IS NULL, plaintexts.score DESC, plaintexts.plaintext'.format(operation),
+            (run, other, run, other)
+        ).fetchall(), columns=['Plaintext', 'Score', 'Configurations'])
+
+    def new(self, run, since=None):
+        """
+        The plaintexts of a run not found by another
+
+        :param: str since The run to compare with. Defaults to the latest run
+                          before it deciphered with different rules
+        """
+        since = since or self.previous(run)
+        if since is None:
+            raise ValueError('no earlier run of {} with different rules to compare with'.format(run))
+        return self.compare(run, since, 'EXCEPT')
+
+    def common(self, run, other):
+        """ The plaintexts found by both runs """
+        return self.compare(run, other, 'INTERSECT')
+
+    def profile(self, run):
+        """
+        The statistics of every unique plaintext of a run, see `analysis.profile`
+
+        :return: DataFrame of each plaintext, its score and configurations and its statistics
+        """
+        found = pd.DataFrame(self.connection.execute(
+            'SELECT plaintexts.plaintext, plaintexts.score, COUNT(*) '
+            'FROM plaintexts JOIN configurations ON configurations.digest = plaintexts.digest '
+            'WHERE configurations.run = ? GROUP BY plaintexts.digest '
+            'ORDER BY plaintexts.score IS NULL, plaintexts.score DESC, plaintexts.plaintext', (run,)
+        ).fetchall(), columns=['Plaintext', 'Score', 'Configurations'])
+        return pd.concat([found, analysis.profile(list(found['Plaintext']))], axis=1)
+
+def main(argv=None):
+    """
+    Command line interface to a result store
+
+        python -m kryptos results PATH runs
+        python -m kryptos results PATH new RUN [--since RUN]
+        python -m kryptos results PATH common RUN OTHER
+    """
+    parser = argparse.ArgumentParser(prog='python -m kryptos results', description='Compare sweep results')
+    parser.add_argument('path', help='result store, or a sweep holding its own results')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('runs', help='list every run')
+    new = commands.add_parser('new', help='plaintexts of a run not found before')
+    new.add_argument('run')
+    new.add_argument('--since', help='run to compare with (default: the last run with different rules)')
+    common = commands.add_parser('common', help='plaintexts found by both runs')
+    common.add_argument('run')
+    common.add_argument('other')
+    for command in (new, common):
+        command.add_argument('-n', type=int, default=20, help='most plaintexts to show')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print('no result store at {}'.format(args.path))
+        return 1
+    store = ResultStore(args.path)
+    if args.command == 'runs':
+        frame = store.runs()
+        frame['Created'] = [time.strftime('%Y-%m-%d %H:%M', time.localtime(t)) for t in frame['Created']]
+    elif args.command == 'new':
+        frame = store.new(args.run, args.since).head(args.n)
+    else:
+        frame = store.common(args.run, args.other).head(args.n)
+    with pd.option_context('display.max_colwidth', None, 'display.width', None):
+        print(frame.to_string(index=False))
+    return 0
@@ -1,8 +1,9 @@
-from . import helpers
+from . import helpers, profiling
 from . import Square
 
 class RulesEngine:
     @staticmethod
+    @profiling.stage('RulesEngine.apply_rules')
     def apply_rules(character):
         # ============================================================================
         # RULES
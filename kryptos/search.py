@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+from . import fitness, helpers, Square
+
+class BeamSearch(object):
+    """
+    Searches the algorithm, and optionally the corner, of every character for the
+    plaintexts an n-gram model scores highest
+
+    Each position may decipher to any letter one of its choices reaches. Where
+    several choices reach the same letter, the one closest to the choice made by
+    the rules engine is kept, so a position only counts as changed when its
+    letter differs from the rules engine's.
+
+    Cribs are hard constraints, a position under a crib may only take the crib
+    letter. The search keeps the `width` best partial plaintexts at each position,
+    scoring every n-gram as it is completed, so the score of each result is the
+    score of its plaintext.
+    """
+    cipher  = None
+    scorer  = None
+    corners = False
+    cribs   = None
+    width   = 1000
+    _options = None
+
+    def __init__(self, cipher, scorer=None, corners=False, cribs=None, width=1000):
+        """
+        :param: Cipher  cipher
+        :param: Fitness scorer  Defaults to `fitness.default()`
+        :param: bool    corners Also search every corner of both tables, not just
+                                the corner chosen by the rules engine
+        :param: dict    cribs   Known plaintext as {start position (from 0): text}
+        :param: int     width   The most partial plaintexts kept at each position
+        """
+        self.cipher  = cipher
+        self.scorer  = scorer or fitness.default()
+        self.corners = corners
+        self.cribs   = cribs or {}
+        self.width   = max(1, width)
+
+    def choices(self, character):
+        """
+        Every (table, corner, algorithm) a character may be deciphered with
+
+        The rules engine's own choice is always first.
+        """
+        algorithm, _ = character.final
+        chosen = (character.table, character.position, algorithm)
+        choices = [chosen]
+        places = [
+            (table, corner) for table in (True, False) for corner in Square.ORDER
+        ] if self.corners else [(character.table, character.position)]
+        for table, corner in places:
+            for which in range(4):
+                if (table, corner, which) != chosen:
+                    choices.append((table, corner, which))
+        return choices
+
+    def letter(self, character, table, corner, algorithm):
+        """ The plaintext letter a character deciphers to with a given choice """
+        if (table, corner) == (character.table, character.position):
+            intermediate = character.intermediate
+        else:
+            intermediate = helpers.i2a(int(character.cipher[table].active_char(corner)))
+        return character.transcribe(algorithm, intermediate)
+
+    @property
+    def options(self):
+        """
+        The letters each position may take
+
+        :return: list with a dict for each position of letter code to the
+                 (table, corner, algorithm) reaching it
+        """
+        if self._options is None:
+            fixed = {}
+            for start, text in self.cribs.items():
+                for offset, letter in enumerate(text.upper()):
+                    fixed[start + offset] = helpers.a2i(letter) - 1
+
+            self._options = []
+            for position, character in enumerate(self.cipher):
+                options = {}
+                for choice in self.choices(character):
+                    options.setdefault(helpers.a2i(self.letter(character, *choice)) - 1, choice)
+                if position in fixed:
+                    if fixed[position] not in options:
+                        raise ValueError('crib letter {} cannot be reached at position {}'.format(
+                            helpers.i2a(fixed[position] + 1), position
+                        ))
+                    options = {fixed[position]: options[fixed[position]]}
+                self._options.append(options)
+        return self._options
+
+    def run(self, top=10):
+        """
+        Search for the best plaintexts
+
+        :param: int top The number of plaintexts to return
+
+        :return: list of dict with the plaintext, its score, the algorithm chosen
+                 for each position as bytes, the (table, corner, algorithm) chosen
+                 for each position, the positions which differ from the rules
+                 engine and the count of them, best first
+        """
+        n = self.scorer.n
+        logp = self.scorer.logp
+        modulus = 26 ** (n - 1)
+        engine = self.cipher.plaintext
+
+        scores = np.zeros(1, dtype=np.float64)
+        tails = np.zeros(1, dtype=np.int64)
+        steps = []
+        for position, options in enumerate(self.options):
+            codes = np.array(list(options.keys()), dtype=np.int64)
+            grams = (tails[:, None] * 26 + codes[None, :]).ravel()
+            expanded = np.repeat(scores, len(codes))
+            # Until the first n-gram is complete nothing is scored, so
+            # every prefix is kept
+            if position >= n - 1:
+                expanded = expanded + logp[grams]
+                keep = np.argsort(-expanded, kind='stable')[:self.width]
+            else:
+                keep = np.arange(len(expanded))
+            scores = expanded[keep]
+            tails = grams[keep] % modulus
+            steps.append((keep // len(codes), codes[keep % len(codes)]))
+
+        results = []
+        for rank in range(min(top, len(scores))):
+            letters = []
+            index = rank
+            for parents, codes in reversed(steps):
+                letters.append(int(codes[index]))
+                index = parents[index]
+            letters.reverse()
+
+            plaintext = ''.join(helpers.i2a(code + 1) for code in letters)
+            changed = [i for i, (a, b) in enumerate(zip(plaintext, engine)) if a != b]
+            choices = [self.options[i][code] for i, code in enumerate(letters)]
+            results.append({
+                'plaintext':  plaintext,
+                'score':      float(scores[rank]),
+                'algorithms': bytes(algorithm for _, _, algorithm in choices),
+                'choices':    choices,
+                'changed':    changed,
+                'changes':    len(changed),
+            })
+        return results
+
+    def as_dataframe(self, top=10):
+        return pd.DataFrame(self.run(top), columns=['plaintext', 'score', 'changes', 'changed'])
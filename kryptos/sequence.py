@@ -0,0 +1,58 @@
+from collections import OrderedDict
+
+class CharacterSequence(object):
+    """
+    A list-like view over the characters of a cipher which builds them on demand
+
+    Characters are only created when indexed. The most recently used are kept in a
+    bounded cache, the least recently used being dropped once the cache is full.
+
+    Any change made to a character which is later dropped from the cache is lost
+    when it is built again.
+    """
+    _factory = None
+    _length  = 0
+    _size    = 0
+    _cache   = None
+
+    def __init__(self, factory, length, size=128):
+        """
+        :param: callable factory Builds the character at a given position (from 0)
+        :param: int      length  The number of characters in the sequence
+        :param: int      size    The maximum number of characters held at once
+        """
+        self._factory = factory
+        self._length  = length
+        self._size    = max(1, size)
+        self._cache   = OrderedDict()
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self[i]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(self._length))]
+
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError('cipher index out of range')
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        character = self._factory(key)
+        self._cache[key] = character
+        if len(self._cache) > self._size:
+            self._cache.popitem(last=False)
+        return character
+
+    @property
+    def materialized(self):
+        """ The positions currently held in the cache, oldest first """
+        return list(self._cache.keys())
@@ -0,0 +1,651 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+from . import helpers
+from .cipher import Cipher
+from .decipher import decipher_range
+
+# ------------------------------------------------------------
+# Ciphers built in this process, most recently used last. Each
+# worker of the service holds its own, warmed as requests for
+# a ciphertext arrive and restored from its snapshot where one
+# has been taken.
+# ------------------------------------------------------------
+ciphers = OrderedDict()
+cache_size = 8
+
+def setup(size, warm=()):
+    """
+    Initialise a worker of the service
+
+    :param: int  size The most ciphers the worker holds
+    :param: list warm (ciphertext, invert) pairs to build before any request
+    """
+    global cache_size
+    cache_size = size
+    for ciphertext, invert in warm:
+        built(ciphertext, invert)
+
+def built(ciphertext, invert=False):
+    """ The cipher for a ciphertext, built once in each worker """
+    key = (ciphertext, invert)
+    if key in ciphers:
+        ciphers.move_to_end(key)
+    else:
+        ciphers[key] = Cipher.cached(ciphertext, invert)
+        while len(ciphers) > cache_size:
+            ciphers.popitem(last=False)
+    return ciphers[key]
+
+def decipher(ciphertext, invert=False):
+    """
+    Decipher a full ciphertext
+
+    :return: dict of the ciphertext and lacuna text deciphered, the plaintext
+             and the algorithm chosen for each character
+    """
+    cipher = built(ciphertext, invert)
+    plaintext, algorithms = cipher.final
+    return {
+        'ciphertext': cipher.ciphertext,
+        'lacunatext': cipher.lacunatext,
+        'plaintext':  plaintext,
+        'algorithms': list(algorithms),
+    }
+
+def decipher_segment(ciphertext, start, stop, invert=False):
+    """
+    Decipher a segment of a ciphertext
+
+    Where the worker already holds the cipher its characters are read, otherwise
+    only the segment is deciphered, see `decipher_range`.
+
+    :return: dict of the start and stop and a list of characters
+    """
+    start, stop, _ = slice(start, stop).indices(len(ciphertext))
+    if (ciphertext, invert) in ciphers:
+        characters = [built(ciphertext, invert)[i] for i in range(start, stop)]
+    else:
+        characters = decipher_range(ciphertext, start, stop, invert)
+    return {
+        'start':      start,
+        'stop':       stop,
+        'characters': [
+            {
+                'index':     character.index,
+                'character': character.character,
+                'plaintext': character.final[1],
+                'algorithm': character.final[0],
+            } for character in characters
+        ],
+    }
+
+def render(ciphertext, position=0, invert=False, key=None):
+    """
+    Render the notebook view of a position
+
+    :param: str  ciphertext
+    :param: int  position   From 0
+    :param: bool invert
+    :param: str  key        A navigation key, as sent by the notebook, to move by
+                            from position before rendering
+
+    :return: dict as returned by `Cipher.render` with the position rendered
+    """
+    cipher = built(ciphertext, invert)
+    if not 0 <= position < cipher.length:
+        raise ValueError('position {} is outside of the cipher'.format(position))
+    cipher.goto(position)
+    if key:
+        cipher.setposition(key)
+    rendered = cipher.render()
+    return dict(
+        {name: [str(html) for html in rendered[name]] if isinstance(rendered[name], list) else str(rendered[name])
+         for name in rendered.keys()},
+        position=cipher._cindex
+    )
+
+# ------------------------------------------------------------
+# WebSocket framing (RFC 6455). Frames from a client are masked,
+# frames from the server are not.
+# ------------------------------------------------------------
+GUID  = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+TEXT  = 0x1
+CLOSE = 0x8
+PING  = 0x9
+PONG  = 0xA
+
+# Not an opcode, returned in place of a frame over the size limit
+TOO_BIG = -1
+
+def accept(key):
+    """ The accept header answering a WebSocket key """
+    return base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+
+def unmask(payload, key):
+    n = len(payload)
+    mask = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(mask, 'big')).to_bytes(n, 'big')
+
+def frame(opcode, payload, mask=False):
+    """ Encode a single final frame """
+    length = len(payload)
+    bit = 0x80 if mask else 0
+    header = bytes([0x80 | opcode])
+    if length < 126:
+        header += bytes([bit | length])
+    elif length < 65536:
+        header += struct.pack('!BH', bit | 126, length)
+    else:
+        header += struct.pack('!BQ', bit | 127, length)
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = unmask(payload, key)
+    return header + payload
+
+def decoder(limit=None):
+    """
+    Decode a frame
+
+    A generator yielding the number of bytes it needs next and sent them in turn,
+    so the same decoder serves the asynchronous server and the blocking client.
+    Returns (final, opcode, payload).
+
+    :param: int limit The largest payload to read. A larger one is left unread and
+                      the opcode returned is TOO_BIG
+    """
+    first, second = yield 2
+    length = second & 0x7f
+    if length == 126:
+        length, = struct.unpack('!H', (yield 2))
+    elif length == 127:
+        length, = struct.unpack('!Q', (yield 8))
+    if limit is not None and length > limit:
+        return True, TOO_BIG, b''
+    key = (yield 4) if second & 0x80 else None
+    payload = (yield length) if length else b''
+    return bool(first & 0x80), first & 0x0f, unmask(payload, key) if key else payload
+
+class Service(object):
+    """
+    Serves decipher, decipher-range and render over HTTP and WebSocket
+
+    Every analyst's kernel otherwise builds its own distance tables and ciphers.
+    The service builds them once, in a pool of worker processes which each keep
+    the ciphers they have built, so the event loop only moves requests and never
+    deciphers. Results are kept in a cache shared by every client, and identical
+    requests arriving together wait on the same piece of work.
+
+        POST /decipher        {"ciphertext": ..., "invert": false}
+        POST /decipher-range  {"ciphertext": ..., "start": 0, "stop": 10, "invert": false}
+        POST /render          {"ciphertext": ..., "position": 0, "invert": false, "key": null}
+        GET  /health
+
+    Operations may also be sent as GET with the arguments in the query string.
+    On `/ws` each WebSocket message is a JSON operation with an `op` and an
+    optional `id` returned with its result. The connection remembers the last
+    ciphertext and position rendered, so navigation is streamed by sending only
+    `{"op": "render", "key": "ArrowRight"}`.
+
+    A request body over `max_body` bytes is refused with 413, and a WebSocket
+    message over it closes the connection with 1009.
+    """
+    OPERATIONS = {
+        'decipher':       (decipher, ('ciphertext', 'invert')),
+        'decipher-range': (decipher_segment, ('ciphertext', 'start', 'stop', 'invert')),
+        'render':         (render, ('ciphertext', 'position', 'invert', 'key')),
+    }
+    STATUS = {
+        200: 'OK',
+        400: 'Bad Request',
+        404: 'Not Found',
+        405: 'Method Not Allowed',
+        413: 'Payload Too Large',
+        500: 'Internal Server Error',
+    }
+
+    host       = '127.0.0.1'
+    port       = 8765
+    workers    = None
+    cache_size = 8
+    results_size = 256
+    warm       = ()
+    max_body   = 16 * 1024 * 1024
+    _executor  = None
+    _results   = None
+    _pending   = None
+    _server    = None
+
+    def __init__(self, host='127.0.0.1', port=8765, workers=None, cache_size=8, results_size=256, warm=(),
+                 max_body=16 * 1024 * 1024):
+        """
+        :param: str  host         The address to listen on
+        :param: int  port         The port to listen on, 0 for any free port
+        :param: int  workers      Worker processes. Defaults to one per CPU. With 0
+                                  the work is done on a single thread of this process
+        :param: int  cache_size   The most ciphers each worker holds
+        :param: int  results_size The most results held by the service
+        :param: list warm         Ciphertexts, or (ciphertext, invert) pairs, every
+                                  worker builds when it starts
+        :param: int  max_body     The largest request body or WebSocket message
+                                  accepted, in bytes
+        """
+        self.host         = host
+        self.port         = port
+        self.workers      = workers
+        self.cache_size   = cache_size
+        self.results_size = results_size
+        self.max_body     = max_body
+        self.warm         = [
+            (w.upper(), False) if isinstance(w, str) else (w[0].upper(), bool(w[1])) for w in warm
+        ]
+        self._results     = OrderedDict()
+        self._pending     = {}
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.workers == 0:
+                self._executor = ThreadPoolExecutor(1, initializer=setup, initargs=(self.cache_size, self.warm))
+            else:
+                self._executor = ProcessPoolExecutor(
+                    self.workers, initializer=setup, initargs=(self.cache_size, self.warm)
+                )
+        return self._executor
+
+    @staticmethod
+    def arguments(names, values):
+        """
+        Validate the arguments of an operation
+
+        :return: tuple of the arguments in order
+        """
+        ciphertext = str(values.get('ciphertext') or '').upper()
+        if not ciphertext or any(c not in helpers.alphabet for c in ciphertext):
+            raise ValueError('ciphertext must be letters A-Z only')
+        converted = {
+            'ciphertext': ciphertext,
+            'invert':     values.get('invert') in (True, 1, '1', 'true', 'True'),
+            'start':      int(values.get('start') or 0),
+            'stop':       int(values['stop']) if values.get('stop') not in (None, '') else None,
+            'position':   int(values.get('position') or 0),
+            'key':        values.get('key') or None,
+        }
+        return tuple(converted[name] for name in names)
+
+    async def call(self, operation, values):
+        """
+        Run an operation on the pool, or answer it from the results held
+
+        :return: dict the result of the operation
+        """
+        if operation not in self.OPERATIONS:
+            raise LookupError('unknown operation {}'.format(operation))
+        function, names = self.OPERATIONS[operation]
+        key = (operation,) + self.arguments(names, values)
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+
+        if key not in self._pending:
+            loop = asyncio.get_running_loop()
+            self._pending[key] = loop.run_in_executor(self.executor, function, *key[1:])
+        try:
+            result = await asyncio.shield(self._pending[key])
+        finally:
+            self._pending.pop(key, None)
+
+        self._results[key] = result
+        while len(self._results) > self.results_size:
+            self._results.popitem(last=False)
+        return result
+
+    def health(self):
+        return {
+            'status':  'ok',
+            'workers': self.workers if self.workers is not None else os.cpu_count(),
+            'results': len(self._results),
+            'pending': len(self._pending),
+        }
+
+    async def respond(self, method, path, query, body):
+        """
+        Answer an HTTP request
+
+        :return: tuple (status, dict)
+        """
+        operation = path.strip('/')
+        if operation == 'health':
+            return 200, self.health()
+        if operation not in self.OPERATIONS:
+            return 404, {'error': 'no such operation {}'.format(path)}
+        if method == 'GET':
+            values = dict(parse_qsl(query))
+        elif method == 'POST':
+            values = json.loads(body or b'{}')
+            if not isinstance(values, dict):
+                raise ValueError('the body must be a JSON object')
+        else:
+            return 405, {'error': 'use GET or POST'}
+        return 200, await self.call(operation, values)
+
+    @staticmethod
+    def send(writer, status, payload):
+        body = json.dumps(payload).encode()
+        writer.write((
+            'HTTP/1.1 {} {}\r\n'
+            'Content-Type: application/json\r\n'
+            'Content-Length: {}\r\n'
+            'Connection: close\r\n\r\n'
+        ).format(status, Service.STATUS[status], len(body)).encode() + body)
+
+    async def handle(self, reader, writer):
+        """ Handle a connection, a single HTTP request or a WebSocket """
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = lines[0].split(' ', 2)
+            headers = {
+                name.strip().lower(): value.strip()
+                for name, value in (line.split(':', 1) for line in lines[1:] if ':' in line)
+            }
+            path, _, query = target.partition('?')
+            if path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                return await self.websocket(reader, writer, headers)
+
+            try:
+                length = int(headers.get('content-length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                status, payload = 400, {'error': 'content-length must be a whole number of bytes'}
+            elif length > self.max_body:
+                status, payload = 413, {'error': 'request body is over {} bytes'.format(self.max_body)}
+            else:
+                body = await reader.readexactly(length)
+                try:
+                    status, payload = await self.respond(method, path, query, body)
+                except (ValueError, TypeError, LookupError) as e:
+                    status, payload = 400, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': '{}: {}'.format(type(e).__name__, e)}
+            self.send(writer, status, payload)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def websocket(self, reader, writer, headers):
+        """ Answer operations sent over a WebSocket until it is closed """
+        writer.write((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Accept: {}\r\n\r\n'
+        ).format(accept(headers.get('sec-websocket-key', ''))).encode())
+        await writer.drain()
+
+        session = {}
+        fragments = []
+        while True:
+            final, opcode, payload = await self.receive(reader, self.max_body - sum(map(len, fragments)))
+            if opcode == TOO_BIG:
+                writer.write(frame(CLOSE, struct.pack('!H', 1009)))
+                await writer.drain()
+                return
+            if opcode == CLOSE:
+                writer.write(frame(CLOSE, payload[:2]))
+                await writer.drain()
+                return
+            if opcode == PING:
+                writer.write(frame(PONG, payload))
+                continue
+            if opcode not in (0, TEXT):
+                continue
+            fragments.append(payload)
+            if not final:
+                continue
+            message, fragments = b''.join(fragments), []
+
+            values = {}
+            try:
+                values = json.loads(message)
+                operation = values.pop('op', 'render')
+                if operation == 'render':
+                    # Anything not sent carries on from the last render
+                    values = dict(session, **{k: v for k, v in values.items() if v is not None})
+                response = {'id': values.get('id'), 'op': operation, 'result': await self.call(operation, values)}
+                if operation == 'render':
+                    session = {
+                        'ciphertext': values['ciphertext'],
+                        'invert':     values.get('invert', False),
+                        'position':   response['result']['position'],
+                    }
+            except Exception as e:
+                response = {'id': values.get('id') if isinstance(values, dict) else None, 'error': str(e)}
+            writer.write(frame(TEXT, json.dumps(response).encode()))
+            await writer.drain()
+
+    @staticmethod
+    async def receive(reader, limit=None):
+        decode = decoder(limit)
+        needed = next(decode)
+        try:
+            while True:
+                needed = decode.send(await reader.readexactly(needed))
+        except StopIteration as done:
+            return done.value
+
+    async def start(self):
+        """ Start listening, returning once the service is ready """
+        self._server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve(self):
+        """ Serve until cancelled """
+        if self._server is None:
+            await self.start()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+class Client(object):
+    """
+    Calls a running service in place of deciphering in this process
+
+        client = Client('http://127.0.0.1:8765')
+        client.decipher('OBKR...')['plaintext']
+
+    Uses only the standard library, so it runs in any notebook kernel.
+    """
+    url     = None
+    timeout = 60
+
+    def __init__(self, url=None, timeout=60):
+        """
+        :param: str   url     The address of the service. Defaults to KRYPTOS_SERVICE
+                              or http://127.0.0.1:8765
+        :param: float timeout Seconds to wait for each response
+        """
+        self.url     = (url or os.environ.get('KRYPTOS_SERVICE') or 'http://127.0.0.1:8765').rstrip('/')
+        self.timeout = timeout
+
+    def request(self, operation, **arguments):
+        """
+        Call an operation of the service
+
+        :return: dict the result
+        :raises: ValueError when the service rejects the request
+        """
+        request = urllib.request.Request(
+            '{}/{}'.format(self.url, operation),
+            data=json.dumps(arguments).encode(),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            error = json.loads(e.read() or b'{}').get('error', e.reason)
+            raise (ValueError if e.code == 400 else RuntimeError)(error) from None
+
+    def decipher(self, ciphertext, invert=False):
+        return self.request('decipher', ciphertext=ciphertext, invert=invert)
+
+    def decipher_range(self, ciphertext, start, stop, invert=False):
+        return self.request('decipher-range', ciphertext=ciphertext, start=start, stop=stop, invert=invert)
+
+    def render(self, ciphertext, position=0, invert=False, key=None):
+        return self.request('render', ciphertext=ciphertext, position=position, invert=invert, key=key)
+
+    def session(self):
+        """
+        Open a WebSocket to the service
+
+        :return: Session
+        """
+        return Session(self.url, self.timeout)
+
+class Session(object):
+    """
+    A WebSocket connection to the service, used to stream renders while navigating
+    """
+    _socket = None
+    _file   = None
+    _id     = 0
+
+    def __init__(self, url, timeout=60):
+        parts = urlsplit(url)
+        self._socket = socket.create_connection((parts.hostname, parts.port or 80), timeout)
+        self._file = self._socket.makefile('rb')
+        key = base64.b64encode(os.urandom(16)).decode()
+        self._socket.sendall((
+            'GET /ws HTTP/1.1\r\n'
+            'Host: {}\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Key: {}\r\n'
+            'Sec-WebSocket-Version: 13\r\n\r\n'
+        ).format(parts.netloc, key).encode())
+
+        head = b''
+        while not head.endswith(b'\r\n\r\n'):
+            line = self._file.readline()
+            if not line:
+                raise ConnectionError('service closed the connection')
+            head += line
+        if b' 101 ' not in head.split(b'\r\n')[0] or accept(key).encode() not in head:
+            self.close()
+            raise ConnectionError('service refused the WebSocket')
+
+    def receive(self):
+        decode = decoder()
+        needed = next(decode)
+        try:
+            while True:
+                data = self._file.read(needed)
+                if len(data) < needed:
+                    raise ConnectionError('service closed the connection')
+                needed = decode.send(data)
+        except StopIteration as done:
+            return done.value
+
+    def send(self, operation, **arguments):
+        """
+        Send an operation and wait for its result
+
+        :return: dict the result
+        :raises: ValueError when the service rejects the operation
+        """
+        self._id += 1
+        self._socket.sendall(frame(TEXT, json.dumps(dict(arguments, op=operation, id=self._id)).encode(), mask=True))
+        fragments = []
+        while True:
+            final, opcode, payload = self.receive()
+            if opcode == PING:
+                self._socket.sendall(frame(PONG, payload, mask=True))
+                continue
+            if opcode == CLOSE:
+                raise ConnectionError('service closed the connection')
+            fragments.append(payload)
+            if final:
+                response = json.loads(b''.join(fragments))
+                fragments = []
+                if response.get('id') != self._id:
+                    continue
+                if 'error' in response:
+                    raise ValueError(response['error'])
+                return response['result']
+
+    def render(self, ciphertext=None, position=None, invert=None, key=None):
+        """
+        Render a position, or move from the last position rendered by a key
+
+        :return: dict as returned by `Cipher.render` with the position rendered
+        """
+        return self.send('render', ciphertext=ciphertext, position=position, invert=invert, key=key)
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.sendall(frame(CLOSE, b'', mask=True))
+            except OSError:
+                pass
+            self._file.close()
+            self._socket.close()
+            self._socket = None
+
+def main(argv=None):
+    """
+    Run the decipher service
+
+        python -m kryptos serve [--host HOST] [--port PORT] [--workers N] [--warm CIPHERTEXT ...]
+    """
+    parser = argparse.ArgumentParser(prog='python -m kryptos serve', description='Serve deciphers to notebooks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU, 0 for none)')
+    parser.add_argument('--cache-size', type=int, default=8, help='ciphers held by each worker')
+    parser.add_argument('--warm', nargs='*', default=[], help='ciphertexts to build when each worker starts')
+    parser.add_argument('--max-body', type=int, default=Service.max_body,
+        help='largest request body or WebSocket message in bytes (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    service = Service(args.host, args.port, args.workers, args.cache_size, warm=args.warm, max_body=args.max_body)
+
+    async def run():
+        await service.start()
+        print('serving on http://{}:{}'.format(service.host, service.port), flush=True)
+        await service.serve()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
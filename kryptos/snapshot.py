@@ -0,0 +1,260 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from . import __version__, helpers, Table, Character
+
+class Snapshot(object):
+    """
+    A versioned binary snapshot of a fully built cipher
+
+    The snapshot holds both tables, the grid references and highlight state of
+    every square, the rule outputs of every character and the final plaintext.
+    Loading one restores the cipher without calculating distances, creating tables
+    or running any rules.
+
+    File layout:
+
+        MAGIC | format (u32) | header length (u32) | JSON header | arrays
+
+    The header describes each array by dtype, shape and offset. Arrays are aligned
+    to 8 bytes and read straight out of a read-only memory map of the file.
+
+    Snapshots are keyed by a hash of the ciphertext, the library version and a hash
+    of the source of the modules which decide the plaintext. Editing any of those
+    modules gives a new key, so stale snapshots are never loaded.
+    """
+    MAGIC  = b'KRYPTOS\x00'
+    FORMAT = 1
+
+    # Corners are stored as codes with 0 meaning not set
+    CORNERS = [None, 'tl', 'tr', 'br', 'bl']
+
+    # Modules whose source decides the plaintext
+    SOURCES = ['helpers.py', 'table.py', 'square.py', 'character.py', 'rulesengine.py', 'jit.py']
+
+    # Square state stored as corner codes, with the value used when not set
+    SQUARE_CORNERS = {
+        'cipher_active': False,
+        'lacuna_active': False,
+        'active':        None,
+        'lacuna':        None,
+    }
+
+    header  = None
+    arrays  = None
+    _buffer = None
+
+    def __init__(self, header, arrays, buffer=None):
+        self.header  = header
+        self.arrays  = arrays
+        self._buffer = buffer
+
+    @staticmethod
+    def rules_hash():
+        """ Hash the source of every module the plaintext depends on """
+        digest = hashlib.sha256()
+        for name in Snapshot.SOURCES:
+            with open(os.path.join(os.path.dirname(__file__), name), 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def key(ciphertext, invert=False):
+        """ The hash of the ciphertext the snapshot is stored against """
+        return hashlib.sha256(
+            '{}:{}'.format(ciphertext.upper(), int(bool(invert))).encode()
+        ).hexdigest()[:32]
+
+    @staticmethod
+    def path(ciphertext, invert=False):
+        """ The file a snapshot for the ciphertext is stored in """
+        return os.path.join(
+            helpers.cache_dir('snapshots'),
+            '{}-{}-{}.kry'.format(Snapshot.key(ciphertext, invert), __version__, Snapshot.rules_hash())
+        )
+
+    @classmethod
+    def from_cipher(cls, cipher, invert=False):
+        """
+        Take a snapshot of a built cipher
+
+        :param: Cipher cipher
+        :param: bool   invert Whether the cipher was built with invert set
+
+        :return: Snapshot
+        """
+        corner = cls.CORNERS.index
+        states = [character.state for character in cipher]
+        n = len(states)
+
+        arrays = {
+            'polarity':        np.array([s['polarity'] for s in states], dtype=np.bool_),
+            'table':           np.array([s['table'] for s in states], dtype=np.bool_),
+            'position':        np.array([corner(s['position']) for s in states], dtype=np.uint8),
+            'intermediate':    np.array([helpers.a2i(s['intermediate']) for s in states], dtype=np.uint8),
+            'algorithm':       np.array([s['algorithm'] for s in states], dtype=np.uint8),
+            'lacuna_table':    np.array([
+                -1 if not s['deciphered_lacuna'] else int(s['deciphered_lacuna']['table'])
+                for s in states
+            ], dtype=np.int8),
+            'lacuna_position': np.array([
+                corner(s['deciphered_lacuna']['position']) if s['deciphered_lacuna'] else 0
+                for s in states
+            ], dtype=np.uint8),
+            'grid':            np.array([
+                [s['squares'][key]['grid'] for key in (True, False)] for s in states
+            ], dtype=np.uint8).reshape(n, 2, 4),
+            'mapped':          np.array([
+                [s['squares'][key]['mapped'] for key in (True, False)] for s in states
+            ], dtype=np.bool_).reshape(n, 2),
+            'cipher':          np.array([
+                [s['squares'][key]['cipher'] or 0 for key in (True, False)] for s in states
+            ], dtype=np.uint8).reshape(n, 2),
+        }
+        for name in cls.SQUARE_CORNERS.keys():
+            arrays[name] = np.array([
+                [corner(s['squares'][key][name] or None) for key in (True, False)] for s in states
+            ], dtype=np.uint8).reshape(n, 2)
+
+        for key, name in ((True, 'table_even'), (False, 'table_mixed')):
+            arrays[name] = np.asarray(
+                Table.shared(cipher.ciphertext, key).table.values, dtype=np.int8
+            )
+
+        header = {
+            'version':    __version__,
+            'rules':      cls.rules_hash(),
+            'ciphertext': cipher.ciphertext,
+            'lacunatext': cipher.lacunatext,
+            'invert':     bool(invert),
+            'plaintext':  cipher.plaintext,
+        }
+        return cls(header, arrays)
+
+    def save(self, path):
+        """
+        Write the snapshot to path
+
+        Any older snapshots of the same ciphertext are removed.
+        """
+        arrays = {}
+        offset = 0
+        for name, array in self.arrays.items():
+            array = np.ascontiguousarray(array)
+            arrays[name] = {
+                'dtype':  array.dtype.str,
+                'shape':  list(array.shape),
+                'offset': offset,
+            }
+            offset += (array.nbytes + 7) // 8 * 8
+
+        header = dict(self.header, arrays=arrays)
+        encoded = json.dumps(header).encode()
+        encoded += b' ' * (-(len(self.MAGIC) + 8 + len(encoded)) % 8)
+
+        data = bytearray(self.MAGIC + struct.pack('<II', self.FORMAT, len(encoded)) + encoded)
+        for name, array in self.arrays.items():
+            data += np.ascontiguousarray(array).tobytes()
+            data += b'\x00' * (-len(data) % 8)
+        helpers.atomic_write(path, bytes(data))
+
+        prefix = os.path.basename(path).split('-')[0] + '-'
+        for name in os.listdir(os.path.dirname(path)):
+            if name.startswith(prefix) and name != os.path.basename(path):
+                os.unlink(os.path.join(os.path.dirname(path), name))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory map the snapshot at path
+
+        :return: Snapshot or None if the file is missing or out of date
+        """
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            start = len(cls.MAGIC) + 8
+            if buffer[:len(cls.MAGIC)] != cls.MAGIC:
+                return None
+            fmt, length = struct.unpack('<II', buffer[len(cls.MAGIC):start])
+            if fmt != cls.FORMAT:
+                return None
+            header = json.loads(buffer[start:start + length])
+        except (struct.error, ValueError):
+            return None
+
+        if header['version'] != __version__ or header['rules'] != cls.rules_hash():
+            return None
+
+        base = start + length
+        arrays = {
+            name: np.frombuffer(
+                buffer,
+                dtype=np.dtype(spec['dtype']),
+                count=int(np.prod(spec['shape'])),
+                offset=base + spec['offset'],
+            ).reshape(spec['shape'])
+            for name, spec in header.pop('arrays').items()
+        }
+        return cls(header, arrays, buffer)
+
+    def __len__(self):
+        return len(self.header['ciphertext'])
+
+    def tables(self):
+        """ Restore both tables as the shared tables for the ciphertext """
+        for key, name in ((True, 'table_even'), (False, 'table_mixed')):
+            Table.restore(self.header['ciphertext'], key, self.arrays[name])
+
+    def polarities(self):
+        """ The polarity flag of every character """
+        return [bool(p) for p in self.arrays['polarity']]
+
+    def character(self, position):
+        """
+        Restore the character at a given position
+
+        :param: int position The position in the cipher, from 0
+
+        :return: Character
+        """
+        a = self.arrays
+        ciphertext = self.header['ciphertext']
+        intermediate = helpers.i2a(int(a['intermediate'][position]))
+        squares = {}
+        for i, key in enumerate((True, False)):
+            squares[key] = {
+                'character': ciphertext[position],
+                'polarity':  key,
+                'map':       bool(a['polarity'][position]),
+                'grid':      [int(g) for g in a['grid'][position][i]],
+                'mapped':    bool(a['mapped'][position][i]),
+                'cipher':    int(a['cipher'][position][i]) or None,
+            }
+            for name, default in self.SQUARE_CORNERS.items():
+                squares[key][name] = self.CORNERS[a[name][position][i]] or default
+
+        lacuna_table = int(a['lacuna_table'][position])
+        return Character.restore({
+            'character':    ciphertext[position],
+            'index':        position + 1,
+            'polarity':     bool(a['polarity'][position]),
+            'table':        bool(a['table'][position]),
+            'position':     self.CORNERS[a['position'][position]],
+            'intermediate': intermediate,
+            'algorithm':    int(a['algorithm'][position]),
+            'plaintext':    self.header['plaintext'][position],
+            'deciphered_lacuna': {} if lacuna_table < 0 else {
+                'position': self.CORNERS[a['lacuna_position'][position]],
+                'value':    helpers.distancefrom(intermediate, 'Z'),
+                'table':    bool(lacuna_table),
+            },
+            'squares': squares,
+        }, ciphertext)
@@ -1,5 +1,5 @@
 import pandas as pd
-from . import Table, Highlighter, helpers
+from . import Table, Highlighter, helpers, profiling
 
 class Square(object):
     """
@@ -36,17 +36,22 @@ class Square(object):
     def __init__(self, character, polarity, map, ciphertext):
         self.character = character
         character_index = helpers.a2i(character)
-        self.table = Table(ciphertext, polarity)
+        self.table = Table.shared(ciphertext, polarity)
         self.map = map
         self.tl = self.bl = self.tr = self.br = ''
 
-    def plot(self):
+    @profiling.stage('Square.plot')
+    def plot(self, replace=None):
         """
         Plot the grid using the current character, the polarity and whether the
         current character is to be replaced or not
+
+        :param: dict replace The replacement characters to plot with. Defaults to
+                             those of the table
         """
-        self.table.create()
-        self.replace = self.table.keys['replace']
+        self.replace = replace if replace is not None else self.table.keys['replace']
+        self.cipher_active = self.lacuna_active = False
+        self._cipher = None
 
         mapchar = self.replace[self.character] \
             if self.map and self.character in self.replace.keys() \
@@ -89,9 +94,50 @@ class Square(object):
         self.tr = self.table.loc[self._grid[1], self._grid[2]]
         self.bl = self.table.loc[self._grid[3], self._grid[0]]
         self.br = self.table.loc[self._grid[3], self._grid[2]]
-        self._highlight = Highlighter(self.table, self.gridref)
+        self._highlight = None
         self.markcipher(self.character)
 
+    @property
+    def state(self):
+        """
+        The plotted and highlight state of the square as plain values
+        """
+        return {
+            'character':     self.character,
+            'polarity':      self.table.polarity,
+            'map':           self.map,
+            'grid':          list(self._grid),
+            'mapped':        self.mapped,
+            'cipher_active': self.cipher_active,
+            'lacuna_active': self.lacuna_active,
+            'active':        self._active,
+            'lacuna':        self._lacuna,
+            'cipher':        self._cipher,
+        }
+
+    @classmethod
+    def restore(cls, state, ciphertext):
+        """
+        Recreate a plotted square from its state without plotting it again
+
+        :param: dict state       As returned by `Square.state`
+        :param: str  ciphertext  The text the shared table was created from
+        """
+        square = cls(state['character'], state['polarity'], state['map'], ciphertext)
+        square.replace       = square.table.keys['replace']
+        square.mapped        = state['mapped']
+        square._grid         = list(state['grid'])
+        square.tl = square.table.loc[square._grid[1], square._grid[0]]
+        square.tr = square.table.loc[square._grid[1], square._grid[2]]
+        square.bl = square.table.loc[square._grid[3], square._grid[0]]
+        square.br = square.table.loc[square._grid[3], square._grid[2]]
+        square.cipher_active = state['cipher_active']
+        square.lacuna_active = state['lacuna_active']
+        square._active       = state['active']
+        square._lacuna       = state['lacuna']
+        square._cipher       = state['cipher']
+        return square
+
     def get(self):
         """
         Return the current grid, clockwise from top left
@@ -112,7 +158,6 @@ class Square(object):
         pos = ''
         if char in self.get():
             pos = Square.ORDER[self.get().index(char)]
-            self._highlight.cipher(pos)
 
             if recurse:
                 self.cipher_active = pos
@@ -168,9 +213,18 @@ class Square(object):
 
     @property
     def apply(self):
+        """
+        Render the grid with the current highlight state
+
+        Highlight state is held on the square as plain corner positions. The
+        Highlighter is only created the first time the square is drawn so
+        deciphering without a display never builds any style objects.
+        """
+        if not self._highlight:
+            self._highlight = Highlighter(self.table, self.gridref)
         self._highlight.active(self._active)
         self._highlight.cipher(self.cipher_active)
         self._highlight.cipher_lacuna(self.lacuna_active)
         if self._lacuna:
             self._highlight.active_lacuna(self._lacuna)
-        return self._highlight.apply()
+        return self._highlight.render()
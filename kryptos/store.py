@@ -0,0 +1,226 @@
+import argparse
+import hashlib
+import io
+import os
+import time
+import numpy as np
+from . import helpers
+
+class DistanceStore(object):
+    """
+    A store of distance matrices held as `.npy` files
+
+    Each entry is named `<key>.npy` where the key is a hash of the start and end
+    text the distances were calculated from, so an entry is found without listing
+    the store. A hash of the matrix itself is written beside it as `<key>.sha256`
+    for `verify`. Entries are opened as read-only memory maps so any number of
+    processes reading the same entry share the same physical pages.
+
+    Entries are written to a temporary file and renamed into place, so a reader
+    never sees a partly written entry and concurrent writers of the same entry
+    simply replace one complete copy with another. The digest is written once the
+    entry is in place, so `prune` leaves entries and temporary files younger than
+    `GRACE` seconds alone in case they are still being written.
+    """
+    SUFFIX = '.npy'
+    DIGEST = '.sha256'
+    GRACE  = 3600
+
+    _path = None
+
+    def __init__(self, path=None):
+        """
+        :param: str path The directory holding the store. Defaults to the
+                         `distances` directory under `helpers.cache_dir`
+        """
+        self._path = path
+
+    @property
+    def path(self):
+        if not self._path:
+            self._path = helpers.cache_dir('distances')
+        os.makedirs(self._path, exist_ok=True)
+        return self._path
+
+    @staticmethod
+    def key(start, end):
+        """ The hash of the text a matrix is calculated from """
+        return hashlib.sha256('{}:{}'.format(start, end).encode()).hexdigest()[:32]
+
+    @staticmethod
+    def digest(matrix):
+        """ The hash of the contents of a matrix """
+        matrix = np.ascontiguousarray(matrix)
+        digest = hashlib.sha256(str(matrix.shape).encode())
+        digest.update(matrix.tobytes())
+        return digest.hexdigest()[:32]
+
+    def find(self, start, end):
+        """ Returns the file holding the matrix for start and end, or None """
+        path = os.path.join(self.path, self.key(start, end) + self.SUFFIX)
+        return path if os.path.exists(path) else None
+
+    def get(self, start, end):
+        """
+        Memory map the matrix for start and end
+
+        :return: numpy.memmap or None if the store holds no matrix for the pair
+        """
+        path = self.find(start, end)
+        if path is None:
+            return None
+        try:
+            return np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def put(self, start, end, matrix):
+        """
+        Add a matrix to the store
+
+        :return: str the path of the entry
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.uint8)
+        buffer = io.BytesIO()
+        np.save(buffer, matrix)
+        path = os.path.join(self.path, self.key(start, end))
+        helpers.atomic_write(path + self.SUFFIX, buffer.getvalue())
+        helpers.atomic_write(path + self.DIGEST, self.digest(matrix).encode('ascii'))
+        return path + self.SUFFIX
+
+    def entries(self):
+        """
+        List every entry in the store
+
+        :return: list of dict with the key, digest, path, size and modified time.
+                 The digest is None where it is missing
+        """
+        entries = []
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(self.SUFFIX) or name.startswith('.'):
+                continue
+            key = name[:-len(self.SUFFIX)]
+            path = os.path.join(self.path, name)
+            try:
+                with open(os.path.join(self.path, key + self.DIGEST)) as f:
+                    digest = f.read().strip()
+            except OSError:
+                digest = None
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append({
+                'key':      key,
+                'digest':   digest,
+                'path':     path,
+                'size':     stat.st_size,
+                'modified': stat.st_mtime,
+            })
+        return entries
+
+    def verify(self, entry):
+        """
+        Check an entry can be loaded and its contents match its digest
+
+        :return: str describing the problem, or None if the entry is valid
+        """
+        try:
+            matrix = np.load(entry['path'], mmap_mode='r')
+        except (OSError, ValueError) as e:
+            return 'unreadable: {}'.format(e)
+        if matrix.dtype != np.uint8 or matrix.ndim != 2:
+            return 'unexpected array {} {}'.format(matrix.dtype, matrix.shape)
+        if entry['digest'] is None:
+            return 'missing digest'
+        if self.digest(matrix) != entry['digest']:
+            return 'digest mismatch'
+        return None
+
+    def prune(self, older_than=None, invalid=True):
+        """
+        Remove entries from the store
+
+        :param: float older_than Remove entries not modified for this many days
+        :param: bool  invalid    Remove entries which fail verification and any
+                                 temporary files left behind by failed writes
+
+        :return: list of removed paths
+
+        Entries without a digest and temporary files are only removed once they
+        are older than `GRACE`, as a writer may not have finished with them.
+        """
+        removed = []
+        now = time.time()
+        cutoff = now - (older_than * 86400) if older_than is not None else None
+        for entry in self.entries():
+            problem = invalid and self.verify(entry)
+            if problem and entry['digest'] is None and entry['modified'] > now - self.GRACE:
+                problem = None
+            if (cutoff is not None and entry['modified'] < cutoff) or problem:
+                removed.extend(self.unlink(entry['path']))
+
+        # Digests whose entry is gone, and with invalid, temporary
+        # files left behind by failed writes
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            orphaned = name.endswith(self.DIGEST) \
+                and not os.path.exists(path[:-len(self.DIGEST)] + self.SUFFIX)
+            abandoned = invalid and name.startswith('.tmp-') and self.older(path, now - self.GRACE)
+            if orphaned or abandoned:
+                removed.extend(self.unlink(path))
+        return removed
+
+    @staticmethod
+    def older(path, cutoff):
+        """ Whether path was last modified before cutoff. False if it is gone """
+        try:
+            return os.stat(path).st_mtime < cutoff
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def unlink(path):
+        """ Remove path, returning it in a list, or an empty list if it is already gone """
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return []
+        return [path]
+
+def main(argv=None):
+    """
+    Command line interface to the distance store
+
+        python -m kryptos store list
+        python -m kryptos store verify
+        python -m kryptos store prune [--older-than DAYS] [--keep-invalid]
+    """
+    parser = argparse.ArgumentParser(prog='python -m kryptos store', description='Manage the distance store')
+    parser.add_argument('--path', help='store directory (default: %(default)s)', default=None)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='list every entry')
+    commands.add_parser('verify', help='check every entry against its digest')
+    prune = commands.add_parser('prune', help='remove old or invalid entries')
+    prune.add_argument('--older-than', type=float, metavar='DAYS', help='remove entries older than DAYS')
+    prune.add_argument('--keep-invalid', action='store_true', help='keep entries failing verification')
+    args = parser.parse_args(argv)
+
+    store = DistanceStore(args.path)
+    if args.command == 'list':
+        for entry in store.entries():
+            print('{key}  {0:<32}  {size:>10}  {1}'.format(
+                entry['digest'] or '-',
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['modified'])), **entry
+            ))
+    elif args.command == 'verify':
+        failed = 0
+        for entry in store.entries():
+            problem = store.verify(entry)
+            failed += 1 if problem else 0
+            print('{}  {}'.format(entry['key'], problem or 'ok'))
+        return 1 if failed else 0
+    elif args.command == 'prune':
+        for path in store.prune(args.older_than, not args.keep_invalid):
+            print('removed {}'.format(path))
+    return 0
@@ -0,0 +1,490 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+import pandas as pd
+from . import fitness
+from .results import ResultStore, Transaction
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id       INTEGER PRIMARY KEY,
+    status   TEXT NOT NULL DEFAULT 'pending',
+    worker   TEXT,
+    claimed  REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY,
+    chunk         INTEGER NOT NULL REFERENCES chunks(id),
+    configuration TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    job    INTEGER PRIMARY KEY REFERENCES jobs(id),
+    digest BLOB,
+    score  REAL,
+    result TEXT,
+    error  TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_status ON chunks(status);
+CREATE INDEX IF NOT EXISTS jobs_chunk ON jobs(chunk);
+'''
+
+# ------------------------------------------------------------
+# The ciphers and explorers held by each worker process, built
+# once for each ciphertext and kept for every later chunk.
+# ------------------------------------------------------------
+explorers = {}
+
+def decipher(configuration):
+    """
+    The default task of a sweep, decipher a single configuration
+
+    :param: dict configuration The `ciphertext`, optionally `invert` and a
+                               `replace` map, see `ReplacementExplorer`
+
+    :return: dict with at least the `plaintext`
+    """
+    from .cipher import Cipher
+    from .variants import ReplacementExplorer
+
+    key = (configuration['ciphertext'].upper(), bool(configuration.get('invert', False)))
+    if key not in explorers:
+        # Plaintexts are scored by the sweep, once each
+        explorers[key] = ReplacementExplorer(Cipher.cached(*key))
+        explorers[key].scorer = None
+    explorer = explorers[key]
+
+    if configuration.get('replace') is None:
+        return {'plaintext': explorer.cipher.plaintext}
+    result = explorer.evaluate(configuration['replace'])
+    return {
+        'plaintext': result['plaintext'],
+        'changed':   result['changed'],
+    }
+
+def resolve(task):
+    """ The function named by a task, as `module:function` """
+    module, _, name = task.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+def work(path, lease):
+    """
+    Claim and run chunks of a sweep until none are left
+
+    Run in each worker process. A worker whose runner has died stops once its
+    chunk is stored, leaving the rest to the next run.
+    """
+    sweep = Sweep(path, lease=lease)
+    task = resolve(sweep.meta('task'))
+    scorer = fitness.scorer or (fitness.default() if os.environ.get('KRYPTOS_NGRAMS') else None)
+    parent = os.getppid()
+    while os.getppid() == parent:
+        chunk = sweep.claim()
+        if chunk is None:
+            return
+        sweep.complete(chunk, [
+            (job, configuration, sweep.run_job(task, configuration)) for job, configuration in sweep.jobs(chunk)
+        ], scorer)
+
+class Sweep(object):
+    """
+    A sweep over many configurations held in a SQLite file, run by a pool of
+    worker processes and resumable after a crash
+
+    Configurations are split into chunks. Each worker claims a chunk, runs the
+    task over every configuration in it and writes the results and marks the
+    chunk done in a single transaction, so a chunk's results are either all
+    stored or not at all. A chunk claimed by a process which has since died,
+    or held longer than the lease, is claimed again, so a sweep started again
+    after a crash carries on from the first chunk not done.
+
+        sweep = Sweep.create('k4.sweep', (
+            {'ciphertext': K4, 'replace': r} for r in ReplacementExplorer.variants()
+        ))
+        sweep.run(workers=8)
+        sweep.as_dataframe(top=20)
+
+    A task raising for a configuration does not fail its chunk, the error is
+    stored as the result of that configuration.
+
+    Plaintexts are kept in a `ResultStore`, by default inside the sweep file,
+    so each unique plaintext is stored and scored once. Sweeps sharing a store
+    can be compared run against run.
+    """
+    TASK = 'kryptos.sweep:decipher'
+
+    path   = None
+    lease  = 3600
+    _connection = None
+    _store = None
+
+    def __init__(self, path, lease=3600):
+        """
+        :param: str   path  The SQLite file holding the sweep
+        :param: float lease Seconds a chunk may stay claimed before it is claimed again
+        """
+        self.path  = path
+        self.lease = lease
+
+    @classmethod
+    def create(cls, path, configurations, task=None, chunk_size=64, store=None, run=None):
+        """
+        Create a sweep, or add configurations to an existing one
+
+        :param: str      path
+        :param: iterable configurations JSON serialisable dicts
+        :param: str      task           The function run for each configuration as
+                                        `module:function`. Defaults to `decipher`
+        :param: int      chunk_size     Configurations claimed by a worker at once
+        :param: str      store          The result store file. Defaults to the sweep file
+        :param: str      run            The name of the run in the store. Defaults to
+                                        the name of the sweep file
+
+        :return: Sweep
+        """
+        sweep = cls(path)
+        if sweep.meta('task') is None:
+            sweep.set_meta('task', task or cls.TASK)
+            sweep.set_meta('created', time.time())
+            sweep.set_meta('store', os.path.abspath(store or path))
+            sweep.set_meta('run', run or os.path.splitext(os.path.basename(path))[0])
+            sweep.store.register(sweep.meta('run'))
+        elif task and task != sweep.meta('task'):
+            raise ValueError('sweep {} already runs {}'.format(path, sweep.meta('task')))
+        sweep.add(configurations, chunk_size)
+        return sweep
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = ResultStore(self.meta('store') or self.path)
+        return self._store
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def meta(self, key):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def add(self, configurations, chunk_size=64):
+        """
+        Add configurations as new chunks
+
+        :return: int the number of configurations added
+        """
+        added = 0
+        chunk = []
+        with self.transaction() as connection:
+            for configuration in configurations:
+                chunk.append(json.dumps(configuration, sort_keys=True))
+                if len(chunk) == chunk_size:
+                    added += self.insert(connection, chunk)
+                    chunk = []
+            if chunk:
+                added += self.insert(connection, chunk)
+        return added
+
+    @staticmethod
+    def insert(connection, configurations):
+        chunk = connection.execute('INSERT INTO chunks DEFAULT VALUES').lastrowid
+        connection.executemany(
+            'INSERT INTO jobs (chunk, configuration) VALUES (?, ?)',
+            [(chunk, configuration) for configuration in configurations]
+        )
+        return len(configurations)
+
+    def transaction(self):
+        return Transaction(self.connection)
+
+    @staticmethod
+    def worker():
+        return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    def release(self):
+        """
+        Return chunks claimed by processes on this host which are no longer running
+
+        :return: int the number of chunks released
+        """
+        host = socket.gethostname()
+        released = []
+        with self.transaction() as connection:
+            for chunk, worker in connection.execute(
+                "SELECT id, worker FROM chunks WHERE status = 'claimed'"
+            ).fetchall():
+                name, _, pid = worker.rpartition(':')
+                if name == host and not alive(int(pid)):
+                    released.append((chunk,))
+            connection.executemany(
+                "UPDATE chunks SET status = 'pending', worker = NULL, claimed = NULL WHERE id = ?", released
+            )
+        return len(released)
+
+    def claim(self):
+        """
+        Claim the next chunk to run
+
+        :return: int the chunk, or None when every chunk is done or claimed
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            row = connection.execute(
+                "SELECT id FROM chunks WHERE status = 'pending' OR (status = 'claimed' AND claimed < ?) "
+                'ORDER BY id LIMIT 1', (now - self.lease,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE chunks SET status = 'claimed', worker = ?, claimed = ?, attempts = attempts + 1 WHERE id = ?",
+                (self.worker(), now, row[0])
+            )
+        return row[0]
+
+    def jobs(self, chunk):
+        """ The (job, configuration) pairs of a chunk """
+        return [
+            (job, json.loads(configuration)) for job, configuration in self.connection.execute(
+                'SELECT id, configuration FROM jobs WHERE chunk = ? ORDER BY id', (chunk,)
+            )
+        ]
+
+    @staticmethod
+    def run_job(task, configuration):
+        try:
+            return task(configuration)
+        except Exception as e:
+            return {'error': '{}: {}'.format(type(e).__name__, e)}
+
+    def complete(self, chunk, results, scorer=None):
+        """
+        Store the results of a chunk and mark it done, as one transaction
+
+        Plaintexts go to the result store first, scoring those not seen before.
+        Storing them again is harmless, so a crash between the two leaves the
+        chunk to be run again. A chunk claimed again by another worker after its
+        lease ran out is stored by whichever finishes first.
+
+        :param: int     chunk
+        :param: list    results (job, configuration, dict) for each job
+        :param: Fitness scorer
+        """
+        deciphered = [
+            (configuration, result['plaintext']) for _, configuration, result in results if 'plaintext' in result
+        ]
+        scored = iter(self.store.put(self.meta('run'), deciphered, scorer))
+        rows = []
+        for job, _, result in results:
+            digest, score = next(scored) if 'plaintext' in result else (None, None)
+            rows.append((
+                job,
+                digest,
+                score,
+                json.dumps({k: v for k, v in result.items() if k not in ('plaintext', 'score')}, sort_keys=True),
+                result.get('error'),
+            ))
+
+        with self.transaction() as connection:
+            status, = connection.execute('SELECT status FROM chunks WHERE id = ?', (chunk,)).fetchone()
+            if status == 'done':
+                return
+            connection.executemany(
+                'INSERT OR REPLACE INTO results (job, digest, score, result, error) VALUES (?, ?, ?, ?, ?)', rows
+            )
+            connection.execute(
+                "UPDATE chunks SET status = 'done', finished = ? WHERE id = ?", (time.time(), chunk)
+            )
+
+    def progress(self):
+        """
+        :return: dict of the chunks and jobs in total and done, the jobs which
+                 failed and the unique plaintexts found
+        """
+        counts = dict(self.connection.execute('SELECT status, COUNT(*) FROM chunks GROUP BY status').fetchall())
+        jobs, = self.connection.execute('SELECT COUNT(*) FROM jobs').fetchone()
+        done, failed, unique = self.connection.execute(
+            'SELECT COUNT(*), COUNT(error), COUNT(DISTINCT digest) FROM results'
+        ).fetchone()
+        return {
+            'chunks':  sum(counts.values()),
+            'done':    counts.get('done', 0),
+            'claimed': counts.get('claimed', 0),
+            'jobs':    jobs,
+            'results': done,
+            'failed':  failed,
+            'unique':  unique,
+        }
+
+    def run(self, workers=None, interval=5, report=None):
+        """
+        Run every chunk not yet done across a pool of worker processes
+
+        Chunks left claimed by a crashed run on this host are released first.
+        Progress is reported every `interval` seconds until the sweep is done.
+
+        :param: int      workers  Worker processes. Defaults to one per CPU
+        :param: float    interval Seconds between reports
+        :param: callable report   Given the progress with its `rate` in jobs each
+                                  second and `eta` in seconds. Defaults to printing it
+
+        :return: dict the final progress
+        """
+        report = report or (lambda p: print(
+            'chunks {done}/{chunks}  jobs {results}/{jobs}  unique {unique}  failed {failed}  {rate:.1f} jobs/s  eta {eta}'.format(
+                **dict(p, eta='{:.0f}s'.format(p['eta']) if p['eta'] is not None else '-')
+            ), flush=True
+        ))
+        self.release()
+        started, at_start = time.time(), self.progress()['results']
+
+        context = multiprocessing.get_context()
+        processes = [
+            context.Process(target=work, args=(self.path, self.lease), daemon=True)
+            for _ in range(workers or os.cpu_count() or 1)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            while any(process.is_alive() for process in processes):
+                for process in processes:
+                    process.join(timeout=interval / len(processes))
+                report(self.measure(started, at_start))
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+        return self.measure(started, at_start)
+
+    def measure(self, started, at_start):
+        progress = self.progress()
+        elapsed = max(time.time() - started, 1e-9)
+        rate = (progress['results'] - at_start) / elapsed
+        remaining = progress['jobs'] - progress['results']
+        return dict(progress, rate=rate, eta=remaining / rate if rate else None)
+
+    def results(self):
+        """
+        :yield: tuple (configuration, result) for every configuration done, the
+                result holding its plaintext and score
+        """
+        rows = self.connection.execute(
+            'SELECT jobs.configuration, results.digest, results.score, results.result '
+            'FROM results JOIN jobs ON jobs.id = results.job ORDER BY jobs.id'
+        ).fetchall()
+        plaintexts = self.store.plaintexts({digest for _, digest, _, _ in rows if digest is not None})
+        for configuration, digest, score, result in rows:
+            result = json.loads(result)
+            if digest is not None:
+                result.update(plaintext=plaintexts.get(digest), score=score)
+            yield json.loads(configuration), result
+
+    def as_dataframe(self, top=None):
+        """ The results, best scoring first """
+        rows = self.connection.execute(
+            'SELECT jobs.configuration, results.score, results.digest, results.error '
+            'FROM results JOIN jobs ON jobs.id = results.job '
+            'ORDER BY results.score IS NULL, results.score DESC, jobs.id' + (' LIMIT ?' if top else ''),
+            (top,) if top else ()
+        ).fetchall()
+        plaintexts = self.store.plaintexts({digest for _, _, digest, _ in rows if digest is not None})
+        return pd.DataFrame([
+            (configuration, score, plaintexts.get(digest), error) for configuration, score, digest, error in rows
+        ], columns=['Configuration', 'Score', 'Plaintext', 'Error'])
+
+def alive(pid):
+    """ Whether a process is running on this host """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def main(argv=None):
+    """
+    Command line interface to sweeps
+
+        python -m kryptos sweep create PATH CIPHERTEXT [--sources MVZK] [--targets ...] [--fixed ZV] [--size N]
+                                       [--store PATH] [--run NAME]
+        python -m kryptos sweep run PATH [--workers N] [--interval SECONDS]
+        python -m kryptos sweep status PATH
+        python -m kryptos sweep top PATH [-n 20]
+    """
+    parser = argparse.ArgumentParser(prog='python -m kryptos sweep', description='Run resumable sweeps')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='sweep the replacement maps of a ciphertext')
+    create.add_argument('path')
+    create.add_argument('ciphertext')
+    create.add_argument('--invert', action='store_true')
+    create.add_argument('--sources', help='letters which may be replaced')
+    create.add_argument('--targets', help='letters they may be replaced with')
+    create.add_argument('--fixed', nargs='*', default=[], metavar='PAIR', help='replacements every map holds, as ZV')
+    create.add_argument('--size', type=int, help='replacements in each map')
+    create.add_argument('--chunk-size', type=int, default=64)
+    create.add_argument('--store', help='result store shared with other sweeps (default: the sweep file)')
+    create.add_argument('--run', help='name of the run in the store (default: the sweep file name)')
+    run = commands.add_parser('run', help='run, or resume, a sweep')
+    run.add_argument('path')
+    run.add_argument('--workers', type=int)
+    run.add_argument('--interval', type=float, default=5)
+    status = commands.add_parser('status', help='show the progress of a sweep')
+    status.add_argument('path')
+    top = commands.add_parser('top', help='show the best results')
+    top.add_argument('path')
+    top.add_argument('-n', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command != 'create' and not os.path.exists(args.path):
+        print('no sweep at {}'.format(args.path))
+        return 1
+
+    if args.command == 'create':
+        from .variants import ReplacementExplorer
+        variants = ReplacementExplorer.variants(
+            args.sources, args.targets, {pair[0]: pair[1] for pair in args.fixed}, args.size
+        )
+        sweep = Sweep.create(args.path, (
+            {'ciphertext': args.ciphertext.upper(), 'invert': args.invert, 'replace': replace}
+            for replace in variants
+        ), chunk_size=args.chunk_size, store=args.store, run=args.run)
+        print('{jobs} configurations in {chunks} chunks'.format(**sweep.progress()))
+    elif args.command == 'run':
+        progress = Sweep(args.path).run(args.workers, args.interval)
+        return 1 if progress['results'] < progress['jobs'] else 0
+    elif args.command == 'status':
+        print('chunks {done}/{chunks}  claimed {claimed}  jobs {results}/{jobs}  unique {unique}  failed {failed}'.format(
+            **Sweep(args.path).progress()
+        ))
+    elif args.command == 'top':
+        with pd.option_context('display.max_colwidth', None, 'display.width', None):
+            print(Sweep(args.path).as_dataframe(args.n).to_string(index=False))
+    return 0
@@ -1,5 +1,8 @@
+import weakref
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-from . import helpers
+from . import helpers, profiling
 
 class Table(object):
     """
@@ -14,11 +17,25 @@ class Table(object):
 
     keys = {}
 
+    # The letters swapped for another when a character is mapped
+    REPLACE = {
+        'M': 'K', 'V': 'J', 'Z': 'V', 'K': 'V',
+    }
+
     _order = [14, 6, 6, 12,]
 
+    # ------------------------------------------------------------
+    # Every table still held by a square is shared, and the most
+    # recently used are held here as well, both polarities for as
+    # many texts as `helpers.cache_size`, so they outlive the
+    # squares plotted against them. Anything else is dropped.
+    # ------------------------------------------------------------
+    _shared = weakref.WeakValueDictionary()
+    _recent = OrderedDict()
+
     def __init__(self, ciphertext, polarity):
         self.ciphertext = ciphertext
-        self.lacuna = ''.join([helpers.distancefrom(c, 'Z') for c in ciphertext])
+        self.lacuna = helpers.lacuna(ciphertext)
         self.polarity = polarity
         self.table = []
 
@@ -27,6 +44,71 @@ class Table(object):
             False: 'M',
         }
 
+    @classmethod
+    def shared(cls, ciphertext, polarity):
+        """
+        Returns a created table for the ciphertext and polarity
+
+        Tables depend only on the ciphertext and polarity and are never altered once
+        created, so a single instance is built for each pair and shared between
+        every square plotted against it. If two threads create the same table at
+        once, the first to finish is kept.
+        """
+        table = cls._shared.get((ciphertext, polarity))
+        if table is None:
+            table = cls(ciphertext, polarity)
+            table.create()
+        return cls._keep(table)
+
+    @classmethod
+    def _keep(cls, table, replace=False):
+        """
+        Shares a table and marks it the most recently used
+
+        :param: Table table
+        :param: bool  replace Share this table even if another is already shared
+
+        :return: Table the shared table
+        """
+        key = (table.ciphertext, table.polarity)
+        with helpers.cache_lock:
+            if replace:
+                cls._shared[key] = table
+            table = cls._shared.setdefault(key, table)
+            cls._recent[key] = table
+            cls._recent.move_to_end(key)
+            while len(cls._recent) > 2 * helpers.cache_size:
+                cls._recent.popitem(last=False)
+        return table
+
+    @classmethod
+    def clear(cls):
+        """ Drops every shared table """
+        with helpers.cache_lock:
+            cls._recent.clear()
+            cls._shared.clear()
+
+    @classmethod
+    def restore(cls, ciphertext, polarity, values):
+        """
+        Restores a previously created table from its values and shares it
+
+        :param: str   ciphertext
+        :param: bool  polarity
+        :param: array values     The table values as a two dimensional array
+
+        :return: Table
+        """
+        table = cls(ciphertext, polarity)
+        table.table = pd.DataFrame(
+            [[int(value) for value in row] for row in values],
+            index=[i for i in range(1, len(values) + 1)],
+            columns=[i for i in range(1, len(values[0]) + 1)],
+        )
+        table.keys = table.create_keys()
+        return cls._keep(table, replace=True)
+
+    @profiling.stage('Table.create')
     def create(self):
         """
         Creates A pandas DataFrames from the current instance
@@ -34,34 +116,36 @@ class Table(object):
         This table will either be 13x13 in size if all rows are even, or
         13x26 in size if the rows are a mixture of odd and even characters.
         """
-        for distance, pole in helpers.distance_calculator(self.ciphertext, self.lacuna):
-            if pole == self.poles[self.polarity]:
-                self.table.append([helpers.a2i(c) for c in distance])
-
-        self.table = pd.DataFrame(self.table)
-        self.table.columns = [helpers.alphabet[(i-1)] for i in self.table.iloc[0]]
-        if self.table.shape[0] < 13:
-            self.table.loc[len(self.table)] = [
-                26 if i % 2 == 0 else 13 for i in self.table.iloc[0]
-            ]
-        self.table = self.table.loc[
-            :,~self.table.columns.duplicated()
-        ].sort_values(by=0, axis=1)
-        self.table.columns = [i for i in range(1, self.table.shape[1] + 1)]
-        self.table.index   = [i for i in range(1, self.table.shape[0] + 1)]
+        matrix = np.asarray(helpers.distance_matrix(self.ciphertext, self.lacuna))
+        rows = np.flatnonzero(np.array(helpers.distance_poles(matrix)) == self.poles[self.polarity])
+
+        # ------------------------------------------------------------
+        # Columns are labelled by the letter of their first row, only
+        # the first column of each letter is kept and they are sorted
+        # by it. There are at most 26 of them, so only those columns
+        # are taken from the matrix however long the ciphertext is.
+        # ------------------------------------------------------------
+        _, columns = np.unique(matrix[rows[0]], return_index=True)
+        table = matrix[np.ix_(rows, columns)].astype(np.int64)
+        if table.shape[0] < 13:
+            table = np.vstack([table, np.where(table[0] % 2 == 0, 26, 13)])
+
+        self.table = pd.DataFrame(
+            table,
+            index=[i for i in range(1, table.shape[0] + 1)],
+            columns=[i for i in range(1, table.shape[1] + 1)],
+        )
         self.keys = self.create_keys()
 
     def create_keys(self):
         """
         Creates a set of keys for the current table.
 
-        This method hard-wires a set of replacement characters which may well belong as a
-        definition in the helpers class.
+        The replacement characters are taken from `Table.REPLACE`. Squares may be
+        plotted with another set, see `Square.plot`.
         """
         keys = {
-            'replace': {
-                'M': 'K', 'V': 'J', 'Z': 'V', 'K': 'V',
-            }
+            'replace': dict(self.REPLACE)
         }
         pairings = [
             (helpers.i2a(x), helpers.i2a(x+13)) for x in range(1, 14)
@@ -87,13 +171,11 @@ class Table(object):
 
         :return: list
         """
+        pairs = {character: pair for pair in pairings for character in pair}
         keys = []
         increment = start
         for _ in range(self.table.shape[axis]):
-            for pair in pairings:
-                if helpers.i2a(start) in pair:
-                    keys.append(pair)
-                    break
+            keys.append(pairs[helpers.i2a(start)])
             start = (start + increment) % 26
         return keys
 
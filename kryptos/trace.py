@@ -0,0 +1,215 @@
+import os
+import numpy as np
+import pandas as pd
+
+class Trace(object):
+    """
+    The decipher trace of a cipher as columns, one row per character
+
+    Every column is a numpy array of the same length. Columns which follow from
+    the ciphertext alone are calculated over whole arrays, the rest are read from
+    the state of each character once.
+
+    Traces are written in bulk, one column at a time, as:
+
+    - `.arrow` / `.feather` Arrow IPC files (requires pyarrow)
+    - `.parquet`           Parquet files (requires pyarrow)
+    - `.npz`               Compressed NumPy archives
+    - `.csv`               CSV with flags written as 0 or 1
+    """
+    # Tables are named as they are in snapshots
+    TABLES = ((True, 'even'), (False, 'mixed'))
+
+    FORMATS = {
+        '.arrow':   'arrow',
+        '.feather': 'arrow',
+        '.parquet': 'parquet',
+        '.npz':     'npz',
+        '.csv':     'csv',
+    }
+
+    columns = None
+
+    def __init__(self, columns):
+        """
+        :param: dict columns Column name to numpy array, in order
+        """
+        self.columns = columns
+
+    @classmethod
+    def from_cipher(cls, cipher):
+        """
+        Trace every character of a cipher, deciphering any not yet deciphered
+
+        :param: Cipher cipher
+
+        :return: Trace
+        """
+        n = cipher.length
+        index = np.arange(1, n + 1, dtype=np.uint32)
+        cindex = np.frombuffer(cipher.ciphertext.encode('ascii'), dtype=np.uint8) - 64
+        lindex = np.frombuffer(cipher.lacunatext.encode('ascii'), dtype=np.uint8) - 64
+        states = [character.state for character in cipher]
+
+        def column(read):
+            return np.array([read(state) for state in states]).reshape(n)
+
+        def corner(value):
+            return value or ''
+
+        columns = {
+            'index':     index,
+            'character': np.array(list(cipher.ciphertext), dtype='<U1'),
+            'lacuna':    np.array(list(cipher.lacunatext), dtype='<U1'),
+            'cindex':    cindex,
+            'lindex':    lindex,
+            'polarity':  np.array(cipher.polarities, dtype=np.bool_),
+            'binary':    cindex % 2 == 0,
+            'mapped':    column(lambda s: all(s['squares'][key]['mapped'] for key, _ in cls.TABLES)),
+        }
+        for key, name in cls.TABLES:
+            columns['active_' + name] = column(lambda s: corner(s['squares'][key]['active']))
+        for key, name in cls.TABLES:
+            columns['cipher_active_' + name] = column(lambda s: corner(s['squares'][key]['cipher_active']))
+        for key, name in cls.TABLES:
+            columns['lacuna_active_' + name] = column(lambda s: corner(s['squares'][key]['lacuna_active']))
+
+        # ------------------------------------------------------------
+        # The feature flags the rules test, as shown in the properties
+        # and conditions tables of the notebook.
+        # ------------------------------------------------------------
+        columns['deciphered_lacuna'] = column(lambda s: bool(s['deciphered_lacuna']))
+        columns['alphabet_even'] = ((index // 26) + 1) % 2 == 0
+        columns['upper_alphabet'] = np.where(index % 26 != 0, index % 26, 26) > 13
+        for mod in (2, 5, 15):
+            for name, values in (('index', index), ('cipher', cindex), ('lacuna', lindex)):
+                columns['{}_mod{}'.format(name, mod)] = values % mod == 0
+
+        columns['table']        = column(lambda s: s['table'])
+        columns['position']     = column(lambda s: corner(s['position']))
+        columns['algorithm']    = column(lambda s: s['algorithm'])
+        columns['intermediate'] = column(lambda s: s['intermediate'] or '')
+        columns['plaintext']    = column(lambda s: s['plaintext'])
+        return cls({
+            name: columns[name].astype(dtype, copy=False) for name, dtype in cls.dtypes().items()
+        })
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    @property
+    def names(self):
+        return list(self.columns.keys())
+
+    def as_dataframe(self):
+        return pd.DataFrame(self.columns)
+
+    @classmethod
+    def format(cls, path, format=None):
+        """ The format to write path in, from its extension unless given """
+        format = format or cls.FORMATS.get(os.path.splitext(path)[1].lower())
+        if format not in cls.FORMATS.values():
+            raise ValueError('unknown trace format for {}, expected one of {}'.format(
+                path, ', '.join(sorted(cls.FORMATS.keys()))
+            ))
+        return format
+
+    @staticmethod
+    def pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.feather
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('writing Arrow or Parquet traces requires pyarrow, use .npz or .csv instead')
+        return pyarrow
+
+    def write(self, path, format=None):
+        """
+        Write the trace to path
+
+        :param: str path
+        :param: str format One of arrow, parquet, npz or csv. Taken from the
+                           extension of path when not given
+
+        :return: str path
+        """
+        format = self.format(path, format)
+        if format in ('arrow', 'parquet'):
+            pa = self.pyarrow()
+            table = pa.table({name: pa.array(values) for name, values in self.columns.items()})
+            if format == 'arrow':
+                pa.feather.write_feather(table, path, compression='zstd')
+            else:
+                pa.parquet.write_table(table, path)
+        elif format == 'npz':
+            np.savez_compressed(path, **self.columns)
+        else:
+            pd.DataFrame({
+                name: values.astype(np.uint8) if values.dtype == np.bool_ else values
+                for name, values in self.columns.items()
+            }).to_csv(path, index=False)
+        return path
+
+    @classmethod
+    def read(cls, path, format=None):
+        """
+        Read a trace written by `write`
+
+        :return: Trace
+        """
+        format = cls.format(path, format)
+        if format in ('arrow', 'parquet'):
+            pa = cls.pyarrow()
+            table = pa.feather.read_table(path) if format == 'arrow' else pa.parquet.read_table(path)
+            dtypes = cls.dtypes()
+            return cls({
+                name: table.column(name).to_numpy().astype(dtypes.get(name, object))
+                for name in table.column_names
+            })
+        if format == 'npz':
+            with np.load(path) as archive:
+                return cls({name: archive[name] for name in archive.files})
+
+        frame = pd.read_csv(path, keep_default_na=False, dtype=str)
+        dtypes = cls.dtypes()
+        return cls({
+            name: frame[name].to_numpy(dtype=str).astype(
+                np.uint8 if dtypes.get(name) == np.bool_ else dtypes.get(name, str)
+            ).astype(dtypes.get(name, str))
+            for name in frame.columns
+        })
+
+    @classmethod
+    def dtypes(cls):
+        """ The dtype of every column, in order """
+        dtypes = {
+            'index':     np.uint32,
+            'character': '<U1',
+            'lacuna':    '<U1',
+            'cindex':    np.uint8,
+            'lindex':    np.uint8,
+            'polarity':  np.bool_,
+            'binary':    np.bool_,
+            'mapped':    np.bool_,
+        }
+        for prefix in ('active_', 'cipher_active_', 'lacuna_active_'):
+            for _, name in cls.TABLES:
+                dtypes[prefix + name] = '<U2'
+
+        dtypes['deciphered_lacuna'] = np.bool_
+        dtypes['alphabet_even']     = np.bool_
+        dtypes['upper_alphabet']    = np.bool_
+        for mod in (2, 5, 15):
+            for name in ('index', 'cipher', 'lacuna'):
+                dtypes['{}_mod{}'.format(name, mod)] = np.bool_
+
+        dtypes['table']        = np.bool_
+        dtypes['position']     = '<U2'
+        dtypes['algorithm']    = np.uint8
+        dtypes['intermediate'] = '<U1'
+        dtypes['plaintext']    = '<U1'
+        return dtypes
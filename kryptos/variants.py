@@ -0,0 +1,162 @@
+from itertools import combinations, product
+import pandas as pd
+from . import fitness, helpers, Character, Table
+
+class ReplacementExplorer(object):
+    """
+    Explores alternatives to the replacement characters of `Table.REPLACE`
+
+    The replacement map is read in three places only:
+
+    - a square whose character is mapped plots the replacement instead
+    - `can_replace` tests the character itself
+    - `can_replace` tests the letter at the character's index
+
+    A character is only deciphered again for a variant when one of those changes.
+    Squares are only plotted again when the letter they plot changes. Results are
+    kept against what each character read, so characters reading the same values
+    under different variants are deciphered once.
+    """
+    cipher   = None
+    scorer   = None
+    _states  = None
+    _results = None
+    evaluated = 0
+
+    def __init__(self, cipher, scorer=None):
+        """
+        :param: Cipher  cipher The cipher built with the default replacements
+        :param: Fitness scorer Scores each variant. Defaults to `fitness.scorer`
+                               when one is configured, otherwise variants are
+                               not scored
+        """
+        self.cipher   = cipher
+        self.scorer   = scorer or fitness.scorer
+        self._states  = {}
+        self._results = {}
+
+    @staticmethod
+    def variants(sources=None, targets=None, fixed=None, size=None, identity=False, where=None):
+        """
+        Enumerate replacement maps
+
+        :param: str      sources  Letters which may be replaced. Defaults to those of `Table.REPLACE`
+        :param: str      targets  Letters they may be replaced with. Defaults to the alphabet
+        :param: dict     fixed    Replacements every map must hold
+        :param: int      size     Replacements in each map, counting the fixed ones.
+                                  Defaults to one for every source
+        :param: bool     identity Allow a letter to be replaced with itself
+        :param: callable where    Only yield maps for which this returns True
+
+        :return: generator of dict
+        """
+        fixed = {k.upper(): v.upper() for k, v in (fixed or {}).items()}
+        sources = [s for s in (sources or ''.join(Table.REPLACE.keys())).upper() if s not in fixed]
+        targets = (targets or ''.join(helpers.alphabet)).upper()
+        size = len(sources) + len(fixed) if size is None else size
+
+        for chosen in combinations(sources, max(0, size - len(fixed))):
+            for mapped in product(targets, repeat=len(chosen)):
+                if not identity and any(s == t for s, t in zip(chosen, mapped)):
+                    continue
+                replace = dict(fixed, **dict(zip(chosen, mapped)))
+                if where is None or where(replace):
+                    yield replace
+
+    def reads(self, character, replace):
+        """
+        What a character reads from a replacement map
+
+        :return: tuple of the letter each square plots, and whether the character
+                 and the letter at its index can be replaced
+        """
+        return (
+            tuple(
+                replace.get(character.character, character.character) if square.map else None
+                for square in character.cipher.values()
+            ),
+            character.character in replace,
+            helpers.i2a(character.index % 26) in replace,
+        )
+
+    def character(self, position, replace):
+        """
+        The (algorithm, plaintext) of a character under a replacement map
+
+        :param: int  position From 0
+        :param: dict replace
+        """
+        original = self.cipher[position]
+        default = original.cipher[True].replace
+        reads = self.reads(original, replace)
+        if reads == self.reads(original, default):
+            return original.final
+
+        key = (position, reads)
+        if key not in self._results:
+            if position not in self._states:
+                self._states[position] = original.state
+            character = Character.restore(self._states[position], self.cipher.ciphertext)
+            replot = reads[0] != self.reads(original, default)[0]
+            for square in character.cipher.values():
+                if replot:
+                    square.plot(replace)
+                else:
+                    square.replace = replace
+            character.invalidate()
+            self._results[key] = character.final
+            self.evaluated += 1
+        return self._results[key]
+
+    def evaluate(self, replace):
+        """
+        Decipher the cipher under a replacement map
+
+        :return: dict with the map, the plaintext and its score, the positions
+                 which changed and a list of (position, before, after) for each
+        """
+        replace = {k.upper(): v.upper() for k, v in replace.items()}
+        before = self.cipher.plaintext
+        after = ''.join([
+            self.character(position, replace)[1] for position in range(self.cipher.length)
+        ])
+        changed = [i for i, (a, b) in enumerate(zip(before, after)) if a != b]
+        return {
+            'replace':   replace,
+            'plaintext': after,
+            'score':     self.scorer.score(after) if self.scorer else None,
+            'changed':   changed,
+            'deltas':    [(i, before[i], after[i]) for i in changed],
+        }
+
+    def explore(self, variants, top=None):
+        """
+        Evaluate many replacement maps
+
+        :param: iterable variants Replacement maps, see `variants`
+        :param: int      top      Only return the best this many
+
+        :return: list of dict as returned by `evaluate`, best scoring first or,
+                 without a scorer, fewest changes first. Maps the rules cannot
+                 decipher are listed last with the error raised
+        """
+        results, failed = [], []
+        for replace in variants:
+            try:
+                results.append(self.evaluate(replace))
+            except Exception as e:
+                failed.append({
+                    'replace': replace, 'plaintext': None, 'score': None, 'changed': [], 'deltas': [],
+                    'error': '{}: {}'.format(type(e).__name__, e),
+                })
+        results.sort(key=lambda r: -r['score'] if r['score'] is not None else len(r['changed']))
+        results += failed
+        return results[:top] if top else results
+
+    def as_dataframe(self, results):
+        return pd.DataFrame([
+            [
+                ' '.join('{}{}'.format(k, v) for k, v in sorted(r['replace'].items())),
+                r['score'], len(r['changed']), r['plaintext'] or r.get('error')
+            ] for r in results
+        ], columns=['Replace', 'Score', 'Changes', 'Plaintext'])